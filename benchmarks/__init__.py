@@ -0,0 +1 @@
+"""Benchmarks for the bots and the Minecraft server; see benchmarks/loadtest.py and benchmarks/lifecycle.py."""
@@ -0,0 +1,173 @@
+"""Benchmark results as JSON baselines, and comparisons between them.
+
+A result records what was run (`config`: server.properties values, JVM
+command line, bot counts, fake delays), where (`host`) and what came out
+(`metrics`). Each metric says its unit, whether lower or higher is better,
+and how much it moves between identical runs (`noise`). A comparison
+flags a metric as a regression when it got worse by more than the
+tolerance (10% by default) and by more than its noise, and lists the
+config values that differ, so a slower run can be traced back to the
+server.properties or JVM change behind it.
+
+Both benchmarks take `--output`, `--save-baseline NAME` and
+`--baseline NAME`; names are stored as benchmarks/baselines/NAME.json.
+
+    python3 -m benchmarks.baseline compare baselines/vd10.json result.json
+    python3 -m benchmarks.baseline show result.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+def metric(value, unit, better='lower', noise=0.0):
+    return {'value': value, 'unit': unit, 'better': better, 'noise': noise}
+
+
+def make_result(benchmark, config, metrics, host=None):
+    return {
+        'benchmark': benchmark,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'host': host or {},
+        'config': config,
+        'metrics': metrics,
+    }
+
+
+def baseline_path(name):
+    """A path given as-is, otherwise benchmarks/baselines/<name>.json."""
+    if name.endswith('.json') or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save(result, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False, suffix='.tmp') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(f.name, path)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, result, tolerance=0.1):
+    """One row per metric in either result, worst relative change first."""
+    rows = []
+    old_metrics, new_metrics = baseline['metrics'], result['metrics']
+    for name in sorted(set(old_metrics) | set(new_metrics)):
+        old, new = old_metrics.get(name), new_metrics.get(name)
+        row = {'name': name, 'old': old and old['value'], 'new': new and new['value'],
+               'unit': (new or old)['unit'], 'change': None, 'regression': False}
+        if old and new and old['value'] is not None and new['value'] is not None:
+            worse = new['value'] - old['value'] if new['better'] == 'lower' else old['value'] - new['value']
+            if old['value']:
+                row['change'] = (new['value'] - old['value']) / abs(old['value'])
+            noise = max(old.get('noise', 0), new.get('noise', 0))
+            row['regression'] = worse > noise and worse > tolerance * abs(old['value'])
+        rows.append(row)
+    rows.sort(key=lambda row: (not row['regression'], -abs(row['change'] or 0)))
+    return rows
+
+
+def config_changes(baseline, result):
+    """{key: (old, new)} for config and host values that differ between two results."""
+    changes = {}
+    for section in ('config', 'host'):
+        old, new = baseline.get(section, {}), result.get(section, {})
+        for key in sorted(set(old) | set(new)):
+            if old.get(key) != new.get(key):
+                changes[f"{section}.{key}" if section == 'host' else key] = (old.get(key), new.get(key))
+    return changes
+
+
+def _value(value, unit):
+    if value is None:
+        return '–'
+    text = f"{value:.3g}" if isinstance(value, float) else str(value)
+    return f"{text} {unit}" if unit else text
+
+
+def format_comparison(baseline, result, rows):
+    lines = [f"{result['benchmark']}: {baseline.get('created', '?')} → {result.get('created', '?')}"]
+    changes = config_changes(baseline, result)
+    if changes:
+        lines.append('Changed settings:')
+        lines += [f"  {key}: {old!r} → {new!r}" for key, (old, new) in changes.items()]
+    width = max((len(row['name']) for row in rows), default=0)
+    for row in rows:
+        change = '' if row['change'] is None else f" ({row['change']:+.1%})"
+        flag = '  REGRESSION' if row['regression'] else ''
+        lines.append(f"  {row['name']:<{width}}  {_value(row['old'], row['unit'])} → "
+                     f"{_value(row['new'], row['unit'])}{change}{flag}")
+    return '\n'.join(lines)
+
+
+def format_result(result):
+    lines = [f"{result['benchmark']} ({result.get('created', '?')})"]
+    lines += [f"  {key}: {value!r}" for key, value in result.get('config', {}).items()]
+    for name, entry in sorted(result['metrics'].items()):
+        lines.append(f"  {name}: {_value(entry['value'], entry['unit'])}")
+    return '\n'.join(lines)
+
+
+def add_arguments(parser):
+    """The output and baseline options both benchmarks share."""
+    parser.add_argument('--output', help='write the result as JSON to this path')
+    parser.add_argument('--save-baseline', metavar='NAME', help='store the result as a baseline')
+    parser.add_argument('--baseline', metavar='NAME', help='compare against a stored baseline; exit 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=10, help='percent a metric may get worse (default 10)')
+
+
+def finish(result, args):
+    """Print, store and compare a result as the shared options ask; returns the exit status."""
+    print(format_result(result))
+    if args.output:
+        save(result, args.output)
+    if args.save_baseline:
+        save(result, baseline_path(args.save_baseline))
+    if args.baseline:
+        baseline = load(baseline_path(args.baseline))
+        rows = compare(baseline, result, args.tolerance / 100)
+        print(format_comparison(baseline, result, rows))
+        return 1 if any(row['regression'] for row in rows) else 0
+    return 0
+
+
+def main(args):
+    if args.command == 'show':
+        print(format_result(load(args.result)))
+        return 0
+    baseline, result = load(baseline_path(args.baseline)), load(args.result)
+    if baseline['benchmark'] != result['benchmark']:
+        print(f"cannot compare a {baseline['benchmark']} baseline with a {result['benchmark']} result", file=sys.stderr)
+        return 2
+    rows = compare(baseline, result, args.tolerance / 100)
+    print(format_comparison(baseline, result, rows))
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Show and compare benchmark results.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    compare_parser = commands.add_parser('compare', help='compare a result with a baseline')
+    compare_parser.add_argument('baseline', help='baseline name or path')
+    compare_parser.add_argument('result', help='result path')
+    compare_parser.add_argument('--tolerance', type=float, default=10, help='percent a metric may get worse (default 10)')
+    show_parser = commands.add_parser('show', help='print a result')
+    show_parser.add_argument('result', help='result path')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -0,0 +1,333 @@
+"""Replay the bot's `!startmc` / `!stopmc` lifecycle against fake backends.
+
+Each server gets a mctools.compute FakeBackend for its VM and a fake
+Minecraft server: a Server List Ping listener and an RCON listener that
+come up a fixed boot time after the VM reaches 'running', and go down on
+`stop` or when the VM powers off. The servers are real
+discord_bots.server.ManagedServer objects in a Fleet with its power
+tracker running, so the replay goes through the same coordinator,
+readiness polling, status cache and RCON client as the bot. Discord
+itself is left out.
+
+A cycle, on every server at once:
+1. `--requesters` concurrent `!startmc`: a status check, then the start
+   through the power coordinator (the first one runs it, the rest join)
+2. a burst of `!status` lookups against a cold and then a warm cache
+3. `!stopmc`: `stop` (or `save-all flush` to hibernate) over RCON, then the power-off
+
+Meanwhile a presence loop reads the fleet's status every second, as the
+bot's status loop does, and a probe measures how late the event loop
+wakes a 5 ms sleep. Start and stop latency are reported both end to end
+and as overhead over the simulated cloud and boot time. The overhead is
+what the bot adds: readiness polling granularity, RCON round trips, and
+power-state calls. The cloud calls per cycle show how hard the tracker polls.
+
+Run with `python3 -m benchmarks.lifecycle [--cycles 5] [--servers 3]`.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from mctools.compute import FakeBackend
+from mctools.power import PowerStateTracker
+from mctools.rcon import (SERVERDATA_AUTH, SERVERDATA_AUTH_RESPONSE, SERVERDATA_EXECCOMMAND,
+                          SERVERDATA_RESPONSE_VALUE, encode_packet, read_packet)
+from mctools.telemetry import percentile
+from discord_bots.fleet import Fleet
+from discord_bots.server import ManagedServer
+from benchmarks import protocol
+from benchmarks.baseline import add_arguments, finish, make_result, metric
+
+RCON_PASSWORD = 'benchmark'
+
+
+class FakeMinecraft:
+    """Status ping and RCON listeners that follow a FakeBackend's power state like a server started by systemd."""
+
+    def __init__(self, backend, boot_delay=1.0, rcon_delay=0.005, version='1.21.1', protocol_version=767):
+        self.backend = backend
+        self.boot_delay = boot_delay
+        self.rcon_delay = rcon_delay
+        self.status = {'version': {'name': version, 'protocol': protocol_version},
+                       'players': {'max': 20, 'online': 0, 'sample': []},
+                       'description': {'text': 'Benchmark server'}}
+        self.slp_port = None
+        self.rcon_port = None
+        self._listeners = []
+        self._connections = set()
+        self._boot = None
+        # The JVM survives a hibernation, so a resume from it skips the boot
+        self._process_alive = False
+
+    async def _listen(self, handler, port):
+        server = await asyncio.start_server(handler, '127.0.0.1', port or 0)
+        return server, server.sockets[0].getsockname()[1]
+
+    async def reserve_ports(self):
+        """Bind once to pick free ports, then release them until the server boots."""
+        slp, self.slp_port = await self._listen(self._serve_status, None)
+        rcon, self.rcon_port = await self._listen(self._serve_rcon, None)
+        for server in (slp, rcon):
+            server.close()
+            await server.wait_closed()
+
+    @property
+    def up(self):
+        return bool(self._listeners)
+
+    def power_changed(self, state):
+        if state == 'running' and not self.up and self._boot is None:
+            self._boot = asyncio.ensure_future(self._start(0 if self._process_alive else self.boot_delay))
+        elif state != 'running':
+            if state != 'hibernated':
+                self._process_alive = False
+            if self._boot is not None:
+                self._boot.cancel()
+                self._boot = None
+            self.shut_down()
+
+    async def _start(self, delay):
+        await asyncio.sleep(delay)
+        self._listeners = [(await self._listen(self._serve_status, self.slp_port))[0],
+                           (await self._listen(self._serve_rcon, self.rcon_port))[0]]
+        self._process_alive = True
+        self._boot = None
+
+    def shut_down(self):
+        for server in self._listeners:
+            server.close()
+        self._listeners = []
+        for writer in list(self._connections):
+            writer.close()
+
+    async def _serve_status(self, reader, writer):
+        connection = protocol.Connection(reader, writer)
+        self._connections.add(writer)
+        try:
+            _, handshake = await connection.read()
+            _, pos = protocol.read_varint(handshake)
+            _, pos = protocol.read_string(handshake, pos)
+            if protocol.read_varint(handshake, pos + 2)[0] != 1:
+                return
+            while True:
+                packet_id, payload = await connection.read()
+                if packet_id == 0x00:
+                    connection.send(0x00, protocol.string(json.dumps(self.status)))
+                elif packet_id == 0x01:
+                    connection.send(0x01, payload)
+                await connection.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _serve_rcon(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_id, packet_type, body = await read_packet(reader)
+                if packet_type == SERVERDATA_AUTH:
+                    ok = body == RCON_PASSWORD
+                    writer.write(encode_packet(request_id if ok else -1, SERVERDATA_AUTH_RESPONSE, ''))
+                elif packet_type == SERVERDATA_EXECCOMMAND:
+                    await asyncio.sleep(self.rcon_delay)
+                    if body == 'stop':
+                        writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, 'Stopping the server'))
+                        await writer.drain()
+                        self._process_alive = False
+                        self.shut_down()
+                        return
+                    response = 'Saved the game' if body.startswith('save-all') else f"Unknown command: {body}"
+                    writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, response))
+                else:
+                    # What the server answers to the client's end-of-response sentinel
+                    writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, f"Unknown request {packet_type:x}"))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+
+class ReplayBackend(FakeBackend):
+    """A FakeBackend that tells its fake server about every power transition."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.minecraft = None
+
+    async def _transition(self, operation, via, target, delay):
+        try:
+            await super()._transition(operation, via, target, delay)
+        finally:
+            self.minecraft.power_changed(self.state)
+
+
+class LoopLagProbe:
+    """Samples how late the event loop wakes a short sleep."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+
+async def timed(coroutine):
+    started = time.monotonic()
+    result = await coroutine
+    return time.monotonic() - started, result
+
+
+async def start_command(server):
+    """What `!startmc` does, without the Discord messages."""
+    if not server.coordinator.busy:
+        snapshot = await server.status.get()
+        if snapshot.power_state == 'running':
+            return 'already running'
+
+    async def start_server():
+        report = await server.start()
+        return 'ready' if report.ready else f"not ready (stage {report.stage})"
+
+    result, _ = await server.coordinator.run('start', start_server)
+    server.status.invalidate()
+    return result
+
+
+async def stop_command(server):
+    """What `!stopmc` does, without the Discord messages."""
+
+    async def stop_server():
+        await server.stop_minecraft()
+        await server.power_off()
+        return 'stopped'
+
+    result, _ = await server.coordinator.run('stop', stop_server)
+    server.status.invalidate()
+    return result
+
+
+async def replay_cycle(server, args, results):
+    starts = await asyncio.gather(*(timed(start_command(server)) for _ in range(args.requesters)))
+    (seconds, outcome), joined = starts[0], starts[1:]
+    if outcome != 'ready':
+        raise RuntimeError(f"{server.name}: start ended {outcome}")
+    results['start'].append(seconds)
+    results['join_extra'] += [max(0.0, other - seconds) for other, _ in joined]
+
+    server.status.invalidate()
+    cold = await asyncio.gather(*(timed(server.status.get()) for _ in range(args.status_requests)))
+    warm = await asyncio.gather(*(timed(server.status.get()) for _ in range(args.status_requests)))
+    results['status_cold'] += [seconds for seconds, _ in cold]
+    results['status_warm'] += [seconds for seconds, _ in warm]
+
+    seconds, outcome = await timed(stop_command(server))
+    results['stop'].append(seconds)
+
+
+async def presence_loop(fleet, interval):
+    while True:
+        await fleet.gather(lambda server: server.status.get())
+        await asyncio.sleep(interval)
+
+
+async def run(args):
+    tracker = PowerStateTracker(args.power_poll_interval, args.fast_poll_interval)
+    fleet = Fleet(tracker=tracker)
+    history_dir = tempfile.TemporaryDirectory()
+    fakes = []
+    for i in range(args.servers):
+        backend = ReplayBackend('deallocated', start_delay=args.cloud_start, stop_delay=args.cloud_stop)
+        backend.minecraft = FakeMinecraft(backend, args.boot, args.rcon_delay)
+        await backend.minecraft.reserve_ports()
+        fakes.append(backend.minecraft)
+        fleet.add(ManagedServer(f"bench{i}", backend, '127.0.0.1', port=backend.minecraft.slp_port,
+                                rcon_port=backend.minecraft.rcon_port, rcon_password=RCON_PASSWORD,
+                                readiness_deadline=args.cloud_start + args.boot + 60, telemetry_port=None,
+                                stop_mode=args.stop_mode, resume_history_path=f"{history_dir.name}/bench{i}.json",
+                                tracker=tracker))
+
+    results = {'start': [], 'join_extra': [], 'status_cold': [], 'status_warm': [], 'stop': []}
+    probe = LoopLagProbe()
+    background = [asyncio.ensure_future(task) for task in (probe.run(), tracker.run(), presence_loop(fleet, 1))]
+    started = time.monotonic()
+    try:
+        for cycle in range(args.cycles):
+            failures = [e for e in (await fleet.gather(lambda server: replay_cycle(server, args, results))).values()
+                        if isinstance(e, Exception)]
+            if failures:
+                raise failures[0]
+            logging.info(f"cycle {cycle + 1}/{args.cycles} done")
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        for fake in fakes:
+            fake.shut_down()
+        cloud_calls = sum(len(server.backend.calls) for server in fleet)
+        await fleet.close()
+        history_dir.cleanup()
+    elapsed = time.monotonic() - started
+
+    # The simulated part of a start and a stop; the rest is the bot's own overhead
+    resume = args.cloud_start if args.stop_mode == 'hibernate' else args.cloud_start + args.boot
+    ms = [lag * 1000 for lag in probe.samples]
+    metrics = {
+        'startmc_p50': metric(percentile(results['start'], 50), 's', noise=0.05),
+        'startmc_max': metric(percentile(results['start'], 100), 's', noise=0.1),
+        'startmc_overhead_p50': metric(percentile(results['start'], 50) - resume, 's', noise=0.05),
+        'startmc_joined_extra_max': metric(percentile(results['join_extra'], 100), 's', noise=0.01),
+        'stopmc_p50': metric(percentile(results['stop'], 50), 's', noise=0.05),
+        'stopmc_overhead_p50': metric(percentile(results['stop'], 50) - args.cloud_stop, 's', noise=0.05),
+        'status_cold_p95': metric(percentile(results['status_cold'], 95) * 1000, 'ms', noise=5),
+        'status_warm_p95': metric(percentile(results['status_warm'], 95) * 1000, 'ms', noise=0.5),
+        'loop_lag_p50': metric(percentile(ms, 50), 'ms', noise=0.5),
+        'loop_lag_p99': metric(percentile(ms, 99), 'ms', noise=2),
+        'loop_lag_max': metric(percentile(ms, 100), 'ms', noise=10),
+        'cloud_calls_per_cycle': metric(cloud_calls / args.cycles / args.servers, 'calls', noise=1),
+        'elapsed': metric(elapsed, 's', noise=0.5),
+    }
+    config = {key: getattr(args, key) for key in ('cycles', 'servers', 'requesters', 'status_requests', 'stop_mode',
+                                                   'cloud_start', 'cloud_stop', 'boot', 'rcon_delay',
+                                                   'power_poll_interval', 'fast_poll_interval')}
+    return make_result('lifecycle', config, metrics, host={'python': sys.version.split()[0]})
+
+
+def main(args):
+    result = asyncio.run(run(args))
+    return finish(result, args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Replay !startmc/!stopmc against fake cloud and RCON backends.')
+    parser.add_argument('--cycles', type=int, default=5, help='start/stop cycles per server')
+    parser.add_argument('--servers', type=int, default=1, help='servers in the fleet, cycled concurrently')
+    parser.add_argument('--requesters', type=int, default=3, help='concurrent !startmc per start')
+    parser.add_argument('--status-requests', type=int, default=10, help='concurrent !status per burst')
+    parser.add_argument('--stop-mode', choices=('deallocate', 'stop', 'hibernate'), default='deallocate')
+    parser.add_argument('--cloud-start', type=float, default=2.0, help='seconds the fake VM takes to start')
+    parser.add_argument('--cloud-stop', type=float, default=1.0, help='seconds the fake VM takes to stop')
+    parser.add_argument('--boot', type=float, default=2.0, help='seconds from VM running to the server answering')
+    parser.add_argument('--rcon-delay', type=float, default=0.005, help='seconds the fake server takes per RCON command')
+    parser.add_argument('--power-poll-interval', type=float, default=60)
+    parser.add_argument('--fast-poll-interval', type=float, default=5)
+    add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(message)s')
+    sys.exit(main(parse_args()))
@@ -0,0 +1,570 @@
+"""Load test a Minecraft server with headless protocol bots.
+
+`view-distance`, `simulation-distance`, `network-compression-threshold`
+and the JVM flags all trade tick time against memory or bandwidth. This
+puts numbers on them. It starts the server in `--server-dir` with the
+same JVM command line mctools.jvm_launcher would build, and with the
+`--set` overrides written to server.properties (restored afterwards). It
+then joins `--bots` offline-mode bots one by one and flies them outward
+from spawn in spectator mode, so they pull in and generate fresh chunks
+the way exploring players do. Meanwhile it samples, over RCON and /proc:
+- MSPT percentiles (Paper's `mspt`, or vanilla's `tick query`) and TPS
+- join time and time to the first chunk
+- chunks sent to the bots, and chunks generated and saved per second
+- heap, GC time, RSS and CPU, via mctools.telemetry's collector
+
+By default the server runs on a scratch world (`--world`, from a fixed
+`--seed`) that is deleted before and after the run, so runs stay
+comparable. `--attach` load tests a server that is already running
+instead, e.g. the one on the VM, and changes nothing.
+
+The bots speak protocols 766 and 767 (Minecraft 1.20.5 to 1.21.1), whose
+packet IDs match for everything they send and handle. The server must
+run in offline mode, which is forced for launched servers.
+
+Run with `python3 -m benchmarks.loadtest --server-dir ~/bench --bots 8 --duration 300 --set view-distance=8`.
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import uuid
+import shlex
+import shutil
+import asyncio
+import hashlib
+import logging
+import argparse
+import secrets
+
+from mcstatus import JavaServer
+
+from mctools.jvm_launcher import build_command, detect_flavour, host_profile
+from mctools.properties import read_properties, write_properties
+from mctools.rcon import RconClient
+from mctools.readiness import wait_until_ready
+from mctools.regions import region_files, server_running, Region
+from mctools.telemetry import TelemetryCollector, percentile
+from benchmarks import protocol
+from benchmarks.baseline import add_arguments, finish, make_result, metric
+
+# Protocol versions the bots speak; the packet IDs below are the same in both
+PROTOCOLS = {766: '1.20.5-1.20.6', 767: '1.21-1.21.1'}
+
+LOGIN_DISCONNECT = 0x00
+LOGIN_ENCRYPTION_REQUEST = 0x01
+LOGIN_SUCCESS = 0x02
+LOGIN_SET_COMPRESSION = 0x03
+LOGIN_PLUGIN_REQUEST = 0x04
+LOGIN_COOKIE_REQUEST = 0x05
+LOGIN_START = 0x00
+LOGIN_PLUGIN_RESPONSE = 0x02
+LOGIN_ACKNOWLEDGED = 0x03
+LOGIN_COOKIE_RESPONSE = 0x04
+
+CONFIG_COOKIE_REQUEST = 0x00
+CONFIG_DISCONNECT = 0x02
+CONFIG_FINISH = 0x03
+CONFIG_KEEP_ALIVE = 0x04
+CONFIG_PING = 0x05
+CONFIG_ADD_RESOURCE_PACK = 0x09
+CONFIG_KNOWN_PACKS = 0x0E
+CONFIG_CLIENT_INFORMATION = 0x00
+CONFIG_COOKIE_RESPONSE = 0x01
+CONFIG_FINISH_ACKNOWLEDGED = 0x03
+CONFIG_KEEP_ALIVE_RESPONSE = 0x04
+CONFIG_PONG = 0x05
+CONFIG_RESOURCE_PACK_RESPONSE = 0x06
+CONFIG_KNOWN_PACKS_RESPONSE = 0x07
+
+PLAY_CHUNK_BATCH_FINISHED = 0x0C
+PLAY_DISCONNECT = 0x1D
+PLAY_KEEP_ALIVE = 0x26
+PLAY_CHUNK_DATA = 0x27
+PLAY_LOGIN = 0x2B
+PLAY_ABILITIES = 0x38
+PLAY_SYNC_POSITION = 0x40
+PLAY_CONFIRM_TELEPORT = 0x00
+PLAY_CHUNK_BATCH_RECEIVED = 0x08
+PLAY_KEEP_ALIVE_RESPONSE = 0x18
+PLAY_SET_POSITION = 0x1A
+PLAY_SET_POSITION_ROTATION = 0x1B
+
+# Packets whose content the bots read; others are only counted
+PLAY_HANDLED = {PLAY_CHUNK_BATCH_FINISHED, PLAY_DISCONNECT, PLAY_KEEP_ALIVE, PLAY_LOGIN, PLAY_ABILITIES, PLAY_SYNC_POSITION}
+
+# Abilities flag set for players allowed to fly (creative and spectator)
+ALLOW_FLYING = 0x04
+
+TICK_QUERY_RE = re.compile(r'Average time per tick: ([\d.]+) ?ms')
+
+# server.properties keys recorded with every result
+RECORDED_PROPERTIES = ('view-distance', 'simulation-distance', 'network-compression-threshold', 'max-tick-time',
+                       'entity-broadcast-range-percentage', 'sync-chunk-writes', 'region-file-compression',
+                       'level-seed', 'level-type')
+
+
+class BotError(Exception):
+    pass
+
+
+def offline_uuid(name):
+    """The UUID an offline-mode server gives `name`, as Java's UUID.nameUUIDFromBytes does."""
+    return uuid.UUID(bytes=hashlib.md5(f"OfflinePlayer:{name}".encode()).digest(), version=3)
+
+
+def disconnect_text(payload):
+    """Readable text of a kick reason, which is JSON during login and NBT afterwards."""
+    words = re.findall(r"[\w .,:;!?'()/-]{3,}", payload.decode('utf-8', errors='ignore'))
+    return ' '.join(word.strip() for word in words if word.strip() not in ('text', 'translate')) or repr(payload[:64])
+
+
+def parse_tick_query(response):
+    """Average MSPT from vanilla's `tick query` (1.20.3+)."""
+    match = TICK_QUERY_RE.search(response)
+    return float(match.group(1)) if match else None
+
+
+class Bot:
+    """An offline-mode client that joins, keeps its connection alive and flies in a straight line."""
+
+    def __init__(self, name, host, port, protocol_version, heading, speed=10.0, altitude=160,
+                 view_distance=32, chunks_per_tick=16.0):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.protocol_version = protocol_version
+        self.heading = heading
+        self.speed = speed
+        self.altitude = altitude
+        self.view_distance = view_distance
+        self.chunks_per_tick = chunks_per_tick
+        self.join_seconds = None
+        self.first_chunk_seconds = None
+        self.chunks = 0
+        self.distance = 0.0
+        self.disconnect_reason = None
+        self.joined = asyncio.Event()
+        self.position = None
+        self.can_fly = False
+        self._connection = None
+
+    @property
+    def bytes_received(self):
+        return self._connection.bytes_received if self._connection is not None else 0
+
+    async def run(self):
+        """Play until cancelled; a kick or lost connection ends the run with `disconnect_reason` set."""
+        started = time.monotonic()
+        flying = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self._connection = connection = protocol.Connection(reader, writer)
+            await self._login(connection)
+            await self._configure(connection)
+            flying = asyncio.ensure_future(self._fly(connection))
+            await self._play(connection, started)
+        except BotError as e:
+            self.disconnect_reason = str(e)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self.disconnect_reason = f"connection lost: {e!r}"
+        finally:
+            if flying is not None:
+                flying.cancel()
+            if self._connection is not None:
+                self._connection.close()
+            if self.disconnect_reason:
+                logging.warning(f"{self.name} disconnected: {self.disconnect_reason}")
+
+    async def _login(self, connection):
+        connection.send(0x00, protocol.varint(self.protocol_version) + protocol.string(self.host)
+                        + protocol.ushort(self.port) + protocol.varint(2))
+        connection.send(LOGIN_START, protocol.string(self.name) + offline_uuid(self.name).bytes)
+        await connection.drain()
+        while True:
+            packet_id, payload = await connection.read()
+            if packet_id == LOGIN_SET_COMPRESSION:
+                threshold = protocol.read_varint(payload)[0]
+                connection.threshold = threshold if threshold >= 0 else None
+            elif packet_id == LOGIN_SUCCESS:
+                connection.send(LOGIN_ACKNOWLEDGED)
+                return
+            elif packet_id == LOGIN_PLUGIN_REQUEST:
+                message_id = protocol.read_varint(payload)[0]
+                connection.send(LOGIN_PLUGIN_RESPONSE, protocol.varint(message_id) + protocol.boolean(False))
+            elif packet_id == LOGIN_COOKIE_REQUEST:
+                key = protocol.read_string(payload)[0]
+                connection.send(LOGIN_COOKIE_RESPONSE, protocol.string(key) + protocol.boolean(False))
+            elif packet_id == LOGIN_ENCRYPTION_REQUEST:
+                raise BotError('the server is in online mode; the bots need online-mode=false')
+            elif packet_id == LOGIN_DISCONNECT:
+                raise BotError(disconnect_text(payload))
+            await connection.drain()
+
+    async def _configure(self, connection):
+        # Ask for more chunks than any server sends, so the server's view-distance is what counts
+        connection.send(CONFIG_CLIENT_INFORMATION, protocol.string('en_us') + bytes([self.view_distance])
+                        + protocol.varint(0) + protocol.boolean(True) + bytes([0x7F]) + protocol.varint(1)
+                        + protocol.boolean(False) + protocol.boolean(True))
+        await connection.drain()
+        while True:
+            packet_id, payload = await connection.read()
+            if packet_id == CONFIG_FINISH:
+                connection.send(CONFIG_FINISH_ACKNOWLEDGED)
+                await connection.drain()
+                return
+            if packet_id == CONFIG_KEEP_ALIVE:
+                connection.send(CONFIG_KEEP_ALIVE_RESPONSE, payload[:8])
+            elif packet_id == CONFIG_PING:
+                connection.send(CONFIG_PONG, payload[:4])
+            elif packet_id == CONFIG_KNOWN_PACKS:
+                # Claim every data pack the server offers, so it skips sending their registry contents
+                connection.send(CONFIG_KNOWN_PACKS_RESPONSE, payload)
+            elif packet_id == CONFIG_ADD_RESOURCE_PACK:
+                pack_id = payload[:16]
+                # Accepted, then loaded
+                connection.send(CONFIG_RESOURCE_PACK_RESPONSE, pack_id + protocol.varint(3))
+                connection.send(CONFIG_RESOURCE_PACK_RESPONSE, pack_id + protocol.varint(0))
+            elif packet_id == CONFIG_COOKIE_REQUEST:
+                key = protocol.read_string(payload)[0]
+                connection.send(CONFIG_COOKIE_RESPONSE, protocol.string(key) + protocol.boolean(False))
+            elif packet_id == CONFIG_DISCONNECT:
+                raise BotError(disconnect_text(payload))
+            await connection.drain()
+
+    async def _play(self, connection, started):
+        while True:
+            packet_id, payload = await connection.read(PLAY_HANDLED)
+            if packet_id == PLAY_CHUNK_DATA:
+                self.chunks += 1
+                if self.first_chunk_seconds is None:
+                    self.first_chunk_seconds = time.monotonic() - started
+                continue
+            if packet_id == PLAY_KEEP_ALIVE:
+                connection.send(PLAY_KEEP_ALIVE_RESPONSE, payload[:8])
+            elif packet_id == PLAY_CHUNK_BATCH_FINISHED:
+                connection.send(PLAY_CHUNK_BATCH_RECEIVED, protocol.float32(self.chunks_per_tick))
+            elif packet_id == PLAY_SYNC_POSITION:
+                self._teleported(connection, payload)
+            elif packet_id == PLAY_ABILITIES:
+                self.can_fly = bool(payload[0] & ALLOW_FLYING)
+            elif packet_id == PLAY_LOGIN:
+                self.join_seconds = time.monotonic() - started
+                self.joined.set()
+            elif packet_id == PLAY_DISCONNECT:
+                raise BotError(disconnect_text(payload))
+            else:
+                continue
+            await connection.drain()
+
+    def _teleported(self, connection, payload):
+        x, pos = protocol.read_double(payload)
+        y, pos = protocol.read_double(payload, pos)
+        z, pos = protocol.read_double(payload, pos)
+        yaw, pos = protocol.read_float(payload, pos)
+        pitch, pos = protocol.read_float(payload, pos)
+        flags = payload[pos]
+        teleport_id = protocol.read_varint(payload, pos + 1)[0]
+        # Bits 0-2 make x, y and z relative to the current position
+        if self.position is not None:
+            x, y, z = (value + current if flags & bit else value
+                       for value, current, bit in zip((x, y, z), self.position, (1, 2, 4)))
+        self.position = (x, y, z)
+        connection.send(PLAY_CONFIRM_TELEPORT, protocol.varint(teleport_id))
+        connection.send(PLAY_SET_POSITION_ROTATION, protocol.double(x) + protocol.double(y) + protocol.double(z)
+                        + protocol.float32(yaw) + protocol.float32(pitch) + protocol.boolean(False))
+
+    async def _fly(self, connection):
+        # One position update per tick, well under the server's "moved too quickly" limit of 10 blocks
+        step = min(self.speed / 20, 9.0)
+        while True:
+            await asyncio.sleep(0.05)
+            if self.position is None or not self.can_fly:
+                continue
+            x, y, z = self.position
+            climb = max(-step, min(step, self.altitude - y))
+            forward = math.sqrt(max(step * step - climb * climb, 0.0))
+            self.position = (x + self.heading[0] * forward, y + climb, z + self.heading[1] * forward)
+            self.distance += forward
+            connection.send(PLAY_SET_POSITION, protocol.double(self.position[0]) + protocol.double(self.position[1])
+                            + protocol.double(self.position[2]) + protocol.boolean(False))
+            await connection.drain()
+
+
+class ServerCollector(TelemetryCollector):
+    """The VM telemetry collector, pointed at one process and able to read vanilla's `tick query`."""
+
+    def __init__(self, rcon, pid=None, **kwargs):
+        super().__init__(rcon, **kwargs)
+        self.pid = pid
+
+    async def _server_pid(self):
+        return self.pid if self.pid is not None else await super()._server_pid()
+
+    async def sample(self):
+        sample = await super().sample()
+        if sample.mspt is None:
+            try:
+                sample.mspt = parse_tick_query(await self.rcon.run('tick query'))
+            except Exception as e:
+                logging.warning(f"tick query failed: {e}")
+        return sample
+
+
+class LocalServer:
+    """A server process started for the benchmark, with its server.properties restored afterwards."""
+
+    def __init__(self, server_dir, overrides, world, keep_world=False, java='java', gc='g1', heap_mb=None,
+                 extra='', fast_boot=False):
+        self.server_dir = server_dir
+        self.overrides = overrides
+        self.world = world
+        self.keep_world = keep_world
+        self.java = shutil.which(java) or java
+        self.gc = gc
+        self.heap_mb = heap_mb
+        self.extra = extra
+        self.fast_boot = fast_boot
+        self.properties_path = os.path.join(server_dir, 'server.properties')
+        self.original_properties = None
+        self.scratch_world = False
+        self.command = None
+        self.process = None
+        self._log = None
+
+    def _remove_world(self):
+        for suffix in ('', '_nether', '_the_end'):
+            shutil.rmtree(os.path.join(self.server_dir, self.world + suffix), ignore_errors=True)
+
+    async def start(self, profile):
+        if server_running(self.server_dir):
+            raise RuntimeError(f"a server is already running in {self.server_dir}; stop it or use --attach")
+        with open(self.properties_path, encoding='utf-8') as f:
+            self.original_properties = f.read()
+        # Only a world other than the server's own is treated as scratch and deleted
+        self.scratch_world = self.world != read_properties(self.properties_path).get('level-name', 'world')
+        if self.scratch_world:
+            self._remove_world()
+        write_properties(self.properties_path, {**self.overrides, 'level-name': self.world})
+
+        flavour = detect_flavour(self.server_dir)
+        self.command = build_command(self.server_dir, profile, flavour, gc=self.gc,
+                                     heap_mb=self.heap_mb,
+                                     java=self.java, extra=shlex.split(self.extra), fast_boot=self.fast_boot)
+        self._log = open(os.path.join(self.server_dir, 'benchmark-server.log'), 'ab')
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command, cwd=self.server_dir, stdin=asyncio.subprocess.DEVNULL, stdout=self._log,
+            stderr=asyncio.subprocess.STDOUT)
+        logging.info(f"Started the server (pid {self.process.pid}): {shlex.join(self.command)}")
+        return flavour
+
+    async def power_state(self):
+        # Lets mctools.readiness poll the process as if it were a VM
+        return 'running' if self.process.returncode is None else 'stopped'
+
+    async def wait_until_ready(self, port, deadline):
+        ready = asyncio.ensure_future(wait_until_ready(self, '127.0.0.1', port, deadline=deadline, initial_delay=0.5,
+                                                       max_delay=2))
+        exited = asyncio.ensure_future(self.process.wait())
+        await asyncio.wait({ready, exited}, return_when=asyncio.FIRST_COMPLETED)
+        if not ready.done():
+            ready.cancel()
+            raise RuntimeError(f"the server exited with status {self.process.returncode}; "
+                               f"see {self.server_dir}/benchmark-server.log")
+        exited.cancel()
+        report = ready.result()
+        if not report.ready:
+            raise RuntimeError(f"the server was not ready within {deadline}s")
+        return report
+
+    async def stop(self, rcon):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                await rcon.run('stop', timeout=10)
+            except Exception as e:
+                logging.info(f"RCON stop: {e}")
+            try:
+                await asyncio.wait_for(self.process.wait(), 120)
+            except asyncio.TimeoutError:
+                logging.warning('The server did not stop in time; terminating it')
+                self.process.terminate()
+                await self.process.wait()
+        self._log.close()
+
+    def restore(self):
+        if self.original_properties is not None:
+            with open(self.properties_path, 'w', encoding='utf-8') as f:
+                f.write(self.original_properties)
+        if self.scratch_world and not self.keep_world:
+            self._remove_world()
+
+
+def saved_chunks(server_dir):
+    """Chunks stored in the region files of the world server.properties names."""
+    regions = (Region(server_dir, path) for path in region_files(server_dir))
+    return sum(int(region.present.sum()) for region in regions if region.kind == 'region')
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f"--set expects key=value, got {pair!r}")
+        overrides[key.strip()] = value.strip()
+    return overrides
+
+
+async def launch_bots(bots, rcon, interval, timeout):
+    """Start the bots one at a time and put each in spectator mode once it is in the game."""
+    tasks = []
+    for bot in bots:
+        task = asyncio.ensure_future(bot.run())
+        tasks.append(task)
+        joined = asyncio.ensure_future(bot.joined.wait())
+        await asyncio.wait({task, joined}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        joined.cancel()
+        if bot.joined.is_set():
+            try:
+                await rcon.run(f"gamemode spectator {bot.name}")
+            except Exception as e:
+                logging.warning(f"Could not make {bot.name} a spectator: {e}")
+        else:
+            logging.warning(f"{bot.name} did not join within {timeout}s")
+        await asyncio.sleep(interval)
+    return tasks
+
+
+async def run(args):
+    overrides = {'online-mode': 'false', 'white-list': 'false', 'enable-rcon': 'true', 'rcon.port': args.rcon_port,
+                 'rcon.password': secrets.token_hex(12), 'server-port': args.port, 'level-seed': args.seed,
+                 'max-players': max(args.bots, 20), **parse_overrides(args.set)}
+    profile = host_profile(args.java)
+    server = None
+    boot_seconds = flavour = None
+    if args.attach:
+        properties = read_properties(os.path.join(args.server_dir, 'server.properties'))
+        port, rcon_port, password = int(properties.get('server-port', 25565)), int(properties.get('rcon.port', 25575)), properties.get('rcon.password', '')
+    else:
+        server = LocalServer(args.server_dir, overrides, args.world, args.keep_world, java=args.java, gc=args.gc,
+                             heap_mb=args.heap, extra=args.extra, fast_boot=args.fast_boot)
+        port, rcon_port, password = args.port, args.rcon_port, overrides['rcon.password']
+    rcon = RconClient(args.host, rcon_port, password, timeout=10)
+    try:
+        if server is not None:
+            flavour = await server.start(profile)
+            boot_seconds = (await server.wait_until_ready(port, args.boot_deadline)).total
+        properties = read_properties(os.path.join(args.server_dir, 'server.properties'))
+        status = await JavaServer(args.host, port, timeout=10).async_status()
+        if status.version.protocol not in PROTOCOLS:
+            raise RuntimeError(f"the server speaks protocol {status.version.protocol} ({status.version.name}); "
+                               f"the bots support {', '.join(f'{p} ({v})' for p, v in PROTOCOLS.items())}")
+        await rcon.connect(60)
+        await rcon.run('save-all flush', timeout=120)
+        chunks_before = saved_chunks(args.server_dir)
+
+        bots = [Bot(f"{args.name_prefix}{i}", args.host, port, status.version.protocol,
+                    (math.cos(2 * math.pi * i / args.bots), math.sin(2 * math.pi * i / args.bots)),
+                    speed=args.speed, altitude=args.altitude, chunks_per_tick=args.chunks_per_tick)
+                for i in range(args.bots)]
+        tasks = await launch_bots(bots, rcon, args.join_interval, args.join_timeout)
+
+        collector = ServerCollector(rcon, server.process.pid if server else None, interval=args.sample_interval,
+                                    jvm_interval=max(args.sample_interval, 5))
+        background = [asyncio.ensure_future(collector.run()),
+                      asyncio.ensure_future(collector.watch_log(os.path.join(args.server_dir, 'logs', 'latest.log')))]
+        chunks_sent = sum(bot.chunks for bot in bots)
+        bytes_received = sum(bot.bytes_received for bot in bots)
+        started = time.monotonic()
+        await asyncio.sleep(args.duration)
+        elapsed = time.monotonic() - started
+        chunks_sent = sum(bot.chunks for bot in bots) - chunks_sent
+        bytes_received = sum(bot.bytes_received for bot in bots) - bytes_received
+
+        for task in tasks + background:
+            task.cancel()
+        await asyncio.gather(*tasks, *background, return_exceptions=True)
+        await rcon.run('save-all flush', timeout=120)
+        chunks_generated = saved_chunks(args.server_dir) - chunks_before
+    finally:
+        if server is not None:
+            await server.stop(rcon)
+            server.restore()
+        await rcon.close()
+
+    summary = collector.summary(window=int(elapsed) + args.sample_interval)
+    gc = [sample.gc_seconds for sample in collector.samples if sample.gc_seconds is not None]
+    joins = [bot.join_seconds for bot in bots if bot.join_seconds is not None]
+    metrics = {
+        'mspt_p50': metric(summary['mspt']['p50'], 'ms', noise=1),
+        'mspt_p95': metric(summary['mspt']['p95'], 'ms', noise=2),
+        'mspt_p99': metric(summary['mspt']['p99'], 'ms', noise=5),
+        'tps_min': metric(summary['tps']['min'], 'tps', better='higher', noise=0.5),
+        'lag_warnings': metric(summary['lag_warnings'], 'warnings', noise=1),
+        'join_p50': metric(percentile(joins, 50), 's', noise=0.2),
+        'join_max': metric(percentile(joins, 100), 's', noise=0.5),
+        'first_chunk_p50': metric(percentile([bot.first_chunk_seconds for bot in bots], 50), 's', noise=0.2),
+        'chunks_sent_per_second': metric(chunks_sent / elapsed, 'chunks/s', better='higher', noise=5),
+        'chunks_generated_per_second': metric(chunks_generated / elapsed, 'chunks/s', better='higher', noise=2),
+        'network_per_second': metric(bytes_received / elapsed / 1024, 'KiB/s', noise=50),
+        'heap_used_max': metric(summary['heap_used_mb'], 'MB', noise=128),
+        'gc_seconds': metric(gc[-1] - gc[0] if len(gc) > 1 else None, 's', noise=0.5),
+        'rss_max': metric(summary['rss_mb'], 'MB', noise=128),
+        'cpu_p95': metric(summary['cpu_percent']['p95'], '%', noise=5),
+        'bots_disconnected': metric(sum(1 for bot in bots if bot.disconnect_reason), 'bots'),
+    }
+    if boot_seconds is not None:
+        metrics['boot'] = metric(boot_seconds, 's', noise=2)
+    config = {
+        'bots': args.bots, 'duration': args.duration, 'speed': args.speed, 'altitude': args.altitude,
+        'chunks_per_tick': args.chunks_per_tick, 'version': status.version.name, 'flavour': flavour,
+        'world': None if args.attach else args.world,
+        'jvm': shlex.join(server.command) if server else None,
+        **{key: properties.get(key) for key in RECORDED_PROPERTIES},
+    }
+    return make_result('load', config, metrics, host=profile)
+
+
+def main(args):
+    result = asyncio.run(run(args))
+    return finish(result, args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test a Minecraft server with headless bots.')
+    parser.add_argument('--server-dir', default='/home/minecraft/server')
+    parser.add_argument('--attach', action='store_true', help='use the server already running there; change nothing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25565, help='game port for a launched server')
+    parser.add_argument('--rcon-port', type=int, default=25575, help='RCON port for a launched server')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='server.properties override for the run, e.g. view-distance=8 (repeatable)')
+    parser.add_argument('--world', default='benchmark-world', help='level name; any name but the server\'s own is scratch')
+    parser.add_argument('--seed', default='mc-server-automation', help='level seed for a scratch world')
+    parser.add_argument('--keep-world', action='store_true', help='keep the scratch world after the run')
+    parser.add_argument('--java', default='java')
+    parser.add_argument('--gc', choices=('g1', 'zgc'), default='g1')
+    parser.add_argument('--heap', type=int, help='heap size in MB (default: sized from host RAM, as the launcher does)')
+    parser.add_argument('--extra', default='', help='additional JVM flags')
+    parser.add_argument('--fast-boot', action='store_true', help='start with the launcher\'s AppCDS fast boot')
+    parser.add_argument('--boot-deadline', type=float, default=600, help='seconds to wait for the server to start')
+    parser.add_argument('--bots', type=int, default=4)
+    parser.add_argument('--name-prefix', default='bench')
+    parser.add_argument('--join-interval', type=float, default=1, help='seconds between bot joins')
+    parser.add_argument('--join-timeout', type=float, default=30)
+    parser.add_argument('--duration', type=float, default=120, help='seconds of exploration after the last join')
+    parser.add_argument('--speed', type=float, default=10, help='blocks per second each bot flies (at most 180)')
+    parser.add_argument('--altitude', type=float, default=160, help='height the bots fly at')
+    parser.add_argument('--chunks-per-tick', type=float, default=16, help='chunk rate the bots ask the server for')
+    parser.add_argument('--sample-interval', type=float, default=2, help='seconds between MSPT/memory samples')
+    add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    sys.exit(main(parse_args()))
@@ -0,0 +1,155 @@
+"""Minecraft Java Edition wire format, as much as the benchmarks need.
+
+Packets are length-prefixed with VarInts. After the server sends Set
+Compression, every packet also carries its uncompressed length, and
+packets at or above the threshold are zlib-compressed. Readers that only
+need the ID of a large packet (chunk data, mostly) inflate just its first
+few bytes.
+"""
+
+import struct
+import zlib
+
+_DOUBLE = struct.Struct('>d')
+_FLOAT = struct.Struct('>f')
+_LONG = struct.Struct('>q')
+_INT = struct.Struct('>i')
+_USHORT = struct.Struct('>H')
+
+
+def varint(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def read_varint(data, pos=0):
+    """Decode a VarInt at `data[pos:]`; returns (value, position after it)."""
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError('truncated VarInt')
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+        if shift >= 35:
+            raise ValueError('VarInt too long')
+    return result - (1 << 32) if result & (1 << 31) else result, pos
+
+
+async def read_varint_stream(reader):
+    result = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result
+        shift += 7
+        if shift >= 35:
+            raise ValueError('VarInt too long')
+
+
+def string(value):
+    encoded = value.encode('utf-8')
+    return varint(len(encoded)) + encoded
+
+
+def read_string(data, pos=0):
+    length, pos = read_varint(data, pos)
+    return data[pos:pos + length].decode('utf-8', errors='replace'), pos + length
+
+
+def ushort(value):
+    return _USHORT.pack(value)
+
+
+def long(value):
+    return _LONG.pack(value)
+
+
+def read_long(data, pos=0):
+    return _LONG.unpack_from(data, pos)[0], pos + 8
+
+
+def read_int(data, pos=0):
+    return _INT.unpack_from(data, pos)[0], pos + 4
+
+
+def double(value):
+    return _DOUBLE.pack(value)
+
+
+def read_double(data, pos=0):
+    return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+
+
+def float32(value):
+    return _FLOAT.pack(value)
+
+
+def read_float(data, pos=0):
+    return _FLOAT.unpack_from(data, pos)[0], pos + 4
+
+
+def boolean(value):
+    return b'\x01' if value else b'\x00'
+
+
+class Connection:
+    """Packet framing over an asyncio stream pair, with optional compression."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        # Packets of this many bytes or more are compressed; None before Set Compression
+        self.threshold = None
+        self.bytes_received = 0
+
+    def send(self, packet_id, payload=b''):
+        data = varint(packet_id) + payload
+        if self.threshold is not None:
+            if len(data) >= self.threshold:
+                data = varint(len(data)) + zlib.compress(data)
+            else:
+                data = b'\x00' + data
+        self.writer.write(varint(len(data)) + data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def read(self, wanted=None):
+        """Return (packet_id, payload) for the next packet.
+
+        When `wanted` is a set of IDs, compressed packets with other IDs are
+        only inflated far enough to read the ID, and come back with a None payload.
+        """
+        length = await read_varint_stream(self.reader)
+        frame = await self.reader.readexactly(length)
+        self.bytes_received += length
+        if self.threshold is None:
+            packet_id, pos = read_varint(frame)
+            return packet_id, frame[pos:]
+        data_length, pos = read_varint(frame)
+        if data_length == 0:
+            packet_id, pos = read_varint(frame, pos)
+            return packet_id, frame[pos:]
+        inflater = zlib.decompressobj()
+        head = inflater.decompress(frame[pos:], 5)
+        packet_id, id_end = read_varint(head)
+        if wanted is not None and packet_id not in wanted:
+            return packet_id, None
+        data = head + inflater.decompress(inflater.unconsumed_tail) + inflater.flush()
+        return packet_id, data[id_end:]
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1 @@
+"""Discord bots that manage the Minecraft server VM."""
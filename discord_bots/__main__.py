@@ -0,0 +1,3 @@
+from discord_bots.bot import main
+
+main()
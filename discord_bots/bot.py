@@ -0,0 +1,541 @@
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+import discord
+from discord.ext import commands, tasks
+
+import config
+from mctools.coordinator import TransitionConflict
+from mctools.demand import DemandPredictor, format_summary
+from mctools.resume import format_summary as format_resume_summary
+from mctools.telemetry import fetch_perf, format_perf, perf_alerts
+from mctools.pregen import fetch_pregen, format_pregen
+from mctools.bootprof import fetch_boot, format_boot, format_regressions
+from discord_bots.monitoring import COMMAND_SECONDS, start_metrics_server
+from discord_bots.fleet import Fleet
+from discord_bots.wake_proxy import WakeProxy
+
+logging.basicConfig(level=logging.ERROR)
+
+# Discord bot token
+discord_token = config.discord_token
+
+approved_role = config.approved_role
+
+# TOML file describing several servers (see discord_bots/fleet.py); without it
+# the bot manages the single server described in config.py, in `channel_id`
+fleet_file = getattr(config, 'fleet_file', None)
+
+# Port for the bot's Prometheus /metrics endpoint (disabled when unset)
+metrics_port = getattr(config, 'metrics_port', None)
+
+# Performance alert thresholds for the VM's telemetry
+perf_min_tps = getattr(config, 'perf_min_tps', 18.0)
+perf_max_mspt = getattr(config, 'perf_max_mspt', 50.0)
+# Minimum seconds between repeats of the same performance alert
+perf_alert_cooldown = getattr(config, 'perf_alert_cooldown', 900)
+
+# Start the server ahead of predicted demand (off by default; warm minutes cost money)
+warmup_enabled = getattr(config, 'warmup_enabled', False)
+# Probability of demand in an hour of the week needed to warm up for it
+warmup_threshold = getattr(config, 'warmup_threshold', 0.5)
+# Seconds before a predicted hour to start the VM
+warmup_lead = getattr(config, 'warmup_lead', 300)
+demand_state_path = getattr(config, 'demand_state_path', 'demand.json')
+# IANA time zone the hour-of-week buckets use (default: the bot host's)
+demand_timezone = getattr(config, 'timezone', None)
+
+# Seconds a `!status` embed keeps being refreshed in place
+status_live_seconds = getattr(config, 'status_live_seconds', 600)
+
+# Address the wake-on-connect proxies listen on, for servers with `wake_proxy_port` set
+wake_proxy_host = getattr(config, 'wake_proxy_host', '0.0.0.0')
+
+# What each stop mode costs per hour while the server is down, e.g. {'stop': 0.096, 'deallocate': 0.003}
+stop_mode_costs = getattr(config, 'stop_mode_costs', {})
+
+STAGE_MESSAGES = {
+    'power': 'The VM is running. Waiting for the Minecraft port to open...',
+    'tcp': 'The Minecraft port is open. Waiting for the server to finish loading...',
+    'slp': 'The Minecraft server is answering status pings.',
+}
+
+# The servers this bot manages; `cloud_provider` picks azure, ec2 or fake for each
+if fleet_file:
+    fleet = Fleet.from_toml(fleet_file)
+else:
+    fleet = Fleet.from_config({k: v for k, v in vars(config).items() if not k.startswith('_')})
+
+# One demand history per server
+predictors = {
+    server.name: DemandPredictor(demand_state_path if server.name == 'default' else f"demand-{server.name}.json",
+                                 threshold=warmup_threshold, lead=warmup_lead,
+                                 tz=ZoneInfo(demand_timezone) if demand_timezone else None)
+    for server in fleet
+}
+
+intents = discord.Intents.default()
+intents.message_content = True
+
+bot = commands.Bot(command_prefix='!', intents=intents)
+
+def tag(server):
+    """Prefix for messages about `server` when the bot manages more than one."""
+    return f"[{server.name}] " if len(fleet) > 1 else ''
+
+def alert_channel(server):
+    return bot.get_channel(server.channels[0]) if server.channels else None
+
+def servers_here(ctx):
+    return fleet.for_channel(ctx.channel.id, ctx.guild.id if ctx.guild else None)
+
+async def resolve_server(ctx, name=None):
+    """The server a command refers to, or None (after telling the user why) if there is no single one."""
+    servers = servers_here(ctx)
+    if not servers:
+        return None
+    if name is not None:
+        server = fleet.servers.get(name)
+        if server not in servers:
+            await ctx.send(f"Unknown server '{name}'. Servers here: {', '.join(s.name for s in servers)}")
+            return None
+        return server
+    if len(servers) > 1:
+        await ctx.send(f"Which server? Use `!{ctx.command.name} <name>` with one of: {', '.join(s.name for s in servers)}")
+        return None
+    return servers[0]
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.command_started = time.monotonic()
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    if hasattr(ctx, 'command_started'):
+        COMMAND_SECONDS.observe(time.monotonic() - ctx.command_started, command=ctx.command.name, stage='total')
+
+async def on_power_change(backend, old, new):
+    server = fleet.server_for(backend)
+    server.status.invalidate()
+    # A VM that went down without the bot, e.g. through the idle daemon
+    if new in ('stopped', 'deallocated', 'hibernated') and not server.coordinator.busy and server.resume.last_stop is None:
+        channel = alert_channel(server)
+        if old is not None and channel is not None:
+            await channel.send(f"💤 {tag(server)}The {server.vm_label} was shut down ({new}).")
+        try:
+            await server.reconcile_stop(new)
+        except TransitionConflict:
+            # Someone started the server again in the meantime
+            pass
+        except Exception as e:
+            logging.error(f"{tag(server)}Error reconciling the stopped {server.vm_label}: {e}")
+
+fleet.tracker.on_change(on_power_change)
+# Polls the power state of every server in the fleet; started in on_ready
+tracker_task = None
+
+@tasks.loop(seconds=60)
+async def update_status():
+    snapshots = [s for s in (await fleet.gather(lambda server: server.status.get())).values() if not isinstance(s, Exception)]
+    online = [s for s in snapshots if s.online]
+    if len(fleet) > 1:
+        players = sum(s.players or 0 for s in online)
+        activity = discord.Game(f"📶 {len(online)}/{len(fleet)} online | 👥: {players}")
+    elif online:
+        activity = discord.Game(f"📶🟢 | 👥: {online[0].players} | v{online[0].version}")
+    else:
+        activity = discord.Game("📶🔴 | !startmc")
+
+    await bot.change_presence(status=discord.Status.online, activity=activity)
+    await refresh_status_messages()
+
+# Last time each (server, kind) of performance alert was posted
+last_perf_alert = {}
+
+async def check_server_perf(server):
+    snapshot = await server.status.get()
+    if not snapshot.online:
+        return
+    try:
+        summary = await fetch_perf(server.host, server.telemetry_port, window=300)
+    except Exception as e:
+        logging.info(f"{tag(server)}Telemetry unavailable: {e}")
+        return
+
+    now = time.monotonic()
+    channel = alert_channel(server)
+    for kind, alert in perf_alerts(summary, min_tps=perf_min_tps, max_mspt=perf_max_mspt).items():
+        key = (server.name, kind)
+        if channel is not None and now - last_perf_alert.get(key, -perf_alert_cooldown) >= perf_alert_cooldown:
+            last_perf_alert[key] = now
+            await channel.send(f"⚠️ {tag(server)}{alert}")
+
+# Launch time of the last boot checked for regressions, per server; boots from before the bot started are not reported
+last_boot_checked = {}
+bot_started_at = time.time()
+
+async def check_server_boot(server):
+    snapshot = await server.status.get()
+    if not snapshot.online:
+        return
+    try:
+        history = await fetch_boot(server.host, server.telemetry_port)
+    except Exception as e:
+        logging.info(f"{tag(server)}Boot history unavailable: {e}")
+        return
+    if not history['boots']:
+        return
+    boot = history['boots'][-1]
+    if boot['launched_at'] == last_boot_checked.get(server.name) or boot['launched_at'] < bot_started_at:
+        return
+    last_boot_checked[server.name] = boot['launched_at']
+    channel = alert_channel(server)
+    if boot['regressions'] and channel is not None:
+        await channel.send(f"🐢 {tag(server)}The last boot took {boot['total']:.0f}s, slower than usual: {format_regressions(boot)}")
+
+@tasks.loop(seconds=60)
+async def check_perf():
+    await fleet.gather(check_server_perf)
+    await fleet.gather(check_server_boot)
+
+async def warm_up_server(server):
+    predictor = predictors[server.name]
+    snapshot = await server.status.get()
+    predictor.observe(snapshot.players if snapshot.online else 0, snapshot.power_state)
+    if not warmup_enabled or not predictor.should_warm() or server.coordinator.busy:
+        return
+    if snapshot.power_state in ('running', 'starting'):
+        return
+
+    started = time.time()
+    try:
+        report, _ = await server.coordinator.run('start', server.start)
+    except Exception as e:
+        logging.error(f"{tag(server)}Warm-up start failed: {e}")
+        return
+    server.status.invalidate()
+    if report.ready:
+        predictor.warm_started(started, report.total)
+        channel = alert_channel(server)
+        if channel is not None:
+            await channel.send(f"🔥 {tag(server)}Warmed up the Minecraft server ({server.host}, {report.version}) ahead of the usual crowd.")
+
+@tasks.loop(seconds=60)
+async def warm_up():
+    await fleet.gather(warm_up_server)
+
+async def wake_on_connect(server, player):
+    """Start a server for a player who tried to join it through its wake proxy."""
+    predictors[server.name].on_start_request(False)
+    channel = alert_channel(server)
+    if channel is not None:
+        await channel.send(f"⏰ {tag(server)}{player or 'Someone'} tried to join, so the {server.vm_label} is starting...")
+    report, _ = await server.coordinator.run('start', server.start)
+    if channel is not None:
+        if report.ready:
+            await channel.send(f"{tag(server)}The Minecraft server ({server.host}, {report.version}) is now running! (ready in {report.total:.1f}s)")
+        else:
+            await channel.send(f"{tag(server)}The {server.vm_label} was started for {player or 'a player'}, but the Minecraft server is not active.")
+    return report
+
+wake_proxies = [WakeProxy(server, server.wake_proxy_port, wake_proxy_host, wake=wake_on_connect)
+                for server in fleet if server.wake_proxy_port]
+
+@bot.event
+async def on_ready():
+    # Set the bot's activity status
+    activity = discord.Game(name="!startmc")
+    await bot.change_presence(status=discord.Status.online, activity=activity)
+    print(f'Logged in as {bot.user}')
+    for guild in bot.guilds:
+        print(f'{bot.user} is connected to the following guild:\n'
+              f'{guild.name}(id: {guild.id})')
+    global tracker_task
+    if tracker_task is None:
+        tracker_task = asyncio.ensure_future(fleet.tracker.run())
+    for loop in (update_status, check_perf, warm_up):
+        if not loop.is_running():
+            loop.start()
+    for proxy in wake_proxies:
+        if not proxy.serving:
+            await proxy.start()
+    if metrics_port:
+        await start_metrics_server(metrics_port)
+
+# Command to power on the VM and check if Minecraft server has started
+@bot.command(name='startmc')
+async def start_mc(ctx, name=None):
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+
+    if not server.coordinator.busy:
+        await ctx.send(f'{tag(server)}Checking VM status...')
+
+        # Get VM and Minecraft server status
+        snapshot = await server.status.get()
+        predictors[server.name].on_start_request(snapshot.online)
+
+        if snapshot.power_state == 'running':
+            if snapshot.online:
+                await ctx.send(f"The Minecraft server ({server.host}, {snapshot.version}) is currently running.")
+            else:
+                await ctx.send(f'The {server.vm_label} is powered on, but the Minecraft server is not running. Please start the server manually.')
+            return
+
+    async def start_server():
+        await ctx.send(f'The {server.vm_label} is not running. Starting it...')
+
+        async def report_stage(stage, seconds):
+            await ctx.send(f"{tag(server)}{STAGE_MESSAGES[stage]} ({seconds:.1f}s)")
+
+        report = await server.start(on_stage=report_stage)
+        if report.ready:
+            return f"The Minecraft server ({server.host}, {report.version}) is now running! (ready in {report.total:.1f}s)"
+        elif report.stage is None:
+            return f'The {server.vm_label} could not be started. Please check the cloud console for more details.'
+        else:
+            return f'The {server.vm_label} is running, but the Minecraft server is not active. Please start the server manually.'
+
+    await run_power_operation(ctx, server, 'start', start_server)
+
+# Command to stop the Minecraft server and shut down the VM
+@bot.command(name='stopmc')
+@commands.has_role(approved_role)
+async def stop_mc(ctx, name=None):
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+
+    async def stop_server():
+        hibernate = server.stop_mode == 'hibernate'
+        await ctx.send(f"{tag(server)}{'Saving the world...' if hibernate else 'Stopping Minecraft server...'}")
+        # A hibernated server keeps running, so no stop-time backup is taken
+        before = None if hibernate else await server.backup_status()
+        try:
+            logging.info(await server.stop_minecraft())
+        except Exception as e:
+            logging.error(f"{tag(server)}Error stopping Minecraft server: {e}")
+            return "Failed to save the world." if hibernate else "Failed to stop Minecraft server."
+
+        warning = ''
+        if hibernate:
+            await ctx.send(f"World saved. Hibernating {server.vm_label}...")
+        else:
+            await ctx.send("Minecraft server stopped. Waiting for the world backup...")
+            backup = await server.wait_for_backup(before)
+            if backup['state'] == 'timeout':
+                # Powering off now would kill the backup
+                logging.error(f"{tag(server)}Backup still running after {server.backup_deadline}s")
+                return (f"The world backup is still running after {server.backup_deadline // 60} minutes, "
+                        f"so the {server.vm_label} was left on.")
+            if backup['state'] == 'failed':
+                logging.error(f"{tag(server)}World backup failed: {backup.get('error')}")
+                warning = f"\n⚠️ The world backup failed: {backup.get('error')}"
+            elif backup['state'] == 'unknown':
+                logging.warning(f"{tag(server)}Could not confirm the world backup: {backup['error']}")
+                warning = f"\n⚠️ Could not confirm the world backup ({backup['error']})."
+            await ctx.send(f"{'World backed up. ' if backup['state'] == 'done' else ''}"
+                           f"Shutting down {server.vm_label} ({server.stop_mode})...")
+        try:
+            await server.power_off()
+        except Exception as e:
+            logging.error(f"{tag(server)}Error shutting down {server.vm_label}: {e}")
+            return f"Failed to shut down {server.vm_label}.{warning}"
+        return f"{server.vm_label} has been {'hibernated' if hibernate else 'shut down'}.{warning}"
+
+    await run_power_operation(ctx, server, 'stop', stop_server)
+
+async def run_power_operation(ctx, server, operation, factory):
+    # Requesters who join an operation already in flight get the shared result as a reply
+    joining = server.coordinator.operation == operation
+    if joining:
+        await ctx.message.add_reaction('⏳')
+    try:
+        async with ctx.typing():
+            message, joined = await server.coordinator.run(operation, factory)
+    except TransitionConflict as e:
+        message, joined = f"Cannot {e.requested} the server while a {e.current} is in progress.", True
+    except Exception as e:
+        message, joined = f'An error occurred while trying to {operation} the {server.vm_label}: {str(e)}', joining
+    server.status.invalidate()
+    if joining:
+        await ctx.message.remove_reaction('⏳', bot.user)
+
+    if joined:
+        await ctx.reply(f"{tag(server)}{message}")
+    else:
+        await ctx.send(f"{tag(server)}{message}")
+
+def status_field(server, snapshot):
+    """Name and value of a server's field in the status embed."""
+    name = server.name if len(fleet) > 1 else server.host
+    if isinstance(snapshot, Exception):
+        return f"⚠️ {name}", f"Status unavailable ({snapshot})"
+    if not snapshot.online:
+        return f"🔴 {name}", f"{server.vm_label} {snapshot.power_state} | `!startmc`"
+    lines = []
+    if snapshot.motd:
+        lines.append(f"*{discord.utils.escape_markdown(snapshot.motd[:200])}*")
+    players = f"👥 {snapshot.players}/{snapshot.max_players}"
+    if snapshot.player_names:
+        shown = ', '.join(discord.utils.escape_markdown(player) for player in snapshot.player_names[:15])
+        more = len(snapshot.player_names) - 15
+        players += f": {shown}" + (f" and {more} more" if more > 0 else '')
+    lines.append(players)
+    details = [f"🏷️ {snapshot.version}"]
+    if snapshot.latency is not None:
+        details.append(f"📶 {snapshot.latency:.0f} ms")
+    if snapshot.tps is not None:
+        details.append(f"⏱️ {snapshot.tps:.1f} TPS")
+    lines.append(' · '.join(details))
+    return f"🟢 {name}", '\n'.join(lines)
+
+def status_embed(servers, snapshots):
+    online = [server for server in servers
+              if not isinstance(snapshots[server.name], Exception) and snapshots[server.name].online]
+    color = discord.Color.green() if len(online) == len(servers) else discord.Color.orange() if online else discord.Color.red()
+    embed = discord.Embed(title='Minecraft server status', color=color, timestamp=datetime.now(timezone.utc))
+    for server in servers:
+        name, value = status_field(server, snapshots[server.name])
+        embed.add_field(name=name, value=value, inline=False)
+    embed.set_footer(text='Updated')
+    return embed
+
+# The live `!status` embed of each channel: channel id -> (message, servers, refreshed until)
+status_messages = {}
+
+async def refresh_status_messages():
+    """Edit the live status embeds with the latest snapshots, which the presence loop has just refreshed."""
+    now = time.monotonic()
+    for channel_id, (message, servers, until) in list(status_messages.items()):
+        if now > until:
+            del status_messages[channel_id]
+            continue
+        snapshots = await fleet.gather(lambda server: server.status.get(), servers)
+        try:
+            await message.edit(embed=status_embed(servers, snapshots))
+        except discord.HTTPException as e:
+            logging.info(f"Could not refresh the status embed in {channel_id}: {e}")
+            del status_messages[channel_id]
+
+# Command to show one server's status, or every server's here with `!status all`
+@bot.command(name='status')
+async def status(ctx, name=None):
+    if name == 'all':
+        servers = servers_here(ctx)
+    else:
+        server = await resolve_server(ctx, name)
+        servers = [server] if server else []
+    if not servers:
+        return
+    # Probed concurrently and cached, so a burst of !status costs one probe per server
+    snapshots = await fleet.gather(lambda server: server.status.get(), servers)
+    embed = status_embed(servers, snapshots)
+
+    # Edit the channel's status embed while it is still near the bottom, instead of posting another
+    previous = status_messages.get(ctx.channel.id)
+    message = None
+    if previous is not None:
+        recent = [m.id async for m in ctx.channel.history(limit=5)]
+        if previous[0].id in recent:
+            try:
+                await previous[0].edit(embed=embed)
+                message = previous[0]
+            except discord.HTTPException:
+                pass
+    if message is None:
+        message = await ctx.send(embed=embed)
+        if previous is not None:
+            try:
+                await previous[0].delete()
+            except discord.HTTPException:
+                pass
+    status_messages[ctx.channel.id] = (message, servers, time.monotonic() + status_live_seconds)
+
+# Command to show recent server performance from the VM's telemetry collector
+@bot.command(name='perf')
+async def perf(ctx, name=None):
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+    try:
+        summary = await fetch_perf(server.host, server.telemetry_port)
+    except Exception as e:
+        logging.error(f"{tag(server)}Error fetching telemetry: {e}")
+        await ctx.send("Performance data is unavailable. Is the server running?")
+        return
+    await ctx.send(f"{tag(server)}{format_perf(summary)}")
+
+# Command to show the progress of chunk pre-generation on the VM
+@bot.command(name='pregen')
+async def pregen(ctx, action='status', name=None):
+    if action != 'status':
+        if servers_here(ctx):
+            await ctx.send('Usage: !pregen status [server]')
+        return
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+    try:
+        status = await fetch_pregen(server.host, server.telemetry_port)
+    except Exception as e:
+        logging.error(f"{tag(server)}Error fetching pre-generation status: {e}")
+        await ctx.send("Pre-generation status is unavailable. Is the server running?")
+        return
+    await ctx.send(f"{tag(server)}{format_pregen(status)}")
+
+# Command to show how the last boot of the server broke down, against the usual boot
+@bot.command(name='boot')
+async def boot(ctx, name=None):
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+    try:
+        history = await fetch_boot(server.host, server.telemetry_port)
+    except Exception as e:
+        logging.error(f"{tag(server)}Error fetching the boot history: {e}")
+        await ctx.send("The boot history is unavailable. Is the server running?")
+        return
+    await ctx.send(f"{tag(server)}{format_boot(history)}")
+
+# Command to show the demand prediction and how warm-ups have paid off
+@bot.command(name='warmup')
+async def warmup(ctx, name=None):
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+    await ctx.send(f"{tag(server)}{format_summary(predictors[server.name].summary())}")
+
+# Command to compare resume times and downtime cost between stop modes
+@bot.command(name='stopmodes')
+async def stop_modes(ctx, name=None):
+    server = await resolve_server(ctx, name)
+    if server is None:
+        return
+    await ctx.send(f"{tag(server)}{format_resume_summary(server.resume.summary(stop_mode_costs), server.stop_mode)}")
+
+# Error handler for missing role
+@stop_mc.error
+async def stop_mc_error(ctx, error):
+    if isinstance(error, commands.MissingRole):
+        await ctx.send("You do not have the required role to use this command.")
+
+@bot.command(name='cum', aliases=['freak', 'freaky', 'swallowmc', 'fuckshitup', 'startmcButMakeItGay'])
+async def respond(ctx):
+    responses=['cum', 'nasty ass', 'freaky ass', 'dont talk to me bro', 'ok', 'breed me',
+        'who gettin pegged tonite?', 'tag the best throat goat in this discord rn', 'leave me alone',
+        'what if instead of Minecraft, it was :tongue: FREAKcraft :tongue:', ':tongue: hey vro', 'pee pee poo poo']
+    typing_time=[1,1.5,2,2.5,3]
+
+    if not servers_here(ctx):
+        return
+    async with ctx.typing():
+        await asyncio.sleep(random.choice(typing_time))
+        await ctx.send(random.choice(responses))
+
+def main():
+    bot.run(discord_token)
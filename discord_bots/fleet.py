@@ -0,0 +1,96 @@
+"""The set of servers one bot process manages.
+
+A single-server bot builds its fleet straight from config.py. For more
+servers, point `fleet_file` in config.py at a TOML file:
+
+    [defaults]                  # merged into every server
+    cloud_provider = "azure"
+    client_id = "..."
+
+    [servers.survival]
+    vm_name = "mc-survival"
+    minecraft_server_host = "survival.example.com"
+    channels = [123456789012345678]
+
+    [servers.creative]
+    vm_name = "mc-creative"
+    minecraft_server_host = "creative.example.com"
+    guilds = [234567890123456789]
+
+Server tables take the same keys as config.py. `channels` and `guilds`
+say where a server's commands are accepted. The first channel is also
+where its alerts are posted. Servers on the same cloud account share
+one set of SDK clients, and each server only keeps a lazily connected
+RCON client and a status cache of its own. Power states of the whole
+fleet are polled by one mctools.power tracker, with one cloud call per
+account per poll (`power_poll_interval`, default 60 seconds).
+"""
+
+import asyncio
+import tomllib
+
+from mctools.compute import CloudClients
+from mctools.power import PowerStateTracker
+from discord_bots.server import ManagedServer
+
+
+class Fleet:
+    def __init__(self, clients=None, tracker=None):
+        self.clients = clients or CloudClients()
+        self.tracker = tracker or PowerStateTracker()
+        self.servers = {}
+        self.channels = {}
+        self.guilds = {}
+
+    def add(self, server, channels=(), guilds=()):
+        self.servers[server.name] = server
+        server.channels = [int(channel) for channel in channels]
+        for channel in server.channels:
+            self.channels.setdefault(channel, []).append(server)
+        for guild in guilds:
+            self.guilds.setdefault(int(guild), []).append(server)
+
+    @classmethod
+    def from_config(cls, settings):
+        """A fleet of one server, named 'default', from config.py."""
+        fleet = cls(tracker=PowerStateTracker(settings.get('power_poll_interval', 60)))
+        server = ManagedServer.from_settings('default', settings, fleet.clients, fleet.tracker)
+        fleet.add(server, channels=[settings['channel_id']] if 'channel_id' in settings else [])
+        return fleet
+
+    @classmethod
+    def from_toml(cls, path, defaults=None):
+        with open(path, 'rb') as f:
+            document = tomllib.load(f)
+        base = {**(defaults or {}), **document.get('defaults', {})}
+        fleet = cls(tracker=PowerStateTracker(base.get('power_poll_interval', 60)))
+        for name, definition in document.get('servers', {}).items():
+            settings = {**base, **definition}
+            server = ManagedServer.from_settings(name, settings, fleet.clients, fleet.tracker)
+            fleet.add(server, settings.get('channels', ()), settings.get('guilds', ()))
+        return fleet
+
+    def __iter__(self):
+        return iter(self.servers.values())
+
+    def __len__(self):
+        return len(self.servers)
+
+    def server_for(self, backend):
+        return next(server for server in self if server.backend is backend)
+
+    def for_channel(self, channel_id, guild_id=None):
+        """Servers whose commands are accepted in a channel, channel mappings first."""
+        servers = list(self.channels.get(channel_id, []))
+        servers += [server for server in self.guilds.get(guild_id, []) if server not in servers]
+        return servers
+
+    async def gather(self, fn, servers=None):
+        """Run `fn(server)` for every server concurrently; a failure is returned in place of that server's result."""
+        servers = list(self if servers is None else servers)
+        results = await asyncio.gather(*(fn(server) for server in servers), return_exceptions=True)
+        return dict(zip((server.name for server in servers), results))
+
+    async def close(self):
+        await asyncio.gather(*(server.close() for server in self), return_exceptions=True)
+        await self.clients.close()
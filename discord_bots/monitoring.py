@@ -0,0 +1,42 @@
+"""Prometheus instrumentation for the Discord bots.
+
+`start_metrics_server` serves every metric in mctools.metrics.REGISTRY at
+/metrics and starts an event-loop lag monitor. Cloud API, RCON and
+status-cache metrics are recorded by the mctools modules themselves;
+command latency is recorded here per command and stage.
+"""
+
+import asyncio
+
+from mctools import webserver
+from mctools.metrics import Counter, Gauge, Histogram, metrics_route
+
+COMMAND_SECONDS = Histogram('mc_bot_command_seconds', 'Bot command latency by stage.', ['command', 'stage'])
+RESUME_SECONDS = Histogram('mc_bot_resume_seconds', 'Time from a start request until the server is ready, by the stop mode it resumed from.',
+                           ['provider', 'stop_mode'])
+WAKE_PROXY_CONNECTIONS = Counter('mc_wake_proxy_connections_total', 'Connections to the wake-on-connect proxy by how they were handled.',
+                                 ['server', 'outcome'])
+LOOP_LAG_SECONDS = Histogram('mc_bot_event_loop_lag_seconds', 'How late the event loop woke a 1 second sleep.',
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+LOOP_LAG_LAST = Gauge('mc_bot_event_loop_lag_last_seconds', 'Most recent event loop lag measurement.')
+
+_tasks = []
+
+
+async def monitor_loop_lag(interval=1.0):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        LOOP_LAG_SECONDS.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+async def start_metrics_server(port, host='0.0.0.0'):
+    """Serve /metrics and start measuring event-loop lag; safe to call more than once."""
+    if _tasks:
+        return
+    server = await webserver.serve({'/metrics': metrics_route()}, host, port)
+    _tasks.append(server)
+    _tasks.append(asyncio.ensure_future(monitor_loop_lag()))
@@ -0,0 +1,189 @@
+"""A Minecraft server managed by the bot, on any supported cloud.
+
+`ManagedServer` bundles everything the bot needs for one server: its
+compute backend, shared status cache, RCON connection and power
+coordinator. Commands work against this object, so no code path is
+specific to a cloud provider.
+
+Each server has a stop mode (see mctools.compute.STOP_MODES), and every
+stop-to-ready time is recorded against the mode it resumed from. With a
+mctools.power tracker, the status cache reads the tracker's batched power
+states instead of querying the cloud itself.
+
+minecraft.service backs the world up after it stops, so a stop waits for
+that backup (followed through the telemetry service's /backup status)
+before the VM is powered off.
+"""
+
+import time
+import asyncio
+import logging
+
+from mctools.backup import fetch_backup
+from mctools.compute import make_backend
+from mctools.coordinator import PowerCoordinator
+from mctools.rcon import RconClient, RconDisconnected
+from mctools.readiness import wait_until_ready
+from mctools.resume import ResumeHistory
+from mctools.status import StatusCache
+from discord_bots.monitoring import COMMAND_SECONDS, RESUME_SECONDS
+
+PROVIDER_NAMES = {'azure': 'Azure VM', 'ec2': 'EC2 instance', 'fake': 'VM'}
+
+
+class ManagedServer:
+    def __init__(self, name, backend, host, port=25565, rcon_port=25575, rcon_password='',
+                 status_ttl=30, readiness_deadline=300, telemetry_port=25580, stop_mode='deallocate',
+                 resume_history_path=None, tracker=None, query_port=None, wake_proxy_port=None,
+                 backup_deadline=900):
+        self.name = name
+        self.backend = backend
+        self.host = host
+        self.port = port
+        self.readiness_deadline = readiness_deadline
+        self.telemetry_port = telemetry_port
+        self.stop_mode = stop_mode
+        # Seconds to wait for the stop-time backup; matches TimeoutStopSec in services/minecraft-backup.conf
+        self.backup_deadline = backup_deadline
+        # Port players connect to when the server has a wake-on-connect proxy (see discord_bots/wake_proxy.py)
+        self.wake_proxy_port = wake_proxy_port
+        # Discord channels the server is managed from; the first gets its alerts
+        self.channels = []
+        self.resume = ResumeHistory(resume_history_path)
+        self.tracker = tracker
+        self.coordinator = PowerCoordinator()
+        self.status = StatusCache(host, port, vm=tracker.add(backend) if tracker else backend, ttl=status_ttl,
+                                  query_port=query_port, telemetry_port=telemetry_port)
+        self.rcon = RconClient(host, rcon_port, rcon_password)
+
+    @classmethod
+    def from_settings(cls, name, settings, clients=None, tracker=None):
+        """Build a server from a mapping using the same keys as config.py."""
+        provider = settings.get('cloud_provider') or ('ec2' if 'ec2_instance_id' in settings else 'azure')
+        return cls(
+            name,
+            make_backend(provider, settings, clients),
+            settings['minecraft_server_host'],
+            port=settings.get('minecraft_server_port', 25565),
+            rcon_port=settings.get('minecraft_rcon_port', 25575),
+            rcon_password=settings.get('minecraft_rcon_password', ''),
+            status_ttl=settings.get('status_ttl', 30),
+            readiness_deadline=settings.get('readiness_deadline', 300),
+            telemetry_port=settings.get('telemetry_port', 25580),
+            stop_mode=settings.get('stop_mode', 'deallocate'),
+            resume_history_path=settings.get('resume_history_path', f'resume-{name}.json'),
+            tracker=tracker,
+            query_port=settings.get('minecraft_query_port'),
+            wake_proxy_port=settings.get('wake_proxy_port'),
+            backup_deadline=settings.get('backup_deadline', 900),
+        )
+
+    @property
+    def vm_label(self):
+        return PROVIDER_NAMES.get(self.backend.provider, 'VM')
+
+    def _expect_transition(self):
+        if self.tracker is not None:
+            self.tracker.expect_transition(self.backend)
+
+    async def start(self, on_stage=None):
+        """Start the VM and wait until the server answers status pings."""
+        started = time.monotonic()
+        self._expect_transition()
+        with COMMAND_SECONDS.time(command='startmc', stage='cloud_start'):
+            await self.backend.start()
+        report = await wait_until_ready(self.backend, self.host, self.port,
+                                        deadline=self.readiness_deadline, on_stage=on_stage)
+        for stage, seconds in report.latencies.items():
+            COMMAND_SECONDS.observe(seconds, command='startmc', stage=stage)
+        if report.ready:
+            seconds = time.monotonic() - started
+            mode = self.resume.record_resume(seconds)
+            RESUME_SECONDS.observe(seconds, provider=self.backend.provider, stop_mode=mode)
+        self.status.invalidate()
+        return report
+
+    async def stop_minecraft(self):
+        """Send 'stop' over RCON; returns the response, or None if the server hung up first.
+
+        A server about to hibernate keeps running, so it only flushes the world to disk.
+        """
+        with COMMAND_SECONDS.time(command='stopmc', stage='server_stop'):
+            if self.stop_mode == 'hibernate':
+                return await self.rcon.run('save-all flush', timeout=120)
+            try:
+                return await self.rcon.run('stop')
+            except RconDisconnected:
+                # The server may close the connection before answering 'stop'
+                return None
+
+    async def backup_status(self):
+        """The VM's last backup status from the telemetry service, or None if it is not served."""
+        try:
+            return await fetch_backup(self.host, self.telemetry_port)
+        except Exception as e:
+            logging.debug(f"Backup status from {self.host}:{self.telemetry_port} unavailable: {e}")
+            return None
+
+    async def wait_for_backup(self, before, start_grace=120, interval=5):
+        """Wait for the backup minecraft.service takes once the server has stopped.
+
+        `before` is `backup_status()` from before the stop; the stop's backup
+        is the first offline one started since. Returns its final status,
+        whose `state` is 'done' or 'failed', or 'unknown' if it cannot be
+        followed (or none starts within `start_grace` seconds), or 'timeout'
+        if it is still running after `backup_deadline` seconds.
+        """
+        if before is None:
+            return {'state': 'unknown', 'error': 'the VM does not report backup status'}
+        started = time.monotonic()
+        with COMMAND_SECONDS.time(command='stopmc', stage='backup'):
+            while True:
+                status = await self.backup_status()
+                ours = (status is not None and status.get('offline')
+                        and status.get('started_at') != before.get('started_at'))
+                if ours and status['state'] in ('done', 'failed'):
+                    return status
+                waited = time.monotonic() - started
+                # A hot backup still holding the store lock delays ours
+                busy = status is not None and status.get('state') == 'running'
+                if not ours and not busy and waited >= start_grace:
+                    return {'state': 'unknown', 'error': f'no backup started within {start_grace}s of the stop'}
+                if waited >= self.backup_deadline:
+                    return dict(status or {}, state='timeout')
+                await asyncio.sleep(interval)
+
+    async def power_off(self):
+        self._expect_transition()
+        with COMMAND_SECONDS.time(command='stopmc', stage='power_off'):
+            await self.backend.shut_down(self.stop_mode)
+        self.resume.record_stop(self.stop_mode)
+        self.status.invalidate()
+
+    async def reconcile_stop(self, power_state):
+        """Account for a VM that went down without the bot, e.g. the idle daemon's shutdown.
+
+        A guest shutdown leaves an Azure VM allocated and billed, so it is
+        deallocated unless the server is configured to stop. This runs as a
+        stop through the coordinator, so no start can begin halfway through
+        the deallocation; it raises TransitionConflict if a start got in first.
+        """
+        if self.resume.last_stop is not None or power_state not in ('stopped', 'deallocated', 'hibernated'):
+            return
+        await self.coordinator.run('stop', lambda: self._reconcile_stop(power_state))
+
+    async def _reconcile_stop(self, power_state):
+        # A stop may have been recorded since the state was seen
+        if self.resume.last_stop is not None:
+            return
+        mode = {'deallocated': 'deallocate', 'hibernated': 'hibernate'}.get(power_state, 'stop')
+        if power_state == 'stopped' and self.stop_mode != 'stop' and self.backend.provider != 'ec2':
+            self._expect_transition()
+            await self.backend.deallocate()
+            mode = 'deallocate'
+            self.status.invalidate()
+        self.resume.record_stop(mode)
+
+    async def close(self):
+        await self.rcon.close()
+        await self.backend.close()
@@ -0,0 +1,434 @@
+"""Wake-on-connect proxy in front of a managed server.
+
+Players connect to the proxy instead of the VM. While the server is up,
+each connection is relayed to it byte for byte, so the server list,
+logins and online-mode encryption work as if the proxy were not there.
+While it is down, the proxy answers status pings itself with a
+"sleeping" MOTD, and a login starts the VM through the server's power
+coordinator (the same path as `!startmc`, shared with any start already
+in flight) and disconnects the player with an estimate of when to come
+back, from the server's resume history.
+
+Whether the server is up comes from its shared status snapshot, whose
+power state is read from the fleet's batched tracker, so hundreds of
+status pings at a sleeping server cost no cloud calls and no probes
+beyond the usual one per TTL. Relayed traffic is read into one
+preallocated buffer per direction with `sock_recv_into` and written
+straight from it, with no allocation per read.
+
+The bot runs a proxy for every server with `wake_proxy_port` set. It can
+also run on its own, on any small always-on host, with the same config.py
+or fleet file:
+
+    python3 -m discord_bots.wake_proxy
+
+Point players (and the DNS name they use) at the proxy; the server's
+`minecraft_server_host` must still be the VM itself. The server sees
+every relayed player as coming from the proxy's address.
+"""
+
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+
+from discord_bots.monitoring import WAKE_PROXY_CONNECTIONS
+
+# Handshake next states
+STATUS, LOGIN, TRANSFER = 1, 2, 3
+# Seconds a client gets to send its handshake and the packet after it
+HANDSHAKE_TIMEOUT = 10
+# Seconds to wait for the server's port when relaying
+CONNECT_TIMEOUT = 5
+# Largest packet accepted before the connection is relayed or answered
+MAX_PACKET = 4096
+# Bytes buffered per direction of a relayed connection
+BUFFER_SIZE = 64 * 1024
+# Seconds a start is expected to take before any resume has been recorded
+DEFAULT_ETA = 90
+# Power states on the way down
+STOPPING_STATES = ('stopping', 'deallocating', 'hibernating')
+
+
+def varint(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if not value:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def read_varint(data, pos=0):
+    """Decode a VarInt at `data[pos:]`; returns (value, position after it), or None if the data ends first."""
+    result = 0
+    for shift in range(0, 35, 7):
+        if pos >= len(data):
+            return None
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+    raise ValueError('VarInt too long')
+
+
+def string(value):
+    encoded = value.encode('utf-8')
+    return varint(len(encoded)) + encoded
+
+
+def read_string(data, pos=0):
+    length, pos = read_varint(data, pos) or (None, None)
+    if length is None or pos + length > len(data):
+        raise ValueError('truncated string')
+    return bytes(data[pos:pos + length]).decode('utf-8', errors='replace'), pos + length
+
+
+def packet(packet_id, payload=b''):
+    data = varint(packet_id) + payload
+    return varint(len(data)) + data
+
+
+def parse_handshake(payload):
+    """(protocol version, server address, next state) from a Handshake packet's payload."""
+    protocol, pos = read_varint(payload) or (None, None)
+    if protocol is None:
+        raise ValueError('truncated handshake')
+    address, pos = read_string(payload, pos)
+    next_state = read_varint(payload, pos + 2)
+    if next_state is None:
+        raise ValueError('truncated handshake')
+    return protocol, address, next_state[0]
+
+
+def format_eta(seconds):
+    if seconds < 120:
+        return f"{max(5, 5 * round(seconds / 5))} seconds"
+    return f"{round(seconds / 60)} minutes"
+
+
+class PacketReader:
+    """Reads the uncompressed packets a connection opens with, keeping every byte for relaying."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.data = bytearray()
+        self.pos = 0
+
+    async def packet(self):
+        """(packet_id, payload) of the next packet."""
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.legacy_ping:
+                raise ValueError('pre-1.7 server list ping')
+            header = read_varint(self.data, self.pos)
+            if header is not None:
+                length, start = header
+                if length > MAX_PACKET:
+                    raise ValueError(f"packet of {length} bytes before login")
+                if len(self.data) >= start + length:
+                    self.pos = start + length
+                    frame = bytes(self.data[start:self.pos])
+                    packet_id, pos = read_varint(frame) or (None, None)
+                    if packet_id is None:
+                        raise ValueError('empty packet')
+                    return packet_id, frame[pos:]
+            chunk = await loop.sock_recv(self.sock, MAX_PACKET)
+            if not chunk:
+                raise ConnectionError('client closed the connection')
+            self.data += chunk
+
+    @property
+    def legacy_ping(self):
+        """Whether the client opened with a pre-1.7 server list ping."""
+        return self.data[:1] == b'\xfe'
+
+
+async def start_server(server, player):
+    """The default wake: a `!startmc` start, joining one already in flight."""
+    report, _ = await server.coordinator.run('start', server.start)
+    return report
+
+
+class WakeProxy:
+    def __init__(self, server, port, host='0.0.0.0', wake=start_server, buffer_size=BUFFER_SIZE):
+        self.server = server
+        self.host = host
+        self.port = port
+        # Coroutine function run as wake(server, player name) when a login finds the server down
+        self.wake = wake
+        self.buffer_size = buffer_size
+        self._listener = None
+        self._accepting = None
+        self._connections = set()
+        self._waking = None
+        # Shown in the server list while the server sleeps, from when it was last up
+        self._version = None
+        self._max_players = 0
+        # (MOTD, protocol) -> encoded Status Response
+        self._responses = {}
+
+    @property
+    def serving(self):
+        return self._accepting is not None and not self._accepting.done()
+
+    async def start(self):
+        self._listener = socket.create_server((self.host, self.port), backlog=512)
+        self._listener.setblocking(False)
+        # With port 0, the port the system picked
+        self.port = self._listener.getsockname()[1]
+        self._accepting = asyncio.ensure_future(self._accept())
+        logging.info(f"Wake proxy for {self.server.name} listening on {self.host}:{self.port}")
+
+    async def close(self):
+        if self._accepting is not None:
+            self._accepting.cancel()
+        if self._listener is not None:
+            self._listener.close()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _accept(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                client, address = await loop.sock_accept(self._listener)
+            except OSError as e:
+                # Out of file descriptors, usually; let some connections finish
+                logging.error(f"Wake proxy for {self.server.name} could not accept a connection: {e}")
+                await asyncio.sleep(0.1)
+                continue
+            task = asyncio.ensure_future(self._handle(client, address))
+            self._connections.add(task)
+            task.add_done_callback(self._connections.discard)
+
+    async def _handle(self, client, address):
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = PacketReader(client)
+        try:
+            packet_id, payload = await asyncio.wait_for(reader.packet(), HANDSHAKE_TIMEOUT)
+            if packet_id != 0:
+                raise ValueError(f"expected a handshake, got packet {packet_id:#x}")
+            protocol, _, next_state = parse_handshake(payload)
+            snapshot = await self.server.status.get()
+            if snapshot.online:
+                self._version, self._max_players = snapshot.version, snapshot.max_players
+                if self.server.coordinator.operation != 'stop':
+                    if await self._relay(client, reader):
+                        WAKE_PROXY_CONNECTIONS.inc(server=self.server.name, outcome='relayed')
+                        return
+                    # The snapshot was stale; _relay invalidated it
+                    snapshot = await self.server.status.get()
+            if next_state == STATUS:
+                await self._answer_status(client, reader, protocol, snapshot)
+            elif next_state in (LOGIN, TRANSFER):
+                await self._answer_login(client, reader, snapshot)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logging.debug(f"Wake proxy connection from {address[0]} ended early: {e}")
+        except (ValueError, OSError) as e:
+            if not reader.legacy_ping:
+                logging.info(f"Wake proxy connection from {address[0]} dropped: {e}")
+        finally:
+            client.close()
+
+    def _eta(self):
+        """Seconds until the server should answer, from its p50 resume time after its last kind of stop."""
+        stop = self.server.resume.last_stop or {}
+        modes = self.server.resume.summary()
+        expected = modes[stop['mode']]['p50_seconds'] if stop.get('mode') in modes else DEFAULT_ETA
+        started = self.server.coordinator.started_at
+        elapsed = time.monotonic() - started if started is not None and self.server.coordinator.operation == 'start' else 0
+        return max(expected - elapsed, 0)
+
+    def _starting(self):
+        """Whether a start is in flight, from this proxy or through the coordinator."""
+        return self._waking is not None or self.server.coordinator.operation == 'start'
+
+    def _state(self, snapshot):
+        """'stopping', 'starting' or 'sleeping' for a server that is not accepting players."""
+        if self.server.coordinator.operation == 'stop' or snapshot.power_state in STOPPING_STATES:
+            return 'stopping'
+        if self._starting() or snapshot.power_state in ('starting', 'running'):
+            return 'starting'
+        return 'sleeping'
+
+    def _status_response(self, protocol, motd):
+        key = (motd, protocol)
+        response = self._responses.get(key)
+        if response is None:
+            if len(self._responses) > 256:
+                self._responses.clear()
+            status = {
+                'version': {'name': self._version or 'Sleeping', 'protocol': protocol},
+                'players': {'max': self._max_players, 'online': 0},
+                'description': {'text': motd, 'color': 'gray'},
+            }
+            response = self._responses[key] = packet(0, string(json.dumps(status)))
+        return response
+
+    async def _answer_status(self, client, reader, protocol, snapshot):
+        loop = asyncio.get_running_loop()
+        packet_id, _ = await asyncio.wait_for(reader.packet(), HANDSHAKE_TIMEOUT)
+        if packet_id != 0:
+            return
+        state = self._state(snapshot)
+        if state == 'sleeping':
+            motd = 'Sleeping - join to wake it up'
+        elif state == 'starting':
+            motd = f"Starting up - ready in about {format_eta(self._eta())}"
+        else:
+            motd = 'Shutting down - join again in a minute to wake it up'
+        WAKE_PROXY_CONNECTIONS.inc(server=self.server.name, outcome='status')
+        await loop.sock_sendall(client, self._status_response(protocol, motd))
+        packet_id, payload = await asyncio.wait_for(reader.packet(), HANDSHAKE_TIMEOUT)
+        if packet_id == 1:
+            await loop.sock_sendall(client, packet(1, payload))
+
+    async def _answer_login(self, client, reader, snapshot):
+        packet_id, payload = await asyncio.wait_for(reader.packet(), HANDSHAKE_TIMEOUT)
+        player = read_string(payload)[0] if packet_id == 0 else None
+        state = self._state(snapshot)
+        # A VM that reads as up with no start in flight is either a power state from before it went down
+        # or a server that did not come up; a start sorts out both
+        if state == 'sleeping' or (state == 'starting' and not self._starting()):
+            self._start(player)
+            state = 'starting'
+        if state == 'starting':
+            message = f"The server is starting up. Try again in about {format_eta(self._eta())}."
+        else:
+            message = 'The server is shutting down. Try again in a minute to start it back up.'
+        WAKE_PROXY_CONNECTIONS.inc(server=self.server.name, outcome='login')
+        # Login Disconnect
+        await asyncio.get_running_loop().sock_sendall(client, packet(0, string(json.dumps({'text': message}))))
+
+    def _start(self, player):
+        logging.info(f"{player or 'A player'} connected to the wake proxy; starting {self.server.name}")
+        WAKE_PROXY_CONNECTIONS.inc(server=self.server.name, outcome='wake')
+        self._waking = asyncio.ensure_future(self.wake(self.server, player))
+        self._waking.add_done_callback(self._woken)
+
+    def _woken(self, task):
+        self._waking = None
+        self.server.status.invalidate()
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logging.error(f"Wake proxy could not start {self.server.name}: {task.exception()}")
+        elif not getattr(task.result(), 'ready', True):
+            logging.error(f"{self.server.name} was started by the wake proxy but did not become ready")
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        error = OSError(f"no address for {self.server.host}")
+        for family, kind, proto, _, address in await loop.getaddrinfo(self.server.host, self.server.port,
+                                                                       type=socket.SOCK_STREAM):
+            sock = socket.socket(family, kind, proto)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, address)
+            except OSError as e:
+                sock.close()
+                error = e
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        raise error
+
+    async def _relay(self, client, reader):
+        """Relay the connection to the server; False if the server could not be reached."""
+        loop = asyncio.get_running_loop()
+        try:
+            upstream = await asyncio.wait_for(self._connect(), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            logging.info(f"Wake proxy could not reach {self.server.host}:{self.server.port}: {e}")
+            self.server.status.invalidate()
+            return False
+        try:
+            # What the client has sent so far, handshake included
+            await loop.sock_sendall(upstream, reader.data)
+            pipes = [asyncio.ensure_future(self._pipe(client, upstream)),
+                     asyncio.ensure_future(self._pipe(upstream, client))]
+            try:
+                # Until both sides are done, or either fails
+                await asyncio.wait(pipes, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for pipe in pipes:
+                    pipe.cancel()
+                await asyncio.gather(*pipes, return_exceptions=True)
+        finally:
+            upstream.close()
+        return True
+
+    async def _pipe(self, source, sink):
+        loop = asyncio.get_running_loop()
+        buffer = memoryview(bytearray(self.buffer_size))
+        while True:
+            received = await loop.sock_recv_into(source, buffer)
+            if not received:
+                break
+            await loop.sock_sendall(sink, buffer[:received])
+        try:
+            sink.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def build_fleet():
+    import config
+    from discord_bots.fleet import Fleet
+
+    fleet_file = getattr(config, 'fleet_file', None)
+    if fleet_file:
+        return Fleet.from_toml(fleet_file)
+    return Fleet.from_config({k: v for k, v in vars(config).items() if not k.startswith('_')})
+
+
+async def serve(args):
+    fleet = build_fleet()
+    servers = [server for server in fleet if server.wake_proxy_port or args.port]
+    if args.port and len(servers) > 1:
+        raise SystemExit('--port needs a single server; set wake_proxy_port per server in the fleet file instead')
+    if not servers:
+        raise SystemExit('no server has wake_proxy_port set')
+    proxies = [WakeProxy(server, args.port or server.wake_proxy_port, args.host) for server in servers]
+    tracker = asyncio.ensure_future(fleet.tracker.run())
+    try:
+        for proxy in proxies:
+            await proxy.start()
+            print(f"{proxy.server.name}: {proxy.host}:{proxy.port} -> {proxy.server.host}:{proxy.server.port}")
+        await asyncio.Event().wait()
+    finally:
+        tracker.cancel()
+        await asyncio.gather(*(proxy.close() for proxy in proxies))
+        await fleet.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Wake the Minecraft server VM when a player connects.')
+    parser.add_argument('--host', default=None, help='address to listen on (default: wake_proxy_host, or all)')
+    parser.add_argument('--port', type=int, help='port to listen on, for a single server (default: wake_proxy_port)')
+    parser.add_argument('--verbose', action='store_true', help='log every wake and relay failure')
+    return parser.parse_args(argv)
+
+
+def main(args):
+    import config
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    if args.host is None:
+        args.host = getattr(config, 'wake_proxy_host', '0.0.0.0')
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(parse_args())
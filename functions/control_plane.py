@@ -0,0 +1,366 @@
+"""HTTP control plane for the Minecraft servers, as a plain ASGI app.
+
+function_app.py serves this app through the Functions host; any ASGI
+server or test client can also call it directly. Endpoints:
+
+    GET  /servers                       cached status of every server
+    GET  /servers/{name}/status         one server's status (`?fresh=1` skips the cache)
+    POST /servers/{name}/start          start the VM and wait for the server, in the background
+    POST /servers/{name}/stop           stop the server and power the VM off, in the background
+    GET|POST /servers/{name}/wake       start the server unless it is already online
+    GET  /operations/{id}               progress and result of a start or stop
+
+Start, stop and wake return 202 at once with an operation ID and a
+`status_url` to poll. A request for an operation that is already running
+gets that operation back; a request for the opposite one gets 409. The
+long part of the work (the VM start, readiness polling, RCON `stop`)
+runs on the worker's event loop after the response is sent.
+
+Everything expensive is created on first use and kept for the life of
+the worker: the fleet with its shared SDK clients and credential (from
+mctools.compute.CloudClients), each server's status cache and RCON
+connection. The cloud SDKs, mcstatus and the bot modules are imported
+at that point too, so a cold start only pays for this module.
+
+Settings come from the `MC_*` app settings, named like the keys of the
+bots' config.py (`MC_VM_NAME`, `MC_MINECRAFT_SERVER_HOST`, ...), or from
+a fleet TOML file named by `MC_FLEET_FILE` (see discord_bots/fleet.py).
+Operations are kept in memory, so the Function App should not scale out
+beyond one instance.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+# App settings that hold numbers; everything arrives as a string
+NUMERIC_SUFFIXES = ('_port', '_ttl', '_deadline', '_interval', '_delay')
+# Finished operations kept for polling
+OPERATION_HISTORY = 200
+
+_fleet = None
+_fleet_loop = None
+_tracker_task = None
+_operations = OrderedDict()
+# server name -> operation in flight
+_in_flight = {}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': message, **extra}
+
+
+def settings_from_env(environ=None):
+    """config.py-style settings from the `MC_*` app settings."""
+    environ = os.environ if environ is None else environ
+    settings = {}
+    for key, value in environ.items():
+        if not key.startswith('MC_'):
+            continue
+        name = key[3:].lower()
+        if name.endswith('_port') and value:
+            value = int(value)
+        elif name.endswith(NUMERIC_SUFFIXES) and value:
+            value = float(value)
+        settings[name] = value
+    return settings
+
+
+async def _discard_fleet():
+    """Cancel the tracker and close the fleet, e.g. one left over from an earlier event loop."""
+    global _fleet, _fleet_loop, _tracker_task
+    fleet, loop, task = _fleet, _fleet_loop, _tracker_task
+    _fleet = _fleet_loop = _tracker_task = None
+    if not loop.is_closed():
+        task.cancel()
+    # Operations running on that loop are abandoned
+    for name, operation in list(_in_flight.items()):
+        if operation.task is not None and not loop.is_closed():
+            operation.task.cancel()
+        operation.state = operation.stage = 'failed'
+        operation.error = 'the worker shut down or restarted its event loop while the operation was running'
+        operation.finished_at = time.time()
+        del _in_flight[name]
+    # Connections tied to a closed loop may not close cleanly; the executor threads still stop
+    try:
+        await fleet.close()
+    except Exception as e:
+        logging.warning(f"Error closing the previous fleet: {e}")
+
+
+async def get_fleet():
+    """The fleet for this worker, built on first use and rebuilt if the event loop changes."""
+    global _fleet, _fleet_loop, _tracker_task
+    loop = asyncio.get_running_loop()
+    if _fleet is not None and _fleet_loop is not loop:
+        await _discard_fleet()
+    if _fleet is None:
+        from discord_bots.fleet import Fleet
+        from discord_bots.server import ManagedServer
+        from mctools.power import PowerStateTracker
+        from mctools.resume import ResumeHistory
+
+        settings = settings_from_env()
+        # The app's own folder may be read-only
+        history_dir = tempfile.gettempdir()
+        if settings.get('fleet_file'):
+            _fleet = Fleet.from_toml(settings['fleet_file'], defaults={'resume_history_path': None})
+            for server in _fleet:
+                server.resume = ResumeHistory(os.path.join(history_dir, f"resume-{server.name}.json"))
+        else:
+            settings.setdefault('resume_history_path', os.path.join(history_dir, 'resume-default.json'))
+            _fleet = Fleet(tracker=PowerStateTracker(settings.get('power_poll_interval', 60)))
+            _fleet.add(ManagedServer.from_settings('default', settings, _fleet.clients, _fleet.tracker))
+        _fleet_loop = loop
+        # Polls fast while an operation runs. If the instance is frozen between
+        # executions, the tracker sees its cache is stale and asks the cloud directly.
+        _tracker_task = asyncio.ensure_future(_fleet.tracker.run())
+    return _fleet
+
+
+async def get_server(name):
+    fleet = await get_fleet()
+    server = fleet.servers.get(name)
+    if server is None:
+        raise HttpError(404, f"unknown server: {name}", servers=list(fleet.servers))
+    return server
+
+
+class Operation:
+    def __init__(self, server, kind):
+        self.id = uuid.uuid4().hex
+        self.server = server.name
+        self.kind = kind
+        self.state = 'running'
+        # Last readiness stage reached, or what the operation is doing
+        self.stage = 'queued'
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        # Kept here so the task is not garbage collected while it runs
+        self.task = None
+
+    def to_dict(self):
+        finished = self.finished_at or time.time()
+        return {'id': self.id, 'server': self.server, 'operation': self.kind, 'state': self.state,
+                'stage': self.stage, 'stages': self.stages, 'result': self.result, 'error': self.error,
+                'started_at': self.started_at, 'finished_at': self.finished_at,
+                'elapsed': round(finished - self.started_at, 1),
+                'status_url': f"/operations/{self.id}"}
+
+
+def _remember(operation):
+    _operations[operation.id] = operation
+    while len(_operations) > OPERATION_HISTORY:
+        oldest = next(iter(_operations))
+        if _operations[oldest].state == 'running':
+            break
+        del _operations[oldest]
+
+
+async def _start(server, operation):
+    """What `!startmc` does: nothing if the server is up, else start the VM and wait for readiness."""
+    snapshot = await server.status.get()
+    if snapshot.power_state == 'running' and snapshot.online:
+        return {'ready': True, 'version': snapshot.version, 'already_running': True}
+
+    async def on_stage(stage, seconds):
+        operation.stage = stage
+        operation.stages[stage] = round(seconds, 1)
+
+    operation.stage = 'starting'
+    report = await server.start(on_stage=on_stage)
+    if not report.ready:
+        raise RuntimeError(f"{server.vm_label} started, but the server did not answer within "
+                           f"{server.readiness_deadline}s (last stage: {report.stage})")
+    return {'ready': True, 'version': report.version, 'seconds': round(report.total, 1)}
+
+
+async def _stop(server, operation):
+    """What `!stopmc` does: stop (or save) the server over RCON, wait for the backup, then power the VM off."""
+    operation.stage = 'server_stop'
+    hibernate = server.stop_mode == 'hibernate'
+    before = None if hibernate else await server.backup_status()
+    await server.stop_minecraft()
+    result = {'stop_mode': server.stop_mode}
+    if not hibernate:
+        operation.stage = 'backup'
+        backup = await server.wait_for_backup(before)
+        if backup['state'] == 'timeout':
+            raise RuntimeError(f"the world backup is still running after {server.backup_deadline}s, "
+                               f"so the {server.vm_label} was left on")
+        result['backup'] = {key: backup.get(key) for key in ('state', 'snapshot', 'error') if backup.get(key)}
+    operation.stage = 'power_off'
+    await server.power_off()
+    return result
+
+
+OPERATIONS = {'start': _start, 'stop': _stop}
+
+
+async def _run(server, operation):
+    from mctools.coordinator import TransitionConflict
+
+    try:
+        result, _ = await server.coordinator.run(operation.kind, lambda: OPERATIONS[operation.kind](server, operation))
+        operation.state, operation.result = 'succeeded', result
+    except TransitionConflict as e:
+        operation.state, operation.error = 'failed', str(e)
+    except Exception as e:
+        logging.exception(f"{operation.kind} of {server.name} failed")
+        operation.state, operation.error = 'failed', str(e)
+    finally:
+        operation.stage = operation.state
+        operation.finished_at = time.time()
+        server.status.invalidate()
+        if _in_flight.get(server.name) is operation:
+            del _in_flight[server.name]
+
+
+def begin(server, kind):
+    """Start `kind` on `server` in the background, or join the same operation already running."""
+    current = _in_flight.get(server.name)
+    if current is not None:
+        if current.kind != kind:
+            raise HttpError(409, f"cannot {kind} {server.name} while a {current.kind} is in progress",
+                            operation=current.to_dict())
+        return current, True
+    operation = Operation(server, kind)
+    _in_flight[server.name] = operation
+    _remember(operation)
+    operation.task = asyncio.ensure_future(_run(server, operation))
+    return operation, False
+
+
+def snapshot_dict(server, snapshot):
+    return {'server': server.name, 'host': server.host, 'power_state': snapshot.power_state,
+            'online': snapshot.online, 'players': snapshot.players, 'max_players': snapshot.max_players,
+            'player_names': list(snapshot.player_names), 'version': snapshot.version, 'motd': snapshot.motd,
+            'latency': snapshot.latency, 'tps': snapshot.tps, 'age': round(snapshot.age, 1),
+            'operation': _in_flight[server.name].to_dict() if server.name in _in_flight else None}
+
+
+# Route handlers: (query, **path parameters) -> (status, body)
+
+async def list_servers(query):
+    fleet = await get_fleet()
+    snapshots = await fleet.gather(lambda server: server.status.get())
+    servers = []
+    for server in fleet:
+        snapshot = snapshots[server.name]
+        if isinstance(snapshot, Exception):
+            servers.append({'server': server.name, 'error': str(snapshot)})
+        else:
+            servers.append(snapshot_dict(server, snapshot))
+    return 200, {'servers': servers}
+
+
+async def server_status(query, name):
+    server = await get_server(name)
+    fresh = query.get('fresh', ['0'])[0] not in ('0', 'false', '')
+    if fresh:
+        # One batched power-state call for the fleet instead of the tracker's cached state
+        await _fleet.tracker.refresh()
+    return 200, snapshot_dict(server, await server.status.get(max_age=0 if fresh else None))
+
+
+async def start_server(query, name):
+    operation, joined = begin(await get_server(name), 'start')
+    return 202, {**operation.to_dict(), 'joined': joined}
+
+
+async def stop_server(query, name):
+    operation, joined = begin(await get_server(name), 'stop')
+    return 202, {**operation.to_dict(), 'joined': joined}
+
+
+async def wake_server(query, name):
+    """Wake-on-request: the status if the server is up, else a start operation to poll."""
+    server = await get_server(name)
+    if server.name not in _in_flight:
+        snapshot = await server.status.get()
+        if snapshot.online:
+            return 200, snapshot_dict(server, snapshot)
+    operation, joined = begin(server, 'start')
+    return 202, {**operation.to_dict(), 'joined': joined}
+
+
+async def get_operation(query, operation_id):
+    operation = _operations.get(operation_id)
+    if operation is None:
+        # Lost with a worker restart, or made on another instance
+        raise HttpError(404, f"unknown operation: {operation_id}")
+    return 200, operation.to_dict()
+
+
+ROUTES = [
+    (('GET',), re.compile(r'^/servers/?$'), list_servers),
+    (('GET',), re.compile(r'^/servers/(?P<name>[^/]+)/status$'), server_status),
+    (('POST',), re.compile(r'^/servers/(?P<name>[^/]+)/start$'), start_server),
+    (('POST',), re.compile(r'^/servers/(?P<name>[^/]+)/stop$'), stop_server),
+    (('GET', 'POST'), re.compile(r'^/servers/(?P<name>[^/]+)/wake$'), wake_server),
+    (('GET',), re.compile(r'^/operations/(?P<operation_id>[0-9a-f]+)$'), get_operation),
+]
+
+
+async def dispatch(method, path, query):
+    # The Functions host may pass the route prefix through
+    if path.startswith('/api/'):
+        path = path[4:]
+    allowed = False
+    for methods, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if not match:
+            continue
+        if method not in methods:
+            allowed = True
+            continue
+        try:
+            return await handler(query, **match.groupdict())
+        except HttpError as e:
+            return e.status, e.body
+        except Exception as e:
+            logging.exception(f"{method} {path} failed")
+            return 500, {'error': str(e)}
+    return (405, {'error': 'method not allowed'}) if allowed else (404, {'error': 'not found'})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _fleet is not None:
+                await _discard_fleet()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    status, body = await dispatch(scope['method'], scope['path'], query)
+    payload = json.dumps(body).encode()
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode()),
+               (b'cache-control', b'no-store')]
+    if status == 202:
+        headers.append((b'location', body['status_url'].encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
@@ -1,25 +1,12 @@
-import azure.functions as func
-import logging
-
-app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
-
-@app.route(route="helloWorld")
-def helloWorld(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request.')
-
-    name = req.params.get('name')
-    if not name:
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            pass
-        else:
-            name = req_body.get('name')
-
-    if name:
-        return func.HttpResponse(f"Hello, {name}. This HTTP triggered function executed successfully.")
-    else:
-        return func.HttpResponse(
-             "This HTTP triggered function executed successfully. Pass a name in the query string or in the request body for a personalized response.",
-             status_code=200
-        )
\ No newline at end of file
+"""Azure Functions entry point: serves the control plane in control_plane.py over HTTP.
+
+Only azure.functions and control_plane (standard library only) load at a
+cold start; the cloud SDKs and the bot modules load on the first request.
+"""
+
+import azure.functions as func
+
+from control_plane import app as control_plane
+
+# Function keys guard the power operations; pass one as ?code= or the x-functions-key header
+app = func.AsgiFunctionApp(app=control_plane, http_auth_level=func.AuthLevel.FUNCTION)
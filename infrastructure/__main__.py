@@ -114,8 +114,8 @@ server = azure_native.compute.VirtualMachine(
             name="myosdisk1",
             caching="ReadWrite",
             disk_size_gb=30,
-            # TODO: Consider detaching disk instead of deleting to enable retrieval of world files
-            delete_option=azure_native.compute.DiskDeleteOptionTypes.DELETE
+            # Keep the disk (and the world backups in /home/minecraft/backups) if the VM is deleted
+            delete_option=azure_native.compute.DiskDeleteOptionTypes.DETACH
         ),
         image_reference=azure_native.compute.ImageReferenceArgs(
             publisher="canonical",
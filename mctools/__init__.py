@@ -0,0 +1 @@
+"""Shared building blocks for the Minecraft server automation bots and VM tools."""
@@ -0,0 +1,614 @@
+"""Incremental, content-addressed world backups.
+
+A world is mostly region files (.mca), and between two backups only a few
+of their chunks change. Each region file is split into its header and
+its chunks. Every piece is stored once under its SHA-256 hash, so an
+unchanged chunk is never copied again. Other files are split into fixed
+size blobs the same way.
+
+New objects are appended to pack files (`packs/<id>.pack`), each with a
+JSON index (`packs/<id>.idx`) mapping hashes to offsets. A snapshot is a
+JSON manifest (`snapshots/<name>.json`) listing every file and the
+objects it is made of. Two shortcuts keep a backup proportional to what
+changed:
+- Files whose size and mtime match the previous snapshot are not read.
+- In a changed region file, a chunk whose slot and timestamp in the
+  header are unchanged reuses its previous hash.
+
+While the server is running, saving is paused with `save-off` and
+flushed with `save-all flush`, and `save-on` is sent once the snapshot
+is written. The target can be a local directory or an S3 URL
+(s3://bucket/prefix, needs boto3).
+
+`python3 -m mctools.backup create` takes a snapshot. `list` shows the
+snapshots and `restore` rebuilds one into a directory. minecraft.service
+runs `create --offline` after every deliberate stop, though not after a
+crash it restarts from (services/minecraft-backup.conf), and
+minecraft-backup.timer takes an hourly hot snapshot. `create` holds an
+exclusive lock on the store, so the two never write it at once.
+
+After each snapshot, `create` prunes the store: it keeps the latest
+`--keep-last` snapshots plus the newest of each of the last
+`--keep-daily` days and `--keep-weekly` weeks, deletes packs none of the
+kept snapshots use, and rewrites packs that are mostly garbage. `prune`
+does the same on its own.
+
+`create` records its progress in a status file, which the telemetry
+service serves at /backup. The bot reads it after `!stopmc` so the VM is
+not powered off while the stop-time backup is still being written.
+"""
+
+import os
+import json
+import time
+import zlib
+import fcntl
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from mctools import webserver
+from mctools.rcon import RconClient
+from mctools.properties import read_properties
+
+SECTOR = 4096
+HEADER_SIZE = 2 * SECTOR
+BLOB_SIZE = 1 << 20
+PACK_SIZE = 64 << 20
+
+DEFAULT_STATUS_PATH = '/home/minecraft/backup-status.json'
+
+# Files next to the world folders that are worth keeping with a snapshot
+CONFIG_FILES = ('server.properties', 'whitelist.json', 'ops.json', 'banned-players.json', 'banned-ips.json')
+
+# Chunk compression types from the region format whose payload is already compressed
+COMPRESSED_CHUNK_TYPES = {1, 2, 4}
+
+_LOCATIONS = struct.Struct('>1024I')
+_TIMESTAMPS = struct.Struct('>1024I')
+_CHUNK_LENGTH = struct.Struct('>IB')
+
+
+class LocalTarget:
+    """Backup storage in a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def list(self, prefix):
+        directory = self._path(prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f"{prefix}/{name}" for name in os.listdir(directory) if not name.startswith('.'))
+
+    def get(self, name):
+        with open(self._path(name), 'rb') as f:
+            return f.read()
+
+    def get_range(self, name, offset, length):
+        with open(self._path(name), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def put_file(self, name, path):
+        destination = self._path(name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temp = os.path.join(os.path.dirname(destination), f".{os.path.basename(destination)}.tmp")
+        with open(path, 'rb') as src, open(temp, 'wb') as dst:
+            while True:
+                block = src.read(BLOB_SIZE)
+                if not block:
+                    break
+                dst.write(block)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(temp, destination)
+
+    def put_bytes(self, name, data):
+        destination = self._path(name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temp = os.path.join(os.path.dirname(destination), f".{os.path.basename(destination)}.tmp")
+        with open(temp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, destination)
+
+    def delete(self, name):
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class S3Target:
+    """Backup storage under a prefix of an S3 bucket."""
+
+    def __init__(self, bucket, prefix=''):
+        # Imported here so local backups do not need boto3 installed
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self._client = boto3.client('s3')
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def list(self, prefix):
+        names = []
+        paginator = self._client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix) + '/'):
+            for item in page.get('Contents', []):
+                names.append(item['Key'][len(self._key('')):] if self.prefix else item['Key'])
+        return sorted(names)
+
+    def get(self, name):
+        return self._client.get_object(Bucket=self.bucket, Key=self._key(name))['Body'].read()
+
+    def get_range(self, name, offset, length):
+        response = self._client.get_object(Bucket=self.bucket, Key=self._key(name),
+                                           Range=f"bytes={offset}-{offset + length - 1}")
+        return response['Body'].read()
+
+    def put_file(self, name, path):
+        self._client.upload_file(path, self.bucket, self._key(name))
+
+    def put_bytes(self, name, data):
+        self._client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data)
+
+    def delete(self, name):
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+
+def open_target(location):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3Target(bucket, prefix)
+    return LocalTarget(location)
+
+
+class ObjectStore:
+    """Content-addressed objects kept in packs on a target."""
+
+    def __init__(self, target, pack_size=PACK_SIZE):
+        self.target = target
+        self.pack_size = pack_size
+        # hash -> (pack name, offset, length, codec)
+        self.objects = {}
+        self.new_objects = 0
+        self.bytes_written = 0
+        self._pack = None
+        self._pack_path = None
+        self._pack_index = {}
+        for name in target.list('packs'):
+            if name.endswith('.idx'):
+                pack = name[:-len('.idx')] + '.pack'
+                for digest, (offset, length, codec) in json.loads(target.get(name)).items():
+                    self.objects[digest] = (pack, offset, length, codec)
+
+    def add(self, data, compress=True):
+        """Store `data` unless an identical object exists; returns its hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self.objects or digest in self._pack_index:
+            return digest
+
+        codec = 'raw'
+        if compress:
+            packed = zlib.compress(data, 1)
+            # Only keep the compressed form when it is worth inflating later
+            if len(packed) < len(data) * 0.9:
+                data, codec = packed, 'zlib'
+
+        if self._pack is None:
+            fd, self._pack_path = tempfile.mkstemp(suffix='.pack')
+            self._pack = os.fdopen(fd, 'wb')
+        self._pack_index[digest] = (self._pack.tell(), len(data), codec)
+        self._pack.write(data)
+        self.new_objects += 1
+        self.bytes_written += len(data)
+        if self._pack.tell() >= self.pack_size:
+            self.flush()
+        return digest
+
+    def flush(self):
+        """Upload the pack being written, if any, and its index."""
+        if self._pack is None:
+            return
+        self._pack.close()
+        pack_id = hashlib.sha256(json.dumps(sorted(self._pack_index)).encode()).hexdigest()[:32]
+        try:
+            self.target.put_file(f"packs/{pack_id}.pack", self._pack_path)
+        finally:
+            os.unlink(self._pack_path)
+        # The index goes last, so a pack is only ever referenced once it is complete
+        self.target.put_bytes(f"packs/{pack_id}.idx", json.dumps(self._pack_index).encode())
+        for digest, (offset, length, codec) in self._pack_index.items():
+            self.objects[digest] = (f"packs/{pack_id}.pack", offset, length, codec)
+        self._pack = self._pack_path = None
+        self._pack_index = {}
+
+    def get(self, digest):
+        pack, offset, length, codec = self.objects[digest]
+        data = self.target.get_range(pack, offset, length)
+        if codec == 'zlib':
+            data = zlib.decompress(data)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"object {digest} in {pack} is corrupt")
+        return data
+
+
+def read_region_header(f):
+    """Return the (sector offset, sector count, timestamp) of each of the 1024 chunk slots."""
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        return header, []
+    locations = _LOCATIONS.unpack_from(header, 0)
+    timestamps = _TIMESTAMPS.unpack_from(header, SECTOR)
+    return header, [(location >> 8, location & 0xFF, timestamp) for location, timestamp in zip(locations, timestamps)]
+
+
+class Snapshotter:
+    def __init__(self, store, previous=None):
+        self.store = store
+        self.previous = previous or {}
+        self.files_reused = 0
+        self.chunks_reused = 0
+        self.chunks_read = 0
+
+    def snapshot_file(self, path, relpath):
+        stat = os.stat(path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        previous = self.previous.get(relpath)
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            self.files_reused += 1
+            return previous
+
+        with open(path, 'rb') as f:
+            if path.endswith('.mca') and stat.st_size >= HEADER_SIZE:
+                entry['region'] = self._snapshot_region(f, stat.st_size, (previous or {}).get('region'))
+            else:
+                blobs = []
+                while True:
+                    block = f.read(BLOB_SIZE)
+                    if not block:
+                        break
+                    blobs.append(self.store.add(block))
+                entry['blobs'] = blobs
+        return entry
+
+    def _snapshot_region(self, f, size, previous):
+        header, slots = read_region_header(f)
+        # index -> [index, sector, sectors, timestamp, hash]
+        known = {chunk[0]: chunk for chunk in (previous or {}).get('chunks', [])}
+        chunks = []
+        for index, (sector, sectors, timestamp) in enumerate(slots):
+            if sector < 2 or sectors == 0 or sector * SECTOR >= size:
+                continue
+            old = known.get(index)
+            if old and old[1:4] == [sector, sectors, timestamp]:
+                self.chunks_reused += 1
+                chunks.append(old)
+                continue
+            f.seek(sector * SECTOR)
+            length, compression = _CHUNK_LENGTH.unpack(f.read(_CHUNK_LENGTH.size))
+            f.seek(sector * SECTOR)
+            data = f.read(min(length + 4, sectors * SECTOR))
+            self.chunks_read += 1
+            digest = self.store.add(data, compress=(compression & 0x7F) not in COMPRESSED_CHUNK_TYPES)
+            chunks.append([index, sector, sectors, timestamp, digest])
+        return {'header': self.store.add(header), 'chunks': chunks}
+
+
+def world_paths(server_dir):
+    """The world folders and config files of the server, relative to `server_dir`."""
+    level_name = 'world'
+    properties_path = os.path.join(server_dir, 'server.properties')
+    if os.path.exists(properties_path):
+        level_name = read_properties(properties_path).get('level-name', 'world') or 'world'
+
+    paths = []
+    for name in (level_name, f"{level_name}_nether", f"{level_name}_the_end"):
+        directory = os.path.join(server_dir, name)
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for file in sorted(files):
+                # session.lock is held open by the server and meaningless in a backup
+                if file != 'session.lock':
+                    paths.append(os.path.relpath(os.path.join(root, file), server_dir))
+    paths.extend(name for name in CONFIG_FILES if os.path.exists(os.path.join(server_dir, name)))
+    return paths
+
+
+def list_snapshots(target):
+    return [name[len('snapshots/'):-len('.json')] for name in target.list('snapshots') if name.endswith('.json')]
+
+
+def load_snapshot(target, name=None):
+    names = list_snapshots(target)
+    if not names:
+        return None
+    name = name or names[-1]
+    return json.loads(target.get(f"snapshots/{name}.json"))
+
+
+def create_snapshot(server_dir, target, hot=False):
+    """Snapshot the world in `server_dir` to `target` and return the manifest."""
+    started = time.monotonic()
+    store = ObjectStore(target)
+    previous = load_snapshot(target)
+    snapshotter = Snapshotter(store, previous['files'] if previous else None)
+
+    files = {}
+    for relpath in world_paths(server_dir):
+        try:
+            files[relpath] = snapshotter.snapshot_file(os.path.join(server_dir, relpath), relpath)
+        except FileNotFoundError:
+            # The server may delete files (e.g. old player data) while we walk the tree
+            logging.warning(f"{relpath} disappeared during the backup")
+    store.flush()
+
+    created = datetime.now(timezone.utc)
+    manifest = {
+        'name': created.strftime('%Y%m%dT%H%M%SZ'),
+        'created': created.isoformat(),
+        'hot': hot,
+        'files': files,
+    }
+    target.put_bytes(f"snapshots/{manifest['name']}.json", json.dumps(manifest).encode())
+    logging.info(f"snapshot {manifest['name']}: {len(files)} files ({snapshotter.files_reused} unchanged), "
+                 f"{snapshotter.chunks_read} chunks read ({snapshotter.chunks_reused} reused), "
+                 f"{store.new_objects} new objects, {store.bytes_written / 1e6:.1f} MB written "
+                 f"in {time.monotonic() - started:.1f}s")
+    return manifest
+
+
+def referenced_objects(manifest):
+    """Hashes of every object a snapshot is made of."""
+    digests = set()
+    for entry in manifest['files'].values():
+        digests.update(entry.get('blobs', ()))
+        region = entry.get('region')
+        if region:
+            digests.add(region['header'])
+            digests.update(chunk[4] for chunk in region['chunks'])
+    return digests
+
+
+def select_snapshots(names, keep_last=24, keep_daily=7, keep_weekly=4):
+    """The snapshots to keep: the latest `keep_last`, and the newest of each of the last days and weeks."""
+    newest_first = sorted(names, reverse=True)
+    keep = set(newest_first[:keep_last])
+    days, weeks = set(), set()
+    for name in newest_first:
+        created = datetime.strptime(name, '%Y%m%dT%H%M%SZ')
+        day, week = created.date(), created.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.add(day)
+            keep.add(name)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.add(week)
+            keep.add(name)
+    return keep
+
+
+def prune(target, keep_last=24, keep_daily=7, keep_weekly=4, min_live=0.5):
+    """Delete the snapshots the keep policy drops, then the packs nothing references any more.
+
+    A pack whose live objects are under `min_live` of its size is
+    rewritten with just those. New packs are written before old ones are
+    deleted, and a pack's index before the pack, so an interrupted prune
+    never leaves a snapshot with missing objects.
+    """
+    names = list_snapshots(target)
+    keep = select_snapshots(names, keep_last, keep_daily, keep_weekly)
+    for name in names:
+        if name not in keep:
+            target.delete(f"snapshots/{name}.json")
+    referenced = set()
+    for name in keep:
+        referenced |= referenced_objects(load_snapshot(target, name))
+
+    store = ObjectStore(target)
+    # pack -> {hash: (length, codec)}; an object may be in more than one pack
+    packs = {}
+    for name in target.list('packs'):
+        if name.endswith('.idx'):
+            packs[name[:-len('.idx')] + '.pack'] = {digest: (length, codec) for digest, (_, length, codec)
+                                                    in json.loads(target.get(name)).items()}
+    dead, sparse = [], []
+    for pack, objects in packs.items():
+        live = sum(length for digest, (length, _) in objects.items() if digest in referenced)
+        if live == 0:
+            dead.append(pack)
+        elif live < min_live * sum(length for length, _ in objects.values()):
+            sparse.append(pack)
+
+    if sparse:
+        writer = ObjectStore(target)
+        for pack in sparse:
+            for digest, (_, codec) in packs[pack].items():
+                if digest in referenced:
+                    writer.objects.pop(digest, None)
+                    writer.add(store.get(digest), compress=codec == 'zlib')
+        writer.flush()
+    for pack in dead + sparse:
+        target.delete(pack[:-len('.pack')] + '.idx')
+        target.delete(pack)
+    logging.info(f"pruned {len(names) - len(keep)} snapshots, deleted {len(dead)} packs, rewrote {len(sparse)}")
+    return {'snapshots': len(names) - len(keep), 'deleted_packs': len(dead), 'rewritten_packs': len(sparse)}
+
+
+@contextmanager
+def locked(location):
+    """Hold an exclusive lock on the backup store at `location`, waiting for any other writer."""
+    if location.startswith('s3://'):
+        # Only writers on this VM are serialised
+        name = hashlib.sha256(location.encode()).hexdigest()[:16]
+        path = os.path.join(tempfile.gettempdir(), f"mctools-backup-{name}.lock")
+    else:
+        os.makedirs(location, exist_ok=True)
+        path = os.path.join(location, '.lock')
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def restore_snapshot(target, manifest, dest):
+    """Rebuild the files of `manifest` under `dest`."""
+    store = ObjectStore(target)
+    for relpath, entry in manifest['files'].items():
+        path = os.path.join(dest, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'wb') as f:
+            if 'region' in entry:
+                f.write(store.get(entry['region']['header']))
+                for _, sector, _, _, digest in entry['region']['chunks']:
+                    f.seek(sector * SECTOR)
+                    f.write(store.get(digest))
+                f.truncate(entry['size'])
+            else:
+                for digest in entry['blobs']:
+                    f.write(store.get(digest))
+        os.replace(path + '.part', path)
+        os.utime(path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+    logging.info(f"restored {len(manifest['files'])} files from {manifest['name']} to {dest}")
+
+
+async def backup(args):
+    target = open_target(args.target)
+    if args.offline:
+        return create_snapshot(args.server_dir, target)
+
+    properties = read_properties(os.path.join(args.server_dir, 'server.properties'))
+    rcon = RconClient('127.0.0.1', int(properties.get('rcon.port', 25575)), properties.get('rcon.password', ''), timeout=10)
+    try:
+        await rcon.connect(timeout=5)
+    except Exception as e:
+        # A stopped server has already written everything to disk
+        logging.info(f"RCON unavailable ({e}); assuming the world is not being written")
+        return create_snapshot(args.server_dir, target)
+
+    try:
+        await rcon.run('save-off')
+        await rcon.run('save-all flush', timeout=120)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, create_snapshot, args.server_dir, target, True)
+    finally:
+        try:
+            await rcon.run('save-on')
+        except Exception as e:
+            logging.error(f"Could not re-enable saving: {e}")
+        await rcon.close()
+
+
+def write_status(path, status):
+    # The status is only informational; never fail a backup over it
+    try:
+        temp = path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(status, f)
+        os.replace(temp, path)
+    except OSError as e:
+        logging.error(f"Could not write backup status to {path}: {e}")
+
+
+def backup_route(status_path=DEFAULT_STATUS_PATH):
+    """A mctools.webserver route handler that serves the status of the last backup."""
+    def handler(query):
+        try:
+            with open(status_path) as f:
+                return webserver.json_response(json.load(f))
+        except FileNotFoundError:
+            return webserver.json_response({'state': 'idle'})
+    return handler
+
+
+# Helper used by the Discord bots to follow a backup
+
+async def fetch_backup(host, port=25580, timeout=5):
+    import aiohttp
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async with session.get(f"http://{host}:{port}/backup") as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental Minecraft world backups.')
+    parser.add_argument('--target', default=os.environ.get('MC_BACKUP_TARGET', '/home/minecraft/backups'),
+                        help='backup directory or s3://bucket/prefix (default $MC_BACKUP_TARGET)')
+    parser.add_argument('--keep-last', type=int, default=24, help='snapshots always kept (default 24)')
+    parser.add_argument('--keep-daily', type=int, default=7, help='days to keep the newest snapshot of (default 7)')
+    parser.add_argument('--keep-weekly', type=int, default=4, help='weeks to keep the newest snapshot of (default 4)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create = subparsers.add_parser('create', help='take a snapshot')
+    create.add_argument('--server-dir', default='/home/minecraft/server')
+    create.add_argument('--offline', action='store_true', help='do not pause saving over RCON (server is stopped)')
+    create.add_argument('--status', default=DEFAULT_STATUS_PATH, help='status file served at /backup by the telemetry service')
+    create.add_argument('--skip-after-crash', action='store_true',
+                        help="as an ExecStopPost, do nothing unless the service stopped cleanly ($SERVICE_RESULT)")
+    create.add_argument('--no-prune', action='store_true', help='keep every snapshot')
+
+    subparsers.add_parser('list', help='list snapshots')
+    subparsers.add_parser('prune', help='apply the keep policy and delete unused packs')
+
+    restore = subparsers.add_parser('restore', help='rebuild a snapshot into a directory')
+    restore.add_argument('dest')
+    restore.add_argument('--snapshot', help='snapshot name (default: the latest)')
+    return parser.parse_args(argv)
+
+
+def main(args):
+    if args.command == 'create':
+        result = os.environ.get('SERVICE_RESULT', 'success')
+        if args.skip_after_crash and result != 'success':
+            # systemd restarts the server; a backup now would only delay that
+            logging.info(f"server stopped with {result} (exit status {os.environ.get('EXIT_STATUS')}); no backup")
+            return
+        with locked(args.target):
+            status = {'state': 'running', 'offline': args.offline, 'started_at': time.time()}
+            write_status(args.status, status)
+            try:
+                manifest = asyncio.run(backup(args))
+            except Exception as e:
+                write_status(args.status, dict(status, state='failed', error=str(e), finished_at=time.time()))
+                raise
+            if not args.no_prune:
+                try:
+                    prune(open_target(args.target), args.keep_last, args.keep_daily, args.keep_weekly)
+                except Exception as e:
+                    # The snapshot itself is safe
+                    logging.error(f"Pruning old snapshots failed: {e}")
+            write_status(args.status, dict(status, state='done', snapshot=manifest['name'], finished_at=time.time()))
+    elif args.command == 'prune':
+        with locked(args.target):
+            prune(open_target(args.target), args.keep_last, args.keep_daily, args.keep_weekly)
+    elif args.command == 'list':
+        target = open_target(args.target)
+        for name in list_snapshots(target):
+            print(name)
+    elif args.command == 'restore':
+        target = open_target(args.target)
+        manifest = load_snapshot(target, args.snapshot)
+        if manifest is None:
+            raise SystemExit(f"no snapshots in {args.target}")
+        restore_snapshot(target, manifest, args.dest)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    main(parse_args())
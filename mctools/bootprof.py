@@ -0,0 +1,296 @@
+"""Boot-time profiler for the Minecraft server.
+
+Most of the wait behind `!startmc` is the time from `systemctl start
+minecraft` until players can join. This profiler splits each boot into
+phases:
+- launcher: mctools.jvm_launcher sizing the JVM, up to the exec of java
+- jvm: JVM start up to the server's first log line (Paperclip patching, bundler unpacking)
+- libraries: loading libraries and mods, up to "Starting minecraft server version"
+- server_init: properties, plugins and data packs, up to "Preparing level"
+- world: loading the world and preparing the spawn area, up to "Done (Ns)!"
+
+The launcher writes a marker file with its start time, the exec time and
+the log offset the server's output starts at. `python3 -m mctools.bootprof
+record` (see services/minecraft-bootprof.service) starts together with
+minecraft.service. It reads the marker and tails the log from that offset,
+timestamping each line as it arrives. Lines that were already written
+when it got there are placed by their HH:MM:SS stamp instead, so phases
+are accurate to about a second in the worst case.
+
+Every boot is appended to a history file and compared with the median of
+the previous comparable boots (same flavour and fast-boot setting). Phases
+that got markedly slower are flagged as regressions. mctools.telemetry
+serves the history at /boot, where the bots read it for `!boot` and
+regression alerts.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from mctools import webserver
+from mctools.serverlog import TIME_RE, DONE_RE, CRASH_RE
+
+DEFAULT_MARKER_PATH = '/home/minecraft/boot-launch.json'
+DEFAULT_HISTORY_PATH = '/home/minecraft/boot-history.json'
+# Lines the launcher itself writes to the server log
+LAUNCHER_PREFIX = 'mctools.jvm_launcher:'
+
+PHASES = ('launcher', 'jvm', 'libraries', 'server_init', 'world')
+# Log lines that end each phase after the first line, in boot order
+PHASE_MARKERS = [
+    ('libraries', re.compile(r'Starting minecraft server version')),
+    ('server_init', re.compile(r'Preparing level')),
+    ('world', DONE_RE),
+]
+
+
+def write_marker(path, **fields):
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump(fields, f)
+    os.replace(temp, path)
+
+
+def log_time(line, reference):
+    """Epoch time of a line's HH:MM:SS stamp, on the day closest to `reference`, or None."""
+    match = TIME_RE.match(line)
+    if not match:
+        return None
+    clock = datetime.strptime(match.group(1), '%H:%M:%S').time()
+    stamped = datetime.combine(datetime.fromtimestamp(reference).date(), clock).timestamp()
+    # The boot may have crossed midnight
+    if stamped < reference - 43200:
+        stamped += 86400
+    return stamped
+
+
+class BootRecorder:
+    def __init__(self, marker):
+        self.marker = marker
+        # Phase name -> time the phase ended
+        self.marks = {'launcher': marker['exec_at']}
+        self.reported_seconds = None
+        self.outcome = None
+
+    def feed(self, line, arrival):
+        """Take one log line read at `arrival`; returns True once the boot has finished or crashed."""
+        if not line.strip() or line.startswith(LAUNCHER_PREFIX):
+            return False
+        stamped = log_time(line, self.marker['exec_at'])
+        # A stamp only has whole seconds, so the line was written before stamped + 1
+        when = arrival if stamped is None else min(arrival, stamped + 1)
+        self.marks.setdefault('jvm', when)
+        for phase, pattern in PHASE_MARKERS:
+            match = pattern.search(line)
+            if match and phase not in self.marks:
+                self.marks[phase] = when
+                if phase == 'world':
+                    self.reported_seconds = float(match.group('seconds'))
+                    self.outcome = 'done'
+                    return True
+        if CRASH_RE.search(line):
+            self.outcome = 'crashed'
+            return True
+        return False
+
+    def record(self):
+        """The boot as a history entry; a phase whose end was not seen is merged into the next one."""
+        phases = {}
+        previous = self.marker['launched_at']
+        for phase in PHASES:
+            if phase in self.marks:
+                phases[phase] = round(self.marks[phase] - previous, 3)
+                previous = self.marks[phase]
+            else:
+                phases[phase] = None
+        return {
+            'launched_at': self.marker['launched_at'],
+            'outcome': self.outcome or 'timeout',
+            'total': round(previous - self.marker['launched_at'], 3),
+            'reported_seconds': self.reported_seconds,
+            'phases': phases,
+            'flavour': self.marker.get('flavour'),
+            'java_version': self.marker.get('java_version'),
+            'heap_mb': self.marker.get('heap_mb'),
+            'fast_boot': self.marker.get('fast_boot', False),
+        }
+
+
+def follow_boot(marker, log_path, poll_interval=0.1, timeout=900):
+    """Tail the log from the marker's offset until the boot finishes; returns the history entry."""
+    recorder = BootRecorder(marker)
+    give_up_at = time.monotonic() + timeout
+    while not os.path.exists(log_path) and time.monotonic() < give_up_at:
+        time.sleep(poll_interval)
+    with open(log_path, 'rb') as f:
+        f.seek(marker.get('log_offset') or 0)
+        pending = b''
+        while time.monotonic() < give_up_at:
+            chunk = f.read()
+            if not chunk:
+                time.sleep(poll_interval)
+                continue
+            arrival = time.time()
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if recorder.feed(line.decode('utf-8', 'replace'), arrival):
+                    return recorder.record()
+    return recorder.record()
+
+
+def wait_for_marker(path, since, timeout=120, poll_interval=0.2):
+    """The launcher's marker for a boot started after `since`, or None."""
+    give_up_at = time.monotonic() + timeout
+    while time.monotonic() < give_up_at:
+        try:
+            with open(path) as f:
+                marker = json.load(f)
+            if marker.get('launched_at', 0) >= since:
+                return marker
+        except (FileNotFoundError, ValueError):
+            pass
+        time.sleep(poll_interval)
+    return None
+
+
+class BootHistory:
+    def __init__(self, path=DEFAULT_HISTORY_PATH, limit=100, window=10, tolerance=0.25, min_seconds=5.0):
+        self.path = path
+        self.limit = limit
+        # Previous boots the median baseline is taken over
+        self.window = window
+        # A phase regresses when it is this much slower than its baseline, and by at least min_seconds
+        self.tolerance = tolerance
+        self.min_seconds = min_seconds
+        self.boots = []
+        try:
+            with open(path) as f:
+                self.boots = json.load(f).get('boots', [])
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def save(self):
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'boots': self.boots}, f)
+        os.replace(temp, self.path)
+
+    def baseline(self, boot):
+        """Median total and phase times of the previous comparable boots, or None without any."""
+        comparable = [b for b in self.boots if b['outcome'] == 'done' and b is not boot
+                      and b.get('flavour') == boot.get('flavour') and b.get('fast_boot') == boot.get('fast_boot')]
+        comparable = comparable[-self.window:]
+        if not comparable:
+            return None
+        baseline = {'boots': len(comparable), 'total': statistics.median(b['total'] for b in comparable), 'phases': {}}
+        for phase in PHASES:
+            values = [b['phases'][phase] for b in comparable if b['phases'].get(phase) is not None]
+            baseline['phases'][phase] = statistics.median(values) if values else None
+        return baseline
+
+    def add(self, boot):
+        baseline = self.baseline(boot)
+        regressions = {}
+        if baseline and boot['outcome'] == 'done':
+            measured = {'total': (boot['total'], baseline['total'])}
+            measured.update((phase, (boot['phases'][phase], baseline['phases'][phase])) for phase in PHASES)
+            for name, (seconds, expected) in measured.items():
+                if seconds is not None and expected is not None \
+                        and seconds > expected * (1 + self.tolerance) and seconds - expected >= self.min_seconds:
+                    regressions[name] = {'seconds': seconds, 'baseline': expected}
+        boot['baseline'] = baseline
+        boot['regressions'] = regressions
+        self.boots.append(boot)
+        del self.boots[:-self.limit]
+        self.save()
+        return boot
+
+
+def boot_route(history_path=DEFAULT_HISTORY_PATH):
+    """A mctools.webserver route handler that serves the boot history."""
+    def handler(query):
+        boots = BootHistory(history_path).boots
+        limit = int(query.get('limit', ['10'])[0])
+        return webserver.json_response({'boots': boots[-limit:]})
+    return handler
+
+
+# Helpers used by the Discord bots to read and present the history
+
+async def fetch_boot(host, port=25580, timeout=5):
+    import aiohttp
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async with session.get(f"http://{host}:{port}/boot") as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+def format_regressions(boot):
+    return ', '.join(f"{name} {r['seconds']:.1f}s (usually {r['baseline']:.1f}s)" for name, r in boot['regressions'].items())
+
+
+def format_boot(history):
+    if not history['boots']:
+        return 'No boots recorded yet.'
+    boot = history['boots'][-1]
+    started = datetime.fromtimestamp(boot['launched_at'])
+    lines = [f"**Last boot** ({started:%a %H:%M}, {boot['flavour']}{', fast boot' if boot['fast_boot'] else ''}): "
+             f"{boot['outcome']} after {boot['total']:.1f}s"]
+    baseline = boot.get('baseline') or {'phases': {}}
+    for phase in PHASES:
+        seconds = boot['phases'].get(phase)
+        if seconds is None:
+            continue
+        usual = baseline['phases'].get(phase)
+        lines.append(f"{phase}: {seconds:.1f}s" + (f" (median {usual:.1f}s)" if usual is not None else ''))
+    if boot.get('regressions'):
+        lines.append(f"⚠️ Slower than usual: {format_regressions(boot)}")
+    recent = [f"{b['total']:.0f}s" for b in history['boots'] if b['outcome'] == 'done']
+    if len(recent) > 1:
+        lines.append(f"Recent boots: {', '.join(recent)}")
+    return '\n'.join(lines)
+
+
+def record(args):
+    marker = wait_for_marker(args.marker, time.time() - args.slack)
+    if marker is None:
+        logging.error(f"no launch marker in {args.marker}; is minecraft.service using mctools.jvm_launcher?")
+        return
+    boot = follow_boot(marker, os.path.join(args.server_dir, 'minecraft-server.log'), timeout=args.timeout)
+    boot = BootHistory(args.history).add(boot)
+    logging.info(f"boot {boot['outcome']} after {boot['total']:.1f}s: {boot['phases']}")
+    if boot['regressions']:
+        logging.warning(f"boot regressions: {format_regressions(boot)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Profile Minecraft server boots.')
+    parser.add_argument('--marker', default=DEFAULT_MARKER_PATH, help='launch marker written by mctools.jvm_launcher')
+    parser.add_argument('--history', default=DEFAULT_HISTORY_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='profile the boot that is starting now')
+    record_parser.add_argument('--server-dir', default='/home/minecraft/server')
+    record_parser.add_argument('--timeout', type=float, default=900, help='seconds to wait for "Done"')
+    record_parser.add_argument('--slack', type=float, default=30,
+                               help='accept a marker written this many seconds before the profiler started')
+
+    subparsers.add_parser('show', help='print the last boot and its baseline')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    args = parse_args()
+    if args.command == 'record':
+        record(args)
+    else:
+        print(format_boot({'boots': BootHistory(args.history).boots}))
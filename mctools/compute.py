@@ -0,0 +1,375 @@
+"""Async cloud compute backends used by the Discord bots.
+
+Every call here is awaitable and never blocks the event loop, so a VM that
+takes two minutes to boot does not stall the rest of the bot. A backend
+is picked per server with `make_backend`: Azure, EC2, or an in-memory
+fake for tests and local development.
+"""
+
+import time
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from mctools.metrics import Counter, Histogram
+
+CLOUD_API_CALLS = Counter('mc_cloud_api_calls_total', 'Cloud compute API calls.', ['provider', 'operation', 'outcome'])
+CLOUD_API_SECONDS = Histogram('mc_cloud_api_call_seconds', 'Cloud compute API call latency.', ['provider', 'operation'])
+
+# Ways to take a server down, from fastest resume to cheapest while stopped:
+# - stop keeps the VM allocated (Azure) or its EBS volume attached (EC2), so the disk is warm
+# - hibernate saves RAM to disk, so the JVM and loaded world resume where they were
+# - deallocate releases the compute entirely
+STOP_MODES = ('stop', 'hibernate', 'deallocate')
+
+
+@contextmanager
+def _cloud_call(provider, operation):
+    started = time.monotonic()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        CLOUD_API_CALLS.inc(provider=provider, operation=operation, outcome=outcome)
+        CLOUD_API_SECONDS.observe(time.monotonic() - started, provider=provider, operation=operation)
+
+
+class CloudClients:
+    """Cloud SDK clients, one per account and region, shared by every backend that uses them.
+
+    A fleet of servers in the same subscription or region then needs a
+    single set of connections and credentials instead of one per server.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._clients = {}
+        self._executor = None
+
+    @property
+    def executor(self):
+        # boto3 is synchronous, so EC2 calls run on a small bounded pool shared by all instances
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ec2')
+        return self._executor
+
+    def _azure_credentials(self, client_id, client_secret, tenant_id):
+        key = ('azure-credentials', client_id, tenant_id)
+        if key not in self._clients:
+            # Imported here so EC2-only deployments do not need the Azure SDK installed
+            from azure.identity.aio import ClientSecretCredential
+            self._clients[key] = ClientSecretCredential(tenant_id=tenant_id, client_id=client_id, client_secret=client_secret)
+        return self._clients[key]
+
+    def azure_compute(self, client_id, client_secret, tenant_id, subscription_id):
+        key = ('azure-compute', client_id, tenant_id, subscription_id)
+        if key not in self._clients:
+            from azure.mgmt.compute.aio import ComputeManagementClient
+            credentials = self._azure_credentials(client_id, client_secret, tenant_id)
+            self._clients[key] = ComputeManagementClient(credentials, subscription_id)
+        return self._clients[key]
+
+    def azure_network(self, client_id, client_secret, tenant_id, subscription_id):
+        key = ('azure-network', client_id, tenant_id, subscription_id)
+        if key not in self._clients:
+            from azure.mgmt.network.aio import NetworkManagementClient
+            credentials = self._azure_credentials(client_id, client_secret, tenant_id)
+            self._clients[key] = NetworkManagementClient(credentials, subscription_id)
+        return self._clients[key]
+
+    def ec2(self, aws_access_key, aws_secret_key, aws_region):
+        key = ('ec2', aws_access_key, aws_region)
+        if key not in self._clients:
+            import boto3
+            self._clients[key] = boto3.client(
+                'ec2',
+                aws_access_key_id=aws_access_key,
+                aws_secret_access_key=aws_secret_key,
+                region_name=aws_region
+            )
+        return self._clients[key]
+
+    async def close(self):
+        # Credentials go last, after the clients that use them
+        for key, client in sorted(self._clients.items(), key=lambda item: item[0][0] == 'azure-credentials'):
+            if key[0].startswith('azure'):
+                try:
+                    await client.close()
+                except Exception as e:
+                    logging.error(f"Error closing Azure client: {e}")
+        self._clients.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class ComputeBackend:
+    """Power operations for a single VM.
+
+    `power_state` returns a short provider-neutral string such as 'running',
+    'starting', 'stopping', 'stopped', 'hibernated' or 'deallocated'. `stop`
+    powers the VM off; `deallocate` also releases its compute so it stops
+    being billed; `hibernate` deallocates but keeps the contents of RAM.
+    """
+
+    provider = None
+
+    async def power_state(self):
+        raise NotImplementedError
+
+    def batch_key(self):
+        """Backends with equal keys can have their power states looked up in one `power_states` call."""
+        return (self.provider, id(self))
+
+    @classmethod
+    async def power_states(cls, backends):
+        """Power states of several backends sharing a batch key, as {backend: state}."""
+        states = await asyncio.gather(*(backend.power_state() for backend in backends))
+        return dict(zip(backends, states))
+
+    async def start(self):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def deallocate(self):
+        raise NotImplementedError
+
+    async def hibernate(self):
+        raise NotImplementedError
+
+    async def shut_down(self, mode='deallocate'):
+        """Take the VM down using one of STOP_MODES."""
+        if mode not in STOP_MODES:
+            raise ValueError(f"unknown stop mode: {mode}")
+        await getattr(self, mode)()
+
+    async def public_ip(self):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class AzureBackend(ComputeBackend):
+    provider = 'azure'
+
+    def __init__(self, client_id, client_secret, tenant_id, subscription_id, resource_group_name, vm_name, clients=None):
+        self.resource_group_name = resource_group_name
+        self.vm_name = vm_name
+        self._owns_clients = clients is None
+        self._clients = clients or CloudClients()
+        self._account = (client_id, client_secret, tenant_id, subscription_id)
+        self._client = self._clients.azure_compute(*self._account)
+
+    async def power_state(self):
+        with _cloud_call(self.provider, 'instance_view'):
+            instance_view = await self._client.virtual_machines.instance_view(self.resource_group_name, self.vm_name)
+        return self._state_from(instance_view.statuses)
+
+    @staticmethod
+    def _state_from(statuses):
+        code = next((status.code for status in statuses or () if status.code.startswith('PowerState/')), None)
+        return code.split('/', 1)[1] if code else 'unknown'
+
+    def batch_key(self):
+        # Backends sharing a client are in the same subscription
+        return (self.provider, id(self._client))
+
+    @classmethod
+    async def power_states(cls, backends):
+        # One paged listing of every VM in the subscription, with only their instance view statuses
+        client = backends[0]._client
+        wanted = {(backend.resource_group_name.lower(), backend.vm_name.lower()): backend for backend in backends}
+        states = {}
+        with _cloud_call(cls.provider, 'list_all'):
+            async for vm in client.virtual_machines.list_all(status_only='true'):
+                resource_group = vm.id.split('/resourceGroups/', 1)[1].split('/', 1)[0].lower()
+                backend = wanted.get((resource_group, vm.name.lower()))
+                if backend is not None:
+                    states[backend] = cls._state_from(vm.instance_view.statuses if vm.instance_view else None)
+        # A VM missing from the listing no longer exists
+        return {backend: states.get(backend, 'unknown') for backend in backends}
+
+    async def _wait(self, operation, **kwargs):
+        with _cloud_call(self.provider, operation):
+            poller = await getattr(self._client.virtual_machines, operation)(self.resource_group_name, self.vm_name, **kwargs)
+            await poller.result()
+
+    async def start(self):
+        await self._wait('begin_start')
+
+    async def stop(self):
+        await self._wait('begin_power_off')
+
+    async def deallocate(self):
+        await self._wait('begin_deallocate')
+
+    async def hibernate(self):
+        # Needs a VM created with hibernation enabled
+        await self._wait('begin_deallocate', hibernate=True)
+
+    async def public_ip(self):
+        network_client = self._clients.azure_network(*self._account)
+        with _cloud_call(self.provider, 'public_ip'):
+            vm = await self._client.virtual_machines.get(self.resource_group_name, self.vm_name)
+            nic_name = vm.network_profile.network_interfaces[0].id.rsplit('/', 1)[1]
+            nic = await network_client.network_interfaces.get(self.resource_group_name, nic_name)
+            public_ip = nic.ip_configurations[0].public_ip_address
+            if public_ip is None:
+                return None
+            address = await network_client.public_ip_addresses.get(
+                self.resource_group_name, public_ip.id.rsplit('/', 1)[1])
+        return address.ip_address
+
+    async def close(self):
+        if self._owns_clients:
+            await self._clients.close()
+
+
+class Ec2Backend(ComputeBackend):
+    provider = 'ec2'
+
+    # EC2 instance states mapped onto the names used by the Azure backend
+    STATES = {
+        'pending': 'starting',
+        'running': 'running',
+        'stopping': 'stopping',
+        'shutting-down': 'stopping',
+        'stopped': 'stopped',
+        'terminated': 'deallocated',
+    }
+
+    def __init__(self, aws_access_key, aws_secret_key, aws_region, instance_id, clients=None):
+        self.instance_id = instance_id
+        self._owns_clients = clients is None
+        self._clients = clients or CloudClients()
+        self._client = self._clients.ec2(aws_access_key, aws_secret_key, aws_region)
+        self._executor = self._clients.executor
+
+    async def _call(self, method, **kwargs):
+        loop = asyncio.get_running_loop()
+        with _cloud_call(self.provider, method):
+            return await loop.run_in_executor(self._executor, functools.partial(getattr(self._client, method), **kwargs))
+
+    async def power_state(self):
+        return (await self.power_states([self]))[self]
+
+    def batch_key(self):
+        # Backends sharing a client are in the same account and region
+        return (self.provider, id(self._client))
+
+    @classmethod
+    async def power_states(cls, backends):
+        names = {}
+        # describe_instance_status takes up to 100 instance IDs per call
+        for i in range(0, len(backends), 100):
+            batch = backends[i:i + 100]
+            response = await batch[0]._call('describe_instance_status', IncludeAllInstances=True,
+                                            InstanceIds=[backend.instance_id for backend in batch])
+            for status in response['InstanceStatuses']:
+                names[status['InstanceId']] = status['InstanceState']['Name']
+        # An instance missing from the response (terminated and gone, or a wrong ID) cannot be started
+        return {backend: cls.STATES.get(names.get(backend.instance_id), 'unknown') for backend in backends}
+
+    async def start(self):
+        await self._call('start_instances', InstanceIds=[self.instance_id])
+
+    async def stop(self):
+        await self._call('stop_instances', InstanceIds=[self.instance_id])
+
+    async def deallocate(self):
+        # A stopped EC2 instance already releases its host and is not billed for compute
+        await self.stop()
+
+    async def hibernate(self):
+        # Needs an instance launched with hibernation enabled and an encrypted root volume
+        await self._call('stop_instances', InstanceIds=[self.instance_id], Hibernate=True)
+
+    async def public_ip(self):
+        response = await self._call('describe_instances', InstanceIds=[self.instance_id])
+        instances = [i for r in response['Reservations'] for i in r['Instances']]
+        return instances[0].get('PublicIpAddress') if instances else None
+
+    async def close(self):
+        if self._owns_clients:
+            await self._clients.close()
+
+
+class FakeBackend(ComputeBackend):
+    """In-memory backend that simulates power transitions, for tests and local runs.
+
+    `resume_delays` maps the state a start begins from ('stopped',
+    'hibernated', 'deallocated') to how long it takes, so stop modes with
+    different resume times can be compared; other starts take `start_delay`.
+    """
+
+    provider = 'fake'
+
+    def __init__(self, state='stopped', start_delay=0.0, stop_delay=0.0, ip='127.0.0.1', resume_delays=None):
+        self.state = state
+        self.start_delay = start_delay
+        self.stop_delay = stop_delay
+        self.resume_delays = resume_delays or {}
+        self.ip = ip
+        # Names of the operations called, in order
+        self.calls = []
+
+    async def _transition(self, operation, via, target, delay):
+        self.calls.append(operation)
+        with _cloud_call(self.provider, operation):
+            self.state = via
+            await asyncio.sleep(delay)
+            self.state = target
+
+    async def power_state(self):
+        self.calls.append('power_state')
+        return self.state
+
+    def batch_key(self):
+        return (self.provider,)
+
+    @classmethod
+    async def power_states(cls, backends):
+        for backend in backends:
+            backend.calls.append('power_states')
+        return {backend: backend.state for backend in backends}
+
+    async def start(self):
+        await self._transition('start', 'starting', 'running', self.resume_delays.get(self.state, self.start_delay))
+
+    async def stop(self):
+        await self._transition('stop', 'stopping', 'stopped', self.stop_delay)
+
+    async def deallocate(self):
+        await self._transition('deallocate', 'deallocating', 'deallocated', self.stop_delay)
+
+    async def hibernate(self):
+        await self._transition('hibernate', 'hibernating', 'hibernated', self.stop_delay)
+
+    async def public_ip(self):
+        self.calls.append('public_ip')
+        return self.ip if self.state == 'running' else None
+
+
+def make_backend(provider, settings, clients=None):
+    """Create the backend for `provider` from a mapping of config.py-style settings.
+
+    Backends given the same `clients` share their SDK clients; without it
+    each backend owns (and closes) its own.
+    """
+    if provider == 'azure':
+        return AzureBackend(settings['client_id'], settings['client_secret'], settings['tenant_id'],
+                            settings['subscription_id'], settings['resource_group_name'], settings['vm_name'],
+                            clients=clients)
+    if provider == 'ec2':
+        return Ec2Backend(settings['aws_access_key'], settings['aws_secret_key'], settings['aws_region'],
+                          settings['ec2_instance_id'], clients=clients)
+    if provider == 'fake':
+        return FakeBackend(settings.get('fake_state', 'stopped'), settings.get('fake_start_delay', 0.0),
+                           settings.get('fake_stop_delay', 0.0), resume_delays=settings.get('fake_resume_delays'))
+    raise ValueError(f"unknown cloud provider: {provider}")
@@ -0,0 +1,62 @@
+"""Single-flight coordination of server power operations.
+
+Only one start or stop runs per server at a time. A caller that asks for
+the operation already in flight attaches to it and receives the same
+result; a caller that asks for the opposite operation is rejected with
+`TransitionConflict` instead of racing it.
+"""
+
+import time
+import asyncio
+
+
+class TransitionConflict(Exception):
+    def __init__(self, current, requested):
+        super().__init__(f"cannot {requested} while a {current} is in progress")
+        self.current = current
+        self.requested = requested
+
+
+class PowerCoordinator:
+    OPERATIONS = ('start', 'stop')
+
+    def __init__(self):
+        # Name of the operation in flight ('start' or 'stop'), or None when idle
+        self.operation = None
+        # time.monotonic() when the operation in flight began
+        self.started_at = None
+        self._task = None
+
+    @property
+    def busy(self):
+        return self.operation is not None
+
+    async def run(self, operation, factory):
+        """Run `factory()` as `operation` unless it is already in flight.
+
+        Returns `(result, joined)`, where `joined` is True if this caller
+        attached to an operation started by someone else.
+        """
+        if operation not in self.OPERATIONS:
+            raise ValueError(f"unknown operation: {operation}")
+
+        joined = self._task is not None
+        if joined and self.operation != operation:
+            raise TransitionConflict(self.operation, operation)
+        if not joined:
+            self.operation = operation
+            self.started_at = time.monotonic()
+            self._task = asyncio.ensure_future(factory())
+            self._task.add_done_callback(self._finished)
+
+        # Shield so one requester being cancelled does not abort the shared operation
+        return await asyncio.shield(self._task), joined
+
+    def _finished(self, task):
+        if task is self._task:
+            self.operation = None
+            self.started_at = None
+            self._task = None
+        if not task.cancelled():
+            # Mark the exception as retrieved if every requester went away
+            task.exception()
@@ -0,0 +1,175 @@
+"""Predicting when the server will be wanted, so it can be started early.
+
+Demand is tracked per hour of the week (168 buckets). When an hour ends,
+its bucket is updated with whether anyone wanted the server in that hour:
+a `!startmc`, or players seen online. Older weeks are decayed
+exponentially, so a bucket's score is a recency-weighted probability of
+demand. Each update is O(1) and the whole model is a few KB of JSON.
+
+Shortly before an hour whose probability crosses the threshold, the bot
+starts the VM. Each warm-up is scored afterwards:
+- a hit if someone shows up while it is warm
+- a miss if nobody does before it is shut down again
+Both the idle minutes spent waiting and the cold-start time saved are
+added up, so the cost of warming can be weighed against the latency it
+saves.
+"""
+
+import os
+import json
+import time
+from datetime import datetime, timedelta
+
+HOURS_PER_WEEK = 7 * 24
+
+
+class DemandPredictor:
+    def __init__(self, path=None, half_life_weeks=4, threshold=0.5, lead=300, hit_window=7200, tz=None):
+        self.path = path
+        self.decay = 0.5 ** (1 / half_life_weeks)
+        self.threshold = threshold
+        # Seconds before a predicted hour to start the VM
+        self.lead = lead
+        # How long a warm-up waits for someone to show up before it counts as a miss
+        self.hit_window = hit_window
+        self.tz = tz
+        # [decayed demand, decayed observations] per hour of the week
+        self.buckets = [[0.0, 0.0] for _ in range(HOURS_PER_WEEK)]
+        self.hour = None
+        self.active = False
+        # The warm-up currently waiting for players: {'started', 'ready', 'ready_seconds'}
+        self.warm = None
+        self.last_warm = 0.0
+        self.stats = {'warmups': 0, 'hits': 0, 'misses': 0, 'cold_starts': 0,
+                      'idle_warm_minutes': 0.0, 'latency_saved_seconds': 0.0}
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            saved = json.load(f)
+        self.buckets = saved.get('buckets', self.buckets)
+        self.hour = saved.get('hour')
+        self.active = saved.get('active', False)
+        self.warm = saved.get('warm')
+        self.last_warm = saved.get('last_warm', 0.0)
+        self.stats.update(saved.get('stats', {}))
+
+    def save(self):
+        if not self.path:
+            return
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'buckets': self.buckets, 'hour': self.hour, 'active': self.active,
+                       'warm': self.warm, 'last_warm': self.last_warm, 'stats': self.stats}, f)
+        os.replace(temp, self.path)
+
+    def bucket(self, when):
+        local = datetime.fromtimestamp(when, self.tz)
+        return local.weekday() * 24 + local.hour
+
+    def probability(self, bucket):
+        demand, observations = self.buckets[bucket]
+        return demand / observations if observations else 0.0
+
+    def _advance(self, when):
+        """Fold the hour that just ended into its bucket."""
+        hour = int(when // 3600)
+        if self.hour is not None and hour != self.hour:
+            bucket = self.buckets[self.bucket(self.hour * 3600)]
+            bucket[0] = bucket[0] * self.decay + (1.0 if self.active else 0.0)
+            bucket[1] = bucket[1] * self.decay + 1.0
+            self.active = False
+        self.hour = hour
+
+    def observe(self, players, power_state, when=None):
+        """Called about once a minute with the server's state; settles the current warm-up."""
+        when = time.time() if when is None else when
+        self._advance(when)
+        if players:
+            self.active = True
+        if self.warm is not None:
+            if players:
+                self._settle(when, hit=True)
+            elif power_state not in ('running', 'starting') or when - self.warm['ready'] > self.hit_window:
+                self._settle(when, hit=False)
+        self.save()
+
+    def on_start_request(self, online, when=None):
+        """Record a `!startmc`; returns 'hit' if a warm-up had the server ready, 'cold' if it was off."""
+        when = time.time() if when is None else when
+        self._advance(when)
+        self.active = True
+        outcome = None
+        if online and self.warm is not None:
+            self._settle(when, hit=True)
+            outcome = 'hit'
+        elif not online:
+            self.stats['cold_starts'] += 1
+            outcome = 'cold'
+        self.save()
+        return outcome
+
+    def _settle(self, when, hit):
+        self.stats['idle_warm_minutes'] += max(when - self.warm['ready'], 0) / 60
+        if hit:
+            self.stats['hits'] += 1
+            self.stats['latency_saved_seconds'] += self.warm['ready_seconds']
+        else:
+            self.stats['misses'] += 1
+        self.warm = None
+
+    def next_window(self, now=None, horizon=HOURS_PER_WEEK):
+        """The start time and probability of the next hour predicted to have demand, or None."""
+        now = time.time() if now is None else now
+        start = (int(now // 3600) + 1) * 3600
+        for hours in range(horizon):
+            when = start + hours * 3600
+            probability = self.probability(self.bucket(when))
+            if probability >= self.threshold:
+                return when, probability
+        return None
+
+    def should_warm(self, now=None):
+        now = time.time() if now is None else now
+        upcoming = (int(now // 3600) + 1) * 3600
+        if upcoming - now > self.lead or self.warm is not None:
+            return False
+        # One warm-up per window: do not retry right after one that was just missed
+        if now - self.last_warm < self.hit_window:
+            return False
+        return self.probability(self.bucket(upcoming)) >= self.threshold
+
+    def warm_started(self, started, ready_seconds):
+        """Record a warm-up that had the server ready after `ready_seconds`."""
+        self.warm = {'started': started, 'ready': started + ready_seconds, 'ready_seconds': ready_seconds}
+        self.last_warm = started
+        self.stats['warmups'] += 1
+        self.save()
+
+    def summary(self, now=None):
+        stats = dict(self.stats)
+        settled = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / settled if settled else None
+        window = self.next_window(now)
+        stats['next_window'] = None
+        if window:
+            stats['next_window'] = {'start': datetime.fromtimestamp(window[0], self.tz).isoformat(),
+                                    'probability': window[1]}
+        return stats
+
+
+def format_summary(summary):
+    lines = ['**Warm-up predictions**']
+    if summary['next_window']:
+        start = datetime.fromisoformat(summary['next_window']['start'])
+        lines.append(f"Next predicted window: {start:%a %H:%M} ({summary['next_window']['probability']:.0%} likely)")
+    else:
+        lines.append('No demand window predicted yet.')
+    hit_rate = '–' if summary['hit_rate'] is None else f"{summary['hit_rate']:.0%}"
+    lines.append(f"Warm-ups: {summary['warmups']} ({summary['hits']} hits, {summary['misses']} misses, hit rate {hit_rate})")
+    lines.append(f"Cold starts: {summary['cold_starts']}")
+    lines.append(f"Idle warm time: {timedelta(minutes=round(summary['idle_warm_minutes']))}, "
+                 f"start-up latency saved: {timedelta(seconds=round(summary['latency_saved_seconds']))}")
+    return '\n'.join(lines)
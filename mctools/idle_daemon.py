@@ -0,0 +1,174 @@
+"""Resident idle-shutdown daemon for the Minecraft server VM.
+
+Replaces the per-minute check-minecraft-players.sh timer. It keeps one
+RCON session open and samples the player count on an adaptive interval:
+rarely while people are online, more often as the idle deadline gets
+close. Meanwhile it follows the server log, so a join or leave takes
+effect immediately. Once nobody has been online for the idle limit, and
+the post-boot grace period is over, it saves the world, stops
+minecraft.service and powers the VM off. With `--optimize-world`, the
+stopped world's region files are optimized (mctools.regions) before the
+VM goes down, within a time budget.
+
+Run with `python3 -m mctools.idle_daemon` (see services/minecraft-idle.service).
+"""
+
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import shlex
+import argparse
+
+from mctools.rcon import RconClient
+from mctools.properties import read_properties
+from mctools.serverlog import LogFollower, PlayerJoined, PlayerLeft
+
+PLAYER_COUNT_RE = re.compile(r'There are (\d+)')
+
+
+class IdleMonitor:
+    def __init__(self, rcon, idle_limit=900, boot_grace=300, min_interval=10, max_interval=120, dry_run=False,
+                 optimize_command=None):
+        self.rcon = rcon
+        self.idle_limit = idle_limit
+        self.boot_grace = boot_grace
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.dry_run = dry_run
+        # Run between stopping the server and powering off, e.g. mctools.regions optimize
+        self.optimize_command = optimize_command
+        self.players = 0
+        self.started_at = time.monotonic()
+        self.last_active = self.started_at
+        self._wake = asyncio.Event()
+
+    async def sample(self):
+        """Ask the server for its player count; unreachable counts as empty."""
+        try:
+            response = await self.rcon.run('list')
+        except Exception as e:
+            logging.warning(f"Could not get player count: {e}")
+            return 0
+        match = PLAYER_COUNT_RE.search(response)
+        return int(match.group(1)) if match else 0
+
+    def record(self, players):
+        if players:
+            self.last_active = time.monotonic()
+        if players != self.players:
+            logging.info(f"players connected: {players}")
+        self.players = players
+
+    def idle_for(self):
+        return 0 if self.players else time.monotonic() - self.last_active
+
+    def next_interval(self):
+        if self.players:
+            return self.max_interval
+        # Sample more often as the idle deadline approaches
+        remaining = max(self.idle_limit - self.idle_for(), self.boot_grace - (time.monotonic() - self.started_at))
+        return max(self.min_interval, min(self.max_interval, remaining / 2))
+
+    def on_log_event(self, event):
+        if not isinstance(event, (PlayerJoined, PlayerLeft)):
+            return
+        logging.info(f"{event.player} {'joined' if event.kind == 'join' else 'left'} the game")
+        self.last_active = time.monotonic()
+        if event.kind == 'join':
+            self.record(max(self.players, 1))
+        # Resample right away so the count reflects the change
+        self._wake.set()
+
+    async def watch_log(self, path):
+        async for event in LogFollower(path, from_end=True).events(backfill=False):
+            self.on_log_event(event)
+
+    async def run(self):
+        while True:
+            self.record(await self.sample())
+            booted_for = time.monotonic() - self.started_at
+            if self.idle_for() >= self.idle_limit and booted_for >= self.boot_grace:
+                if await self.shutdown():
+                    return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.next_interval())
+            except asyncio.TimeoutError:
+                pass
+
+    async def shutdown(self):
+        logging.info(f"server has been idle for {int(self.idle_for())} seconds. Initiating shutdown.")
+        try:
+            await self.rcon.run('save-all', timeout=60)
+        except Exception as e:
+            logging.warning(f"save-all failed: {e}")
+
+        # Close the window where someone joined while we were deciding
+        players = await self.sample()
+        if players:
+            logging.info("a player joined during the idle check; cancelling shutdown.")
+            self.record(players)
+            return False
+
+        await self.rcon.close()
+        commands = [['systemctl', 'stop', 'minecraft.service'], ['shutdown', '-h', 'now']]
+        if self.optimize_command:
+            commands.insert(1, self.optimize_command)
+        for command in commands:
+            if self.dry_run:
+                logging.info(f"dry run: would run {' '.join(command)}")
+                continue
+            process = await asyncio.create_subprocess_exec(*command)
+            await process.wait()
+        return True
+
+
+async def main(args):
+    properties_path = os.path.join(args.server_dir, 'server.properties')
+    password = args.rcon_password
+    port = args.rcon_port
+    if os.path.exists(properties_path):
+        properties = read_properties(properties_path)
+        password = password or properties.get('rcon.password', '')
+        port = port or int(properties.get('rcon.port', 25575))
+
+    rcon = RconClient(args.rcon_host, port or 25575, password, timeout=10)
+    optimize_command = None
+    if args.optimize_world:
+        optimize_command = ([sys.executable, '-m', 'mctools.regions', '--server-dir', args.server_dir, 'optimize',
+                             '--budget', str(args.optimize_budget)] + shlex.split(args.optimize_args))
+    monitor = IdleMonitor(rcon, idle_limit=args.idle_limit, boot_grace=args.boot_grace,
+                          min_interval=args.min_interval, max_interval=args.max_interval, dry_run=args.dry_run,
+                          optimize_command=optimize_command)
+    log_task = asyncio.ensure_future(monitor.watch_log(os.path.join(args.server_dir, 'minecraft-server.log')))
+    try:
+        await monitor.run()
+    finally:
+        log_task.cancel()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server-dir', default='/home/minecraft/server')
+    parser.add_argument('--rcon-host', default='127.0.0.1')
+    parser.add_argument('--rcon-port', type=int, default=None, help='defaults to rcon.port from server.properties')
+    parser.add_argument('--rcon-password', default=os.environ.get('MC_RCON_PASSWORD'),
+                        help='defaults to $MC_RCON_PASSWORD, then rcon.password from server.properties')
+    parser.add_argument('--idle-limit', type=int, default=900, help='seconds without players before shutting down')
+    parser.add_argument('--boot-grace', type=int, default=300, help='seconds after start before a shutdown is allowed')
+    parser.add_argument('--min-interval', type=float, default=10)
+    parser.add_argument('--max-interval', type=float, default=120)
+    parser.add_argument('--optimize-world', action='store_true',
+                        help='defragment (and optionally prune/recompress) region files before powering off')
+    parser.add_argument('--optimize-budget', type=float, default=120, help='seconds the world optimization may take')
+    parser.add_argument('--optimize-args', default='', help='extra `mctools.regions optimize` options, e.g. "--recompress server"')
+    parser.add_argument('--dry-run', action='store_true', help='log instead of stopping the server and VM')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,331 @@
+"""Start the Minecraft server with JVM flags sized for the host it runs on.
+
+minecraft.service used to hard-code `-Xms2G -Xmx4G`, which overcommits a
+4 GB VM once metaspace, thread stacks, the page cache and the tooling
+daemons are counted. This launcher reads the host's RAM and CPU count and
+the server flavour, and builds the java command line from them:
+- the heap is what is left after a reserve for the OS and the JVM's
+  off-heap memory (larger for modded servers), with -Xms equal to -Xmx
+- Aikar's G1 flags, with the large-heap variant above 12 GB, or
+  generational ZGC with `--gc zgc` on JDK 21 and newer with 4+ CPUs
+- AlwaysPreTouch, and transparent or hugetlbfs large pages when the
+  kernel offers them
+
+The command line is logged before the launcher replaces itself with java
+(so systemd still sees java as the main process), and `--print` shows it
+without starting anything. A launch marker for mctools.bootprof records
+when the launcher started and where the server's output begins in the log.
+
+`--fast-boot` (or MC_FAST_BOOT=1) trades some warm-up for a shorter boot:
+- an AppCDS archive of the server's classes is created on the first run
+  and mapped on later runs, instead of loading and verifying every class
+  from the jars again. The archive is keyed on the JDK and the server jar,
+  so an upgrade of either starts a new one.
+- the heap is not pre-touched at start.
+`--trim-spawn-chunks` (or MC_TRIM_SPAWN_CHUNKS=1) is a separate fast-boot
+setting, because it changes the world: before starting the server, the
+launcher sets the `spawnChunkRadius` game rule (1.20.5+) to 0 in
+level.dat, so the boot skips preparing the spawn chunks. Spawn chunks
+then no longer stay loaded either.
+
+Run with `python3 -m mctools.jvm_launcher` (see services/minecraft.service).
+"""
+
+import os
+import re
+import sys
+import glob
+import shlex
+import time
+import shutil
+import logging
+import argparse
+import subprocess
+import zipfile
+from stat import S_ISREG
+
+from mctools import nbt
+from mctools.bootprof import DEFAULT_MARKER_PATH, write_marker
+from mctools.properties import read_properties
+
+FLAVOURS = ('paper', 'fabric', 'forge', 'vanilla')
+
+# Kept back from the heap for the kernel, page cache and the mctools daemons (MB)
+OS_RESERVE_MB = 640
+# Off-heap JVM memory (metaspace, code cache, GC structures, direct buffers) as a share of the heap
+OFF_HEAP_FACTOR = {'paper': 0.25, 'vanilla': 0.25, 'fabric': 0.3, 'forge': 0.4}
+# Above this the JVM loses compressed object pointers
+MAX_HEAP_MB = 31 * 1024
+MIN_HEAP_MB = 1024
+
+# https://docs.papermc.io/paper/aikars-flags
+# -XX:+PerfDisableSharedMem is left out: mctools.telemetry reads the heap through jstat, which needs it.
+AIKAR_FLAGS = [
+    '-XX:+UseG1GC',
+    '-XX:+ParallelRefProcEnabled',
+    '-XX:MaxGCPauseMillis=200',
+    '-XX:+UnlockExperimentalVMOptions',
+    '-XX:+DisableExplicitGC',
+    '-XX:G1HeapWastePercent=5',
+    '-XX:G1MixedGCCountTarget=4',
+    '-XX:G1MixedGCLiveThresholdPercent=90',
+    '-XX:SurvivorRatio=32',
+    '-XX:MaxTenuringThreshold=1',
+    '-Dusing.aikars.flags=https://mcflags.emc.gs',
+    '-Daikars.new.flags=true',
+]
+AIKAR_SIZED_FLAGS = {
+    # heap <= 12 GB
+    False: ['-XX:G1NewSizePercent=30', '-XX:G1MaxNewSizePercent=40', '-XX:G1HeapRegionSize=8M',
+            '-XX:G1ReservePercent=20', '-XX:InitiatingHeapOccupancyPercent=15'],
+    True: ['-XX:G1NewSizePercent=40', '-XX:G1MaxNewSizePercent=50', '-XX:G1HeapRegionSize=16M',
+           '-XX:G1ReservePercent=15', '-XX:InitiatingHeapOccupancyPercent=20'],
+}
+
+
+def read_meminfo(path='/proc/meminfo'):
+    """/proc/meminfo as {field: kB}."""
+    info = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            info[key] = int(value.split()[0])
+    return info
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def transparent_hugepages(path='/sys/kernel/mm/transparent_hugepage/enabled'):
+    """The selected THP mode ('always', 'madvise' or 'never'), or None without THP."""
+    try:
+        with open(path) as f:
+            match = re.search(r'\[(\w+)\]', f.read())
+    except OSError:
+        return None
+    return match.group(1) if match else None
+
+
+def java_version(java='java'):
+    """The major version of `java`, e.g. 22 (8 for 1.8.x), or None if it cannot be run."""
+    try:
+        output = subprocess.run([java, '-version'], capture_output=True, text=True, timeout=30).stderr
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+    if not match:
+        return None
+    major = int(match.group(1))
+    return int(match.group(2)) if major == 1 and match.group(2) else major
+
+
+def host_profile(java='java'):
+    meminfo = read_meminfo()
+    return {
+        'memory_mb': meminfo['MemTotal'] // 1024,
+        'hugetlb_mb': meminfo.get('HugePages_Total', 0) * meminfo.get('Hugepagesize', 0) // 1024,
+        'cpus': cpu_count(),
+        'thp': transparent_hugepages(),
+        'java_version': java_version(java),
+    }
+
+
+def detect_flavour(server_dir):
+    """The flavour written by the setup script to .flavour, else a guess from the files in `server_dir`."""
+    try:
+        with open(os.path.join(server_dir, '.flavour')) as f:
+            flavour = f.read().strip().lower()
+        if flavour in FLAVOURS:
+            return flavour
+    except FileNotFoundError:
+        pass
+    if os.path.exists(os.path.join(server_dir, 'fabric-server-launch.jar')):
+        return 'fabric'
+    if glob.glob(os.path.join(server_dir, 'libraries/net/minecraftforge/forge/*')) \
+            or glob.glob(os.path.join(server_dir, 'forge-*.jar')):
+        return 'forge'
+    try:
+        with zipfile.ZipFile(os.path.join(server_dir, 'server.jar')) as jar:
+            names = jar.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return 'vanilla'
+    if any(name.startswith(('io/papermc/', 'META-INF/versions.list')) for name in names):
+        return 'paper'
+    return 'vanilla'
+
+
+def launch_target(server_dir, flavour):
+    """The arguments after the JVM flags that start the server."""
+    if flavour == 'fabric' and os.path.exists(os.path.join(server_dir, 'fabric-server-launch.jar')):
+        return ['-jar', 'fabric-server-launch.jar', 'nogui']
+    if flavour == 'forge':
+        # Forge 1.17+ installs a launcher argument file instead of a runnable jar
+        args_files = sorted(glob.glob(os.path.join(server_dir, 'libraries/net/minecraftforge/forge/*/unix_args.txt')))
+        if args_files:
+            return ['@' + os.path.relpath(args_files[-1], server_dir), 'nogui']
+        jars = sorted(jar for jar in glob.glob(os.path.join(server_dir, 'forge-*.jar')) if 'installer' not in jar)
+        if jars:
+            return ['-jar', os.path.basename(jars[-1]), 'nogui']
+    return ['-jar', 'server.jar', 'nogui']
+
+
+def heap_size_mb(memory_mb, flavour='vanilla'):
+    """Largest heap that leaves room for the OS and the JVM's off-heap memory, in 256 MB steps."""
+    heap = (memory_mb - OS_RESERVE_MB) / (1 + OFF_HEAP_FACTOR.get(flavour, 0.25))
+    heap = int(heap) // 256 * 256
+    return max(MIN_HEAP_MB, min(heap, MAX_HEAP_MB))
+
+
+def gc_flags(gc, heap_mb, java, cpus):
+    if gc == 'zgc':
+        if java is None or java < 21:
+            logging.warning(f"ZGC needs JDK 21 or newer (found {java}); using G1")
+        elif cpus < 4:
+            # ZGC's concurrent threads would compete with the tick thread
+            logging.warning(f"ZGC needs at least 4 CPUs to pay off (found {cpus}); using G1")
+        else:
+            # Generational ZGC is the default from JDK 23
+            return ['-XX:+UseZGC'] + (['-XX:+ZGenerational'] if java < 23 else [])
+    return AIKAR_FLAGS + AIKAR_SIZED_FLAGS[heap_mb > 12 * 1024]
+
+
+def large_page_flags(profile, heap_mb):
+    if profile['hugetlb_mb'] >= heap_mb:
+        # Enough explicitly reserved huge pages for the whole heap
+        return ['-XX:+UseLargePages']
+    if profile['thp'] in ('always', 'madvise'):
+        return ['-XX:+UseTransparentHugePages']
+    return []
+
+
+def cds_flags(server_dir, target, java):
+    """Flags that create the AppCDS archive for `target` on the first run and use it afterwards."""
+    if java is None or java < 13:
+        logging.warning(f"AppCDS archives need JDK 13 or newer (found {java}); booting without one")
+        return []
+    # The jar or Forge argument file that starts the server
+    launched = target[1] if target[0] == '-jar' else target[0].lstrip('@')
+    try:
+        stat = os.stat(os.path.join(server_dir, launched))
+    except FileNotFoundError:
+        logging.warning(f"{launched} not found; booting without an AppCDS archive")
+        return []
+    directory = os.path.join(server_dir, '.cds')
+    os.makedirs(directory, exist_ok=True)
+    archive = os.path.join(directory, f"server-jdk{java}-{stat.st_size}-{stat.st_mtime_ns}.jsa")
+    for name in os.listdir(directory):
+        # Archives for an older JDK or server jar can never be used again
+        if os.path.join(directory, name) != archive:
+            os.remove(os.path.join(directory, name))
+    if java >= 19:
+        # The JVM dumps the archive at exit and recreates it if it no longer matches
+        return ['-XX:+AutoCreateSharedArchive', f'-XX:SharedArchiveFile={archive}']
+    if os.path.exists(archive):
+        return [f'-XX:SharedArchiveFile={archive}']
+    return [f'-XX:ArchiveClassesAtExit={archive}']
+
+
+def build_command(server_dir, profile, flavour, gc='g1', heap_mb=None, java='/usr/bin/java', extra=(),
+                  fast_boot=False):
+    heap_mb = heap_mb or heap_size_mb(profile['memory_mb'], flavour)
+    target = launch_target(server_dir, flavour)
+    return ([java, f'-Xms{heap_mb}M', f'-Xmx{heap_mb}M']
+            # Touching every heap page up front costs boot time on large heaps
+            + ([] if fast_boot else ['-XX:+AlwaysPreTouch'])
+            + gc_flags(gc, heap_mb, profile['java_version'], profile['cpus'])
+            + large_page_flags(profile, heap_mb)
+            + (cds_flags(server_dir, target, profile['java_version']) if fast_boot else [])
+            + list(extra)
+            + target)
+
+
+def trim_spawn_chunks(server_dir):
+    """Set the world's `spawnChunkRadius` game rule to 0 in level.dat; returns True if it changed.
+
+    Worlds from before 1.20.5 have no such rule, and a new world has no
+    level.dat until its first boot; both are left alone.
+    """
+    level_name = 'world'
+    properties_path = os.path.join(server_dir, 'server.properties')
+    if os.path.exists(properties_path):
+        level_name = read_properties(properties_path).get('level-name', 'world') or 'world'
+    path = os.path.join(server_dir, level_name, 'level.dat')
+    if not os.path.exists(path):
+        return False
+    name, root = nbt.read_file(path)
+    data = root[1].get('Data', (nbt.COMPOUND, {}))[1]
+    rules = data.get('GameRules', (nbt.COMPOUND, {}))[1]
+    rule = rules.get('spawnChunkRadius')
+    # Stored as a string, like every game rule in level.dat
+    if rule is None or str(rule[1]) == '0':
+        return False
+    rules['spawnChunkRadius'] = (rule[0], '0' if rule[0] == nbt.STRING else 0)
+    nbt.write_file(path, name, root)
+    return True
+
+
+def log_size():
+    """Size of the log stderr appends to, i.e. where the server's output will start; None if not a file."""
+    try:
+        stat = os.fstat(sys.stderr.fileno())
+    except (OSError, ValueError):
+        return None
+    return stat.st_size if S_ISREG(stat.st_mode) else None
+
+
+def main(args):
+    launched_at = time.time()
+    java = shutil.which(args.java) or args.java
+    profile = host_profile(java)
+    flavour = args.flavour or detect_flavour(args.server_dir)
+    heap_mb = args.heap or heap_size_mb(profile['memory_mb'], flavour)
+    command = build_command(args.server_dir, profile, flavour, gc=args.gc, heap_mb=heap_mb,
+                            java=java, extra=shlex.split(args.extra), fast_boot=args.fast_boot)
+    summary = (f"{profile['memory_mb']} MB RAM, {profile['cpus']} CPUs, JDK {profile['java_version']}, "
+               f"THP {profile['thp']}, {flavour} server{', fast boot' if args.fast_boot else ''}")
+    if args.print:
+        print(f"# {summary}")
+        print(shlex.join(command))
+        return
+    # Goes to minecraft-server.log through the unit's StandardError
+    print(f"mctools.jvm_launcher: {summary}\nmctools.jvm_launcher: {shlex.join(command)}", file=sys.stderr, flush=True)
+    if args.trim_spawn_chunks:
+        try:
+            if trim_spawn_chunks(args.server_dir):
+                print('mctools.jvm_launcher: set the spawnChunkRadius game rule to 0', file=sys.stderr, flush=True)
+        except (OSError, ValueError) as e:
+            logging.warning(f"could not trim spawn chunks: {e}")
+    try:
+        write_marker(args.boot_marker, launched_at=launched_at, exec_at=time.time(), log_offset=log_size(),
+                     flavour=flavour, java_version=profile['java_version'], heap_mb=heap_mb,
+                     fast_boot=args.fast_boot)
+    except OSError as e:
+        logging.warning(f"could not write the boot marker: {e}")
+    os.chdir(args.server_dir)
+    os.execv(command[0], command)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Start the Minecraft server with JVM flags sized for this host.')
+    parser.add_argument('--server-dir', default='/home/minecraft/server')
+    parser.add_argument('--java', default='java')
+    parser.add_argument('--flavour', choices=FLAVOURS, help='default: read .flavour or detect from the server files')
+    parser.add_argument('--gc', choices=('g1', 'zgc'), default='g1', help='zgc needs JDK 21+ and suits large heaps')
+    parser.add_argument('--heap', type=int, help='heap size in MB (default: sized from host RAM)')
+    parser.add_argument('--extra', default='', help='additional JVM flags, e.g. "-Dpaper.playerconnection.keepalive=60"')
+    parser.add_argument('--fast-boot', action='store_true', default=os.environ.get('MC_FAST_BOOT') == '1',
+                        help='use an AppCDS archive and skip heap pre-touching (default $MC_FAST_BOOT=1)')
+    parser.add_argument('--trim-spawn-chunks', action='store_true', default=os.environ.get('MC_TRIM_SPAWN_CHUNKS') == '1',
+                        help='set the spawnChunkRadius game rule to 0 before starting (1.20.5+, default $MC_TRIM_SPAWN_CHUNKS=1)')
+    parser.add_argument('--boot-marker', default=DEFAULT_MARKER_PATH, help='launch marker for mctools.bootprof')
+    parser.add_argument('--print', action='store_true', help='print the command line instead of starting the server')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    main(parse_args())
@@ -0,0 +1,388 @@
+"""Stream a server archive straight into the server directory.
+
+The old migration downloaded the whole zip, unzipped it next to itself
+and then moved the server folder into place. That needs two to three
+times the world size in free disk. Here the zip's central directory is
+read first, using a range request against the end of the file. Then the
+entries are fetched with parallel range requests and inflated straight
+into their final paths, so the archive never touches the disk.
+
+- Every file is checked against the CRC-32 in the archive before it is
+  moved into place.
+- Files already present with the same size and CRC are skipped, so an
+  interrupted migration picks up where it stopped when re-run.
+- Dropbox share links are rewritten to direct downloads (dl=1).
+- The archive must contain a `server` folder with exactly one jar, which
+  is extracted as server.jar.
+
+Usage: `python3 -m mctools.migrate <url or path> [--dest /home/minecraft/server]`
+"""
+
+import os
+import time
+import zlib
+import shutil
+import struct
+import logging
+import argparse
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK = 1 << 20
+# Consecutive small entries are fetched together, up to this many bytes per request
+SPAN_SIZE = 8 << 20
+TAIL_SIZE = 1 << 16
+
+_EOCD = struct.Struct('<4s4H2LH')
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_ZIP64_EOCD = struct.Struct('<4sQ2H2L4Q')
+_CENTRAL = struct.Struct('<4s4B4HL2L5H2L')
+_LOCAL = struct.Struct('<4s2B4HL2L2H')
+
+EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+CENTRAL_SIGNATURE = b'PK\x01\x02'
+LOCAL_SIGNATURE = b'PK\x03\x04'
+
+STORED = 0
+DEFLATED = 8
+
+
+class MigrationError(Exception):
+    pass
+
+
+def direct_url(url):
+    """Turn a Dropbox share link into a direct download link."""
+    parts = urllib.parse.urlsplit(url)
+    if not parts.hostname or not parts.hostname.endswith('dropbox.com'):
+        return url
+    query = [(key, '1' if key == 'dl' else value) for key, value in urllib.parse.parse_qsl(parts.query)]
+    if not any(key == 'dl' for key, _ in query):
+        query.append(('dl', '1'))
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+class HttpSource:
+    """Byte ranges of a remote archive."""
+
+    def __init__(self, url, timeout=60):
+        self.timeout = timeout
+        # Resolve redirects once (Dropbox answers with several) so range requests go straight to the file
+        request = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            self.url = response.geturl()
+            content_range = response.headers.get('Content-Range')
+            self.supports_ranges = response.status == 206 and content_range is not None
+            self.size = int(content_range.rsplit('/', 1)[1]) if self.supports_ranges else None
+
+    def open(self, start, end):
+        """A file-like object for bytes [start, end) of the archive."""
+        request = urllib.request.Request(self.url, headers={'Range': f'bytes={start}-{end - 1}'})
+        response = urllib.request.urlopen(request, timeout=self.timeout)
+        if response.status != 206:
+            response.close()
+            raise MigrationError(f"server ignored the range request for bytes {start}-{end - 1}")
+        return response
+
+    def read(self, start, end):
+        with self.open(start, end) as response:
+            return response.read()
+
+    def download(self, path):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response, open(path, 'wb') as f:
+            shutil.copyfileobj(response, f, CHUNK)
+
+
+class FileSource:
+    """Byte ranges of an archive on disk."""
+
+    supports_ranges = True
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def open(self, start, end):
+        f = open(self.path, 'rb')
+        f.seek(start)
+        return _Limited(f, end - start)
+
+    def read(self, start, end):
+        with self.open(start, end) as f:
+            return f.read()
+
+
+class _Limited:
+    def __init__(self, f, remaining):
+        self._f = f
+        self._remaining = remaining
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Entry:
+    __slots__ = ('name', 'method', 'flags', 'crc', 'compressed_size', 'size', 'offset', 'end', 'dest')
+
+    def __init__(self, name, method, flags, crc, compressed_size, size, offset):
+        self.name = name
+        self.method = method
+        self.flags = flags
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.offset = offset
+        # End of this entry's local record; set once all offsets are known
+        self.end = None
+        self.dest = None
+
+
+def _zip64_values(extra, fields):
+    """Replace 0xFFFFFFFF placeholders in `fields` with the values from a ZIP64 extra field."""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, position)
+        if header_id == 0x0001:
+            values = iter(struct.unpack_from(f'<{length // 8}Q', extra, position + 4))
+            return [next(values) if value == 0xFFFFFFFF else value for value in fields]
+        position += 4 + length
+    return fields
+
+
+def read_central_directory(source):
+    """Return the archive's entries, ordered by their position in the file."""
+    tail_start = max(source.size - TAIL_SIZE, 0)
+    tail = source.read(tail_start, source.size)
+    position = tail.rfind(EOCD_SIGNATURE)
+    if position < 0:
+        raise MigrationError('not a zip archive (no end of central directory record)')
+    _, _, _, _, count, cd_size, cd_offset, _ = _EOCD.unpack_from(tail, position)
+
+    locator = position - _ZIP64_LOCATOR.size
+    if locator >= 0 and tail[locator:locator + 4] == ZIP64_LOCATOR_SIGNATURE:
+        _, _, zip64_offset, _ = _ZIP64_LOCATOR.unpack_from(tail, locator)
+        record = source.read(zip64_offset, zip64_offset + _ZIP64_EOCD.size)
+        _, _, _, _, _, _, _, count, cd_size, cd_offset = _ZIP64_EOCD.unpack(record)
+
+    if cd_offset >= tail_start:
+        directory = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+    else:
+        directory = source.read(cd_offset, cd_offset + cd_size)
+
+    entries = []
+    position = 0
+    for _ in range(count):
+        fields = _CENTRAL.unpack_from(directory, position)
+        if fields[0] != CENTRAL_SIGNATURE:
+            raise MigrationError('corrupt central directory')
+        flags, method, crc = fields[5], fields[6], fields[9]
+        name_length, extra_length, comment_length = fields[12], fields[13], fields[14]
+        name_start = position + _CENTRAL.size
+        raw_name = directory[name_start:name_start + name_length]
+        extra = directory[name_start + name_length:name_start + name_length + extra_length]
+        size, compressed_size, offset = _zip64_values(extra, [fields[11], fields[10], fields[18]])
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        entries.append(Entry(name, method, flags, crc, compressed_size, size, offset))
+        position = name_start + name_length + extra_length + comment_length
+
+    entries.sort(key=lambda entry: entry.offset)
+    for entry, following in zip(entries, entries[1:] + [None]):
+        entry.end = following.offset if following else cd_offset
+    return entries
+
+
+def plan(entries, dest):
+    """Map the entries under the archive's `server/` folder onto paths in `dest`."""
+    prefix = None
+    for entry in entries:
+        parts = entry.name.split('/')
+        if 'server' in parts[:-1]:
+            candidate = '/'.join(parts[:parts.index('server') + 1]) + '/'
+            if prefix is None or len(candidate) < len(prefix):
+                prefix = candidate
+    if prefix is None:
+        raise MigrationError("required directory 'server' not found in the archive")
+
+    files = [entry for entry in entries if entry.name.startswith(prefix) and not entry.name.endswith('/')]
+    jars = [entry for entry in files if '/' not in entry.name[len(prefix):] and entry.name.endswith('.jar')]
+    if not jars:
+        raise MigrationError('no .jar file found in the server directory')
+    if len(jars) > 1:
+        raise MigrationError('multiple .jar files found in the server directory; please ensure only one .jar file is present')
+
+    for entry in files:
+        relative = entry.name[len(prefix):]
+        if entry is jars[0]:
+            relative = 'server.jar'
+        path = os.path.normpath(os.path.join(dest, relative))
+        if os.path.isabs(relative) or not path.startswith(os.path.normpath(dest) + os.sep):
+            raise MigrationError(f"refusing to extract {entry.name} outside {dest}")
+        if entry.method not in (STORED, DEFLATED):
+            raise MigrationError(f"{entry.name} uses unsupported compression method {entry.method}")
+        entry.dest = path
+    return files
+
+
+def file_crc(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(CHUNK)
+            if not block:
+                return crc
+            crc = zlib.crc32(block, crc)
+
+
+def is_current(entry):
+    try:
+        return os.path.getsize(entry.dest) == entry.size and file_crc(entry.dest) == entry.crc
+    except FileNotFoundError:
+        return False
+
+
+def spans(entries):
+    """Group entries that sit next to each other in the archive, so small files share one request."""
+    span = []
+    for entry in entries:
+        if span and (entry.offset != span[-1].end or entry.end - span[0].offset > SPAN_SIZE):
+            yield span
+            span = []
+        span.append(entry)
+    if span:
+        yield span
+
+
+class Migration:
+    def __init__(self, source, entries, workers=8):
+        self.source = source
+        self.entries = entries
+        self.workers = workers
+        self.total = sum(entry.end - entry.offset for entry in entries)
+        self.transferred = 0
+        self._lock = threading.Lock()
+        self._last_report = 0
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='migrate') as executor:
+            # list() re-raises the first failure
+            list(executor.map(self.fetch_span, spans(self.entries)))
+
+    def fetch_span(self, span):
+        with self.source.open(span[0].offset, span[-1].end) as stream:
+            for entry in span:
+                self.extract(entry, stream)
+
+    def _progress(self, amount):
+        with self._lock:
+            self.transferred += amount
+            now = time.monotonic()
+            if now - self._last_report >= 5:
+                self._last_report = now
+                logging.info(f"{self.transferred / 1e6:.0f}/{self.total / 1e6:.0f} MB")
+
+    def extract(self, entry, stream):
+        header = _read_exactly(stream, _LOCAL.size)
+        if header[:4] != LOCAL_SIGNATURE:
+            raise MigrationError(f"corrupt local header for {entry.name}")
+        name_length, extra_length = _LOCAL.unpack(header)[-2:]
+        _read_exactly(stream, name_length + extra_length)
+
+        os.makedirs(os.path.dirname(entry.dest), exist_ok=True)
+        part = entry.dest + '.part'
+        inflater = zlib.decompressobj(-15) if entry.method == DEFLATED else None
+        crc = 0
+        remaining = entry.compressed_size
+        with open(part, 'wb') as f:
+            while remaining:
+                block = _read_exactly(stream, min(CHUNK, remaining))
+                remaining -= len(block)
+                self._progress(len(block))
+                if inflater is not None:
+                    block = inflater.decompress(block)
+                crc = zlib.crc32(block, crc)
+                f.write(block)
+            if inflater is not None:
+                block = inflater.flush()
+                crc = zlib.crc32(block, crc)
+                f.write(block)
+
+        if crc != entry.crc or os.path.getsize(part) != entry.size:
+            os.unlink(part)
+            raise MigrationError(f"checksum mismatch for {entry.name}")
+        os.replace(part, entry.dest)
+        # Skip the rest of the record (data descriptor)
+        trailing = entry.end - entry.offset - _LOCAL.size - name_length - extra_length - entry.compressed_size
+        if trailing > 0:
+            _read_exactly(stream, trailing)
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise MigrationError('archive ended unexpectedly')
+        data += more
+    return data
+
+
+def migrate(location, dest, workers=8):
+    started = time.monotonic()
+    temp_path = None
+    if os.path.exists(location):
+        source = FileSource(location)
+    else:
+        source = HttpSource(direct_url(location))
+        if not source.supports_ranges:
+            # Without range support the archive has to be downloaded before it can be read
+            logging.warning('server does not support range requests; downloading the whole archive first')
+            fd, temp_path = tempfile.mkstemp(suffix='.zip', dir=os.path.dirname(os.path.abspath(dest)))
+            os.close(fd)
+            source.download(temp_path)
+            source = FileSource(temp_path)
+
+    try:
+        files = plan(read_central_directory(source), dest)
+        pending = [entry for entry in files if not is_current(entry)]
+        logging.info(f"{len(files)} files in the archive, {len(files) - len(pending)} already up to date")
+        migration = Migration(source, pending, workers)
+        migration.run()
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+    logging.info(f"extracted {len(pending)} files ({migration.transferred / 1e6:.0f} MB) "
+                 f"to {dest} in {time.monotonic() - started:.0f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Stream a Minecraft server zip into the server directory.')
+    parser.add_argument('archive', help='URL (Dropbox share links work) or path of the server zip')
+    parser.add_argument('--dest', default='/home/minecraft/server')
+    parser.add_argument('--workers', type=int, default=8, help='parallel range requests')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    args = parse_args()
+    try:
+        migrate(args.archive, args.dest, args.workers)
+    except MigrationError as e:
+        raise SystemExit(f"Error: {e}")
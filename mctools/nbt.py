@@ -0,0 +1,104 @@
+"""Reading and writing NBT, the binary format of level.dat.
+
+Tags are (type, value) pairs, so a file is written back as it was read:
+compounds are dicts of name -> tag, lists are (element type, [values]),
+and byte, int and long arrays keep their raw big-endian bytes.
+"""
+
+import os
+import gzip
+import struct
+
+END, BYTE, SHORT, INT, LONG, FLOAT, DOUBLE, BYTE_ARRAY, STRING, LIST, COMPOUND, INT_ARRAY, LONG_ARRAY = range(13)
+
+_SCALARS = {BYTE: struct.Struct('>b'), SHORT: struct.Struct('>h'), INT: struct.Struct('>i'),
+            LONG: struct.Struct('>q'), FLOAT: struct.Struct('>f'), DOUBLE: struct.Struct('>d')}
+# Bytes per element of the array types
+_ARRAYS = {BYTE_ARRAY: 1, INT_ARRAY: 4, LONG_ARRAY: 8}
+_LENGTH = struct.Struct('>i')
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def take(self, size):
+        if self.position + size > len(self.data):
+            raise ValueError('truncated NBT data')
+        data = self.data[self.position:self.position + size]
+        self.position += size
+        return data
+
+    def string(self):
+        length = struct.unpack('>H', self.take(2))[0]
+        # Java's modified UTF-8 differs only for NUL and astral characters; surrogateescape keeps those bytes as they are
+        return self.take(length).decode('utf-8', 'surrogateescape')
+
+    def payload(self, tag):
+        if tag in _SCALARS:
+            return _SCALARS[tag].unpack(self.take(_SCALARS[tag].size))[0]
+        if tag in _ARRAYS:
+            count = _LENGTH.unpack(self.take(4))[0]
+            return self.take(count * _ARRAYS[tag])
+        if tag == STRING:
+            return self.string()
+        if tag == LIST:
+            element = self.take(1)[0]
+            count = _LENGTH.unpack(self.take(4))[0]
+            return element, [self.payload(element) for _ in range(count)]
+        if tag == COMPOUND:
+            values = {}
+            while True:
+                child = self.take(1)[0]
+                if child == END:
+                    return values
+                name = self.string()
+                values[name] = (child, self.payload(child))
+        raise ValueError(f"unknown NBT tag type {tag}")
+
+
+def _string(value):
+    data = value.encode('utf-8', 'surrogateescape')
+    return struct.pack('>H', len(data)) + data
+
+
+def _payload(tag, value):
+    if tag in _SCALARS:
+        return _SCALARS[tag].pack(value)
+    if tag in _ARRAYS:
+        return _LENGTH.pack(len(value) // _ARRAYS[tag]) + value
+    if tag == STRING:
+        return _string(value)
+    if tag == LIST:
+        element, items = value
+        return bytes([element]) + _LENGTH.pack(len(items)) + b''.join(_payload(element, item) for item in items)
+    if tag == COMPOUND:
+        return b''.join(bytes([child]) + _string(name) + _payload(child, data)
+                        for name, (child, data) in value.items()) + bytes([END])
+    raise ValueError(f"unknown NBT tag type {tag}")
+
+
+def loads(data):
+    """The root tag of uncompressed NBT data, as (name, (type, value))."""
+    reader = _Reader(data)
+    tag = reader.take(1)[0]
+    name = reader.string()
+    return name, (tag, reader.payload(tag))
+
+
+def dumps(name, tag):
+    return bytes([tag[0]]) + _string(name) + _payload(*tag)
+
+
+def read_file(path):
+    """The root tag of a gzipped NBT file such as level.dat."""
+    with gzip.open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def write_file(path, name, tag):
+    temp = path + '.tmp'
+    with gzip.open(temp, 'wb') as f:
+        f.write(dumps(name, tag))
+    os.replace(temp, path)
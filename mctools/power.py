@@ -0,0 +1,130 @@
+"""Batched, shared tracking of VM power states.
+
+Instead of every command asking the cloud for one VM's state, a single
+tracker polls all managed VMs on an interval. Lookups are batched: one
+call per cloud account per poll, through the backends' `power_states`
+classmethod (EC2 `describe_instance_status` with many IDs, Azure
+`list_all` with status only). Commands and the status cache read the
+cached state through `TrackedPowerState`.
+
+Polling tightens to `fast_interval` while any VM is in a transitional
+state or a transition has been announced with `expect_transition`. It
+relaxes again once the VMs settle. Listeners registered with
+`on_change` hear about every state change, including ones made outside
+the bot, such as the idle daemon's `shutdown -h now`. Coroutine
+listeners run as tasks of their own, so one that deallocates a VM does
+not hold up polling.
+"""
+
+import time
+import asyncio
+import logging
+
+# States a VM only passes through on its way somewhere else
+TRANSITIONAL_STATES = {'starting', 'stopping', 'deallocating', 'hibernating'}
+
+
+class TrackedPowerState:
+    """Stands in for a backend wherever only `power_state` is needed, answering from the tracker's cache."""
+
+    def __init__(self, tracker, backend):
+        self.tracker = tracker
+        self.backend = backend
+
+    async def power_state(self):
+        return await self.tracker.power_state(self.backend)
+
+
+class PowerStateTracker:
+    def __init__(self, interval=60, fast_interval=5, transition_timeout=600):
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.transition_timeout = transition_timeout
+        # batch key -> backends polled together
+        self.groups = {}
+        # backend -> (state, time.monotonic() when seen)
+        self.states = {}
+        # backend -> (deadline, state when the transition was announced)
+        self._expected = {}
+        self._listeners = []
+        # Coroutine listeners still running, kept so they are not garbage collected
+        self._listener_tasks = set()
+        self._wake = asyncio.Event()
+
+    def add(self, backend):
+        self.groups.setdefault(backend.batch_key(), []).append(backend)
+        return TrackedPowerState(self, backend)
+
+    def on_change(self, callback):
+        """Call `callback(backend, old_state, new_state)` on every change.
+
+        A coroutine function is run in its own task; the tracker does not wait for it.
+        """
+        self._listeners.append(callback)
+
+    def expect_transition(self, backend):
+        """Poll fast until `backend` settles into a new state, e.g. right after a start or stop request."""
+        current = self.states.get(backend, (None, 0))[0]
+        self._expected[backend] = (time.monotonic() + self.transition_timeout, current)
+        self._wake.set()
+
+    async def power_state(self, backend):
+        cached = self.states.get(backend)
+        if cached is not None and time.monotonic() - cached[1] <= self.next_interval() * 2:
+            return cached[0]
+        # Not polled yet (or polling stopped); ask directly
+        state = await backend.power_state()
+        await self._record(backend, state)
+        return state
+
+    async def _record(self, backend, state):
+        old = self.states.get(backend, (None, 0))[0]
+        self.states[backend] = (state, time.monotonic())
+        expected = self._expected.get(backend)
+        if expected and (time.monotonic() > expected[0]
+                         or (state != expected[1] and state not in TRANSITIONAL_STATES)):
+            del self._expected[backend]
+        if state != old:
+            for callback in self._listeners:
+                try:
+                    result = callback(backend, old, state)
+                except Exception as e:
+                    logging.error(f"Error in power state listener: {e}")
+                    continue
+                if asyncio.iscoroutine(result):
+                    task = asyncio.ensure_future(result)
+                    self._listener_tasks.add(task)
+                    task.add_done_callback(self._listener_done)
+
+    def _listener_done(self, task):
+        self._listener_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error in power state listener: {task.exception()}")
+
+    async def _poll_group(self, backends):
+        states = await type(backends[0]).power_states(backends)
+        for backend in backends:
+            if backend in states:
+                await self._record(backend, states[backend])
+
+    async def refresh(self):
+        """Poll every group once, concurrently; one cloud call per group."""
+        results = await asyncio.gather(*(self._poll_group(backends) for backends in self.groups.values()),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"Error polling power states: {result}")
+
+    def next_interval(self):
+        if self._expected or any(state in TRANSITIONAL_STATES for state, _ in self.states.values()):
+            return self.fast_interval
+        return self.interval
+
+    async def run(self):
+        while True:
+            await self.refresh()
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.next_interval())
+            except asyncio.TimeoutError:
+                pass
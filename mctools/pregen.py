@@ -0,0 +1,299 @@
+"""Chunk pre-generation over RCON while nobody is playing.
+
+Exploring players make the server generate chunks on the fly, which shows
+up as "Can't keep up" spikes at view-distance 10. This job fills a square
+around a center point ahead of time. It goes in spiral order, so the area
+closest to spawn is done first.
+
+A batch of chunks is force-loaded with `forceload add`. The job then
+polls `execute if loaded` until every chunk in the batch has been
+generated, and releases the batch with `forceload remove`. Batch size
+follows the server's MSPT: it grows while ticks are cheap and halves
+when they go over the target. The job pauses as soon as a player joins
+and resumes once the server is empty again.
+
+Progress is checkpointed to a JSON file after every batch, so the job
+carries on where it left off after the idle shutdown. The same file
+holds the live status (chunks per second, ETA). mctools.telemetry serves
+it at /pregen, and the bots read it for `!pregen status`.
+
+Run with `python3 -m mctools.pregen --radius 2000` (see services/minecraft-pregen.service).
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+from mctools import webserver
+from mctools.rcon import RconClient
+from mctools.properties import read_properties
+from mctools.serverlog import LogFollower, PlayerJoined
+from mctools.telemetry import PLAYER_COUNT_RE, parse_mspt
+
+DEFAULT_STATE_PATH = '/home/minecraft/pregen.json'
+
+
+def spiral(start=0):
+    """Chunk offsets (dx, dz) from the center outwards, ring by ring, skipping the first `start`."""
+    ring = 0
+    while start >= max(8 * ring, 1):
+        start -= max(8 * ring, 1)
+        ring += 1
+    while True:
+        if ring == 0:
+            offsets = [(0, 0)]
+        else:
+            # Walk the ring clockwise from its top-left corner
+            offsets = ([(dx, -ring) for dx in range(-ring, ring)]
+                       + [(ring, dz) for dz in range(-ring, ring)]
+                       + [(dx, ring) for dx in range(ring, -ring, -1)]
+                       + [(-ring, dz) for dz in range(ring, -ring, -1)])
+        yield from offsets[start:]
+        start = 0
+        ring += 1
+
+
+class Pregenerator:
+    def __init__(self, rcon, state_path=DEFAULT_STATE_PATH, center=(0, 0), radius=2000, dimension=None,
+                 target_mspt=35.0, min_batch=1, max_batch=64, batch_timeout=60, pause_interval=30):
+        self.rcon = rcon
+        self.state_path = state_path
+        self.center_chunk = (center[0] // 16, center[1] // 16)
+        self.radius = -(-radius // 16)
+        self.dimension = dimension
+        self.target_mspt = target_mspt
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.batch_timeout = batch_timeout
+        self.pause_interval = pause_interval
+        self.total = (2 * self.radius + 1) ** 2
+        self.done = 0
+        self.pending = []
+        self.batch = 4
+        self.state = 'starting'
+        self.rate = None
+        self.mspt = None
+        self.can_test_loaded = True
+        self._player_joined = asyncio.Event()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if tuple(saved.get('center_chunk', ())) != self.center_chunk or saved.get('dimension') != self.dimension:
+            logging.info('pre-generation center or dimension changed; starting over')
+            self.pending = saved.get('pending', [])
+            return
+        # Spiral order does not depend on the radius, so a larger radius simply continues
+        self.done = min(saved.get('done', 0), self.total)
+        self.pending = saved.get('pending', [])
+        self.batch = saved.get('batch', self.batch)
+
+    def status(self):
+        remaining = self.total - self.done
+        return {
+            'state': self.state,
+            'center_chunk': list(self.center_chunk),
+            'dimension': self.dimension,
+            'radius_chunks': self.radius,
+            'done': self.done,
+            'total': self.total,
+            'pending': self.pending,
+            'batch': self.batch,
+            'mspt': self.mspt,
+            'chunks_per_second': self.rate,
+            'eta_seconds': remaining / self.rate if self.rate and self.state != 'done' else None,
+            'updated': time.time(),
+        }
+
+    def save(self):
+        temp = self.state_path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.status(), f)
+        os.replace(temp, self.state_path)
+
+    def _command(self, command):
+        return f"execute in {self.dimension} run {command}" if self.dimension else command
+
+    async def _forceload(self, action, chunks):
+        await self.rcon.run_many(*(self._command(f"forceload {action} {x * 16} {z * 16}") for x, z in chunks))
+
+    async def players(self):
+        match = PLAYER_COUNT_RE.search(await self.rcon.run('list'))
+        return int(match.group(1)) if match else 0
+
+    def on_log_event(self, event):
+        if isinstance(event, PlayerJoined):
+            self._player_joined.set()
+
+    async def watch_log(self, path):
+        async for event in LogFollower(path, from_end=True).events(backfill=False):
+            self.on_log_event(event)
+
+    async def _wait_until_loaded(self, chunks):
+        """Wait for every chunk in `chunks` to be generated; False on timeout or when a player joins."""
+        if not self.can_test_loaded:
+            # Servers before 1.19.4 have no `execute if loaded`; give each chunk a fixed amount of time
+            await asyncio.sleep(0.25 * len(chunks))
+            return not self._player_joined.is_set()
+
+        give_up_at = time.monotonic() + self.batch_timeout
+        waiting = list(chunks)
+        while waiting:
+            responses = await self.rcon.run_many(
+                *(self._command(f"execute if loaded {x * 16} 0 {z * 16}") for x, z in waiting))
+            if not any('passed' in r or 'failed' in r for r in responses):
+                logging.info('`execute if loaded` is not supported; falling back to fixed waits')
+                self.can_test_loaded = False
+                return await self._wait_until_loaded(waiting)
+            waiting = [chunk for chunk, response in zip(waiting, responses) if 'passed' not in response]
+            if not waiting:
+                return True
+            if self._player_joined.is_set() or time.monotonic() >= give_up_at:
+                return False
+            await asyncio.sleep(0.25)
+        return True
+
+    async def _adapt(self):
+        """Grow the batch while MSPT is under the target, halve it when over."""
+        try:
+            self.mspt = parse_mspt(await self.rcon.run('mspt'))
+        except Exception:
+            self.mspt = None
+        if self.mspt is None:
+            return
+        if self.mspt > self.target_mspt:
+            self.batch = max(self.min_batch, self.batch // 2)
+            # Let the server catch up before the next batch
+            await asyncio.sleep(2)
+        elif self.mspt < self.target_mspt * 0.7:
+            self.batch = min(self.max_batch, self.batch + 1)
+
+    async def run(self):
+        if self.pending:
+            # Chunks still force-loaded from a batch that was cut off by a shutdown
+            await self._forceload('remove', self.pending)
+            self.pending = []
+
+        positions = spiral(self.done)
+        while self.done < self.total:
+            self._player_joined.clear()
+            if await self.players():
+                if self.state != 'paused':
+                    logging.info('players online; pausing pre-generation')
+                self.state = 'paused'
+                self.save()
+                await asyncio.sleep(self.pause_interval)
+                continue
+            if self.state != 'running':
+                logging.info(f"pre-generating chunks {self.done}/{self.total}")
+            self.state = 'running'
+
+            started = time.monotonic()
+            chunks = [(self.center_chunk[0] + dx, self.center_chunk[1] + dz)
+                      for dx, dz in (next(positions) for _ in range(min(self.batch, self.total - self.done)))]
+            self.pending = chunks
+            self.save()
+            await self._forceload('add', chunks)
+            loaded = await self._wait_until_loaded(chunks)
+            await self._forceload('remove', chunks)
+            self.pending = []
+
+            if loaded:
+                self.done += len(chunks)
+                rate = len(chunks) / max(time.monotonic() - started, 1e-3)
+                self.rate = rate if self.rate is None else 0.8 * self.rate + 0.2 * rate
+                await self._adapt()
+            else:
+                # Redo the same chunks after the pause or with a smaller batch
+                positions = spiral(self.done)
+                if not self._player_joined.is_set():
+                    self.batch = max(self.min_batch, self.batch // 2)
+            self.save()
+
+        self.state = 'done'
+        self.save()
+        logging.info(f"pre-generation finished: {self.total} chunks within {self.radius} chunks of {self.center_chunk}")
+
+
+def pregen_route(state_path=DEFAULT_STATE_PATH):
+    """A mctools.webserver route handler that serves the checkpoint file."""
+    def handler(query):
+        try:
+            with open(state_path) as f:
+                status = json.load(f)
+        except FileNotFoundError:
+            return webserver.json_response({'state': 'idle'})
+        status.pop('pending', None)
+        return webserver.json_response(status)
+    return handler
+
+
+# Helpers used by the Discord bots to read and present the status
+
+async def fetch_pregen(host, port=25580, timeout=5):
+    import aiohttp
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async with session.get(f"http://{host}:{port}/pregen") as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def format_pregen(status):
+    if status['state'] == 'idle':
+        return 'Chunk pre-generation has not been started.'
+    percent = 100 * status['done'] / status['total'] if status['total'] else 100
+    lines = [f"**Chunk pre-generation: {status['state']}**",
+             f"{status['done']:,} / {status['total']:,} chunks ({percent:.1f}%), radius {status['radius_chunks']} chunks"]
+    if status['state'] != 'done' and status.get('chunks_per_second'):
+        lines.append(f"{status['chunks_per_second']:.1f} chunks/s, ETA {_duration(status['eta_seconds'])}"
+                     + (' once the server is empty' if status['state'] == 'paused' else ''))
+    if status.get('mspt') is not None:
+        lines.append(f"MSPT {status['mspt']:.1f} ms, batch of {status['batch']}")
+    return '\n'.join(lines)
+
+
+async def main(args):
+    properties = read_properties(os.path.join(args.server_dir, 'server.properties'))
+    rcon = RconClient('127.0.0.1', int(properties.get('rcon.port', 25575)), properties.get('rcon.password', ''), timeout=10)
+    # The server may still be booting
+    await rcon.connect(timeout=300)
+    pregenerator = Pregenerator(rcon, args.state, center=(args.center_x, args.center_z), radius=args.radius,
+                                dimension=args.dimension, target_mspt=args.target_mspt, max_batch=args.max_batch)
+    log_task = asyncio.ensure_future(pregenerator.watch_log(os.path.join(args.server_dir, 'minecraft-server.log')))
+    try:
+        await pregenerator.run()
+    finally:
+        log_task.cancel()
+        await rcon.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-generate chunks around spawn while the server is empty.')
+    parser.add_argument('--server-dir', default='/home/minecraft/server')
+    parser.add_argument('--state', default=DEFAULT_STATE_PATH, help='checkpoint and status file')
+    parser.add_argument('--radius', type=int, default=2000, help='blocks from the center to fill')
+    parser.add_argument('--center-x', type=int, default=0)
+    parser.add_argument('--center-z', type=int, default=0)
+    parser.add_argument('--dimension', default=None, help='e.g. minecraft:the_nether (default: the overworld)')
+    parser.add_argument('--target-mspt', type=float, default=35.0, help='MSPT to stay under while generating')
+    parser.add_argument('--max-batch', type=int, default=64, help='most chunks force-loaded at once')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,31 @@
+"""Reading server.properties."""
+
+
+def read_properties(path):
+    """Parse a Java .properties file into a dict of strings."""
+    properties = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(('#', '!')) or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            properties[key.strip()] = value.strip().replace('\\:', ':')
+    return properties
+
+
+def write_properties(path, updates):
+    """Set `updates` in a .properties file in place, keeping its comments and order; new keys go at the end."""
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    remaining = {key: str(value).replace(':', '\\:') for key, value in updates.items()}
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('#', '!')) or '=' not in stripped:
+            continue
+        key = stripped.split('=', 1)[0].strip()
+        if key in remaining:
+            lines[i] = f"{key}={remaining.pop(key)}"
+    lines += [f"{key}={value}" for key, value in remaining.items()]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
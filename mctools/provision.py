@@ -0,0 +1,731 @@
+"""Declarative, idempotent provisioning of the Minecraft VM.
+
+The setup scripts used to download everything one file at a time on every
+run, call `apt-get update` once per package and ask which server to
+install. Here a VM is a list of steps (packages, the minecraft user,
+firewall ports, rcon-cli, the JDK, the server jar, systemd units). Each
+step first checks whether it is already in place, and only the steps that
+are not run. Every download those steps need starts at once on a thread
+pool, and each step waits only for its own files.
+
+Downloads go through a content-addressed cache (`--cache-dir`, default
+/var/cache/mctools/artifacts). Files are stored under their SHA-256 and
+checked against the digest the publisher gives where there is one: the
+Paper API's SHA-256, Mojang's SHA-1, Corretto's published SHA-256, the
+.sha1 files next to Fabric and Forge installers. An index maps each
+artifact to the blob it last resolved to. A file whose expected digest is
+already in the store is not downloaded again, and versioned release URLs
+are not even looked up. A cache directory baked into a VM image (fill it
+with `--prefetch`) makes provisioning from that image work with
+`--offline`.
+
+    python3 -m mctools.provision --flavour paper --version 1.21.1
+    python3 -m mctools.provision --restore <url or path of a server zip>
+    python3 -m mctools.provision --flavour fabric --version 1.21.1 --dry-run --offline
+
+`--dry-run` lists each step as satisfied or pending, and what would be
+downloaded or taken from the cache, without touching the system. With
+`--offline` it makes no network requests either.
+"""
+
+import os
+import pwd
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tarfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from mctools.migrate import migrate, MigrationError
+
+REPO_URL = 'https://raw.githubusercontent.com/elijahcutler/mc-server-automation/main'
+RCON_VERSION = '0.10.3'
+RCON_URL = f"https://github.com/gorcon/rcon-cli/releases/download/v{RCON_VERSION}/rcon-{RCON_VERSION}-amd64_linux.tar.gz"
+CORRETTO_URL = 'https://corretto.aws/downloads/latest/amazon-corretto-22-x64-linux-jdk.tar.gz'
+CORRETTO_SHA256_URL = 'https://corretto.aws/downloads/latest_sha256/amazon-corretto-22-x64-linux-jdk.tar.gz'
+PAPER_API = 'https://api.papermc.io/v2/projects/paper'
+MOJANG_MANIFEST = 'https://piston-meta.mojang.com/mc/game/version_manifest_v2.json'
+FABRIC_INSTALLERS = 'https://meta.fabricmc.net/v2/versions/installer'
+FORGE_PROMOTIONS = 'https://files.minecraftforge.net/net/minecraftforge/forge/promotions_slim.json'
+FORGE_MAVEN = 'https://maven.minecraftforge.net/net/minecraftforge/forge'
+
+FLAVOURS = ('paper', 'fabric', 'forge', 'vanilla')
+PACKAGES = ('firewalld', 'python3', 'python3-numpy')
+PORTS = (25565, 25575, 25580)
+HOME = '/home/minecraft'
+SYSTEMD_DIR = '/etc/systemd/system'
+DEFAULT_CACHE = '/var/cache/mctools/artifacts'
+# Repository file -> path under /etc/systemd/system
+UNIT_FILES = {
+    'services/minecraft.service': 'minecraft.service',
+    'services/minecraft-idle.service': 'minecraft-idle.service',
+    'services/minecraft-telemetry.service': 'minecraft-telemetry.service',
+    'services/minecraft-backup.service': 'minecraft-backup.service',
+    'services/minecraft-backup.timer': 'minecraft-backup.timer',
+    'services/minecraft-pregen.service': 'minecraft-pregen.service',
+    'services/minecraft-bootprof.service': 'minecraft-bootprof.service',
+    'services/minecraft-backup.conf': 'minecraft.service.d/backup.conf',
+    'services/minecraft-jvm.conf': 'minecraft.service.d/jvm.conf',
+}
+SERVICES = ('minecraft.service', 'minecraft-idle.service', 'minecraft-telemetry.service',
+            'minecraft-backup.timer', 'minecraft-pregen.service', 'minecraft-bootprof.service')
+# Units replaced by minecraft-idle.service
+RETIRED_UNITS = ('minecraft-shutdown.timer', 'minecraft-shutdown.service')
+
+CHUNK = 1 << 20
+
+
+class ProvisionError(Exception):
+    pass
+
+
+def fetch_json(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def fetch_digest(url, algorithm, timeout=30):
+    """A published checksum file's digest, or None if there is none."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            text = response.read(1024).decode('ascii', errors='replace').split()
+    except OSError as e:
+        logging.warning(f"no checksum at {url}: {e}")
+        return None
+    return (algorithm, text[0].lower()) if text else None
+
+
+def run(*command, check=True, **kwargs):
+    logging.debug(' '.join(command))
+    return subprocess.run(command, check=check, **kwargs)
+
+
+def output(*command):
+    """stdout of a command, or None if it fails or does not exist."""
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def chown_tree(path, user):
+    entry = pwd.getpwnam(user)
+    os.lchown(path, entry.pw_uid, entry.pw_gid)
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.lchown(os.path.join(root, name), entry.pw_uid, entry.pw_gid)
+
+
+class Artifact:
+    """A file some step needs.
+
+    `key` names it in the cache index. The URL and expected digest
+    (`(algorithm, hex)`) are given up front, or found by `resolve()` for
+    artifacts that come from a version lookup. `immutable` says the URL
+    always serves the same bytes, so a cached copy is used without asking
+    the network. `info` holds what a lookup found out besides the URL,
+    such as the version 'latest' stood for; the cache keeps it with the
+    file, so it is known offline too.
+    """
+
+    def __init__(self, key, url=None, digest=None, resolve=None, immutable=False):
+        self.key = key
+        self.url = url
+        self.digest = digest
+        self.resolve = resolve or (lambda: (self.url, self.digest))
+        self.immutable = immutable
+        self.info = {}
+
+
+class ArtifactCache:
+    """Downloaded files stored under their SHA-256, with an index of what each artifact last resolved to."""
+
+    def __init__(self, root=DEFAULT_CACHE, offline=False):
+        self.root = root
+        self.offline = offline
+        self.index_path = os.path.join(root, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, 'sha256', sha256[:2], sha256)
+
+    def cached(self, key):
+        """The blob an artifact last resolved to, if it is still in the store."""
+        entry = self.index.get(key)
+        if entry and os.path.exists(self.blob_path(entry['sha256'])):
+            return entry
+        return None
+
+    def _record(self, key, url, digests, info=None):
+        with self._lock:
+            self.index[key] = {'url': url, **digests, 'fetched': time.time()}
+            if info:
+                self.index[key]['info'] = info
+            os.makedirs(self.root, exist_ok=True)
+            temp = self.index_path + '.tmp'
+            with open(temp, 'w') as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+            os.replace(temp, self.index_path)
+
+    def fetch(self, artifact):
+        """Path of the artifact's file, downloading it unless the store already has it."""
+        entry = self.cached(artifact.key)
+        if entry and (self.offline or (artifact.immutable and entry['url'] == artifact.url)):
+            artifact.info.update(entry.get('info', {}))
+            return self.blob_path(entry['sha256'])
+        if self.offline:
+            raise ProvisionError(f"{artifact.key} is not in the cache at {self.root}")
+
+        url, digest = artifact.resolve()
+        if entry and entry['url'] == url and digest and entry.get(digest[0]) == digest[1]:
+            if artifact.info and entry.get('info') != artifact.info:
+                self._record(artifact.key, url, {k: v for k, v in entry.items() if k in ('sha256', 'sha1')},
+                             artifact.info)
+            return self.blob_path(entry['sha256'])
+        if digest and digest[0] == 'sha256' and os.path.exists(self.blob_path(digest[1])):
+            self._record(artifact.key, url, {'sha256': digest[1]}, artifact.info)
+            return self.blob_path(digest[1])
+        return self._download(artifact.key, url, digest, artifact.info)
+
+    def _download(self, key, url, digest, info=None):
+        started = time.monotonic()
+        temp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        hashes = {'sha256': hashlib.sha256(), 'sha1': hashlib.sha1()}
+        if digest and digest[0] not in hashes:
+            hashes[digest[0]] = hashlib.new(digest[0])
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as f:
+            try:
+                with urllib.request.urlopen(url, timeout=60) as response:
+                    while True:
+                        chunk = response.read(CHUNK)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        size += len(chunk)
+                        for h in hashes.values():
+                            h.update(chunk)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        digests = {name: h.hexdigest() for name, h in hashes.items()}
+        if digest and digests[digest[0]] != digest[1].lower():
+            os.unlink(f.name)
+            raise ProvisionError(f"{url}: {digest[0]} {digests[digest[0]]} does not match the published {digest[1]}")
+        path = self.blob_path(digests['sha256'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, path)
+        self._record(key, url, {k: v for k, v in digests.items() if k in ('sha256', 'sha1')}, info)
+        logging.info(f"downloaded {key} ({size / 1e6:.1f} MB) in {time.monotonic() - started:.1f}s")
+        return path
+
+
+# Version lookups, each returning (url, digest); the server ones also
+# return the Minecraft version, which is what 'latest' turned out to be
+
+def resolve_paper(version):
+    if version == 'latest':
+        version = fetch_json(PAPER_API)['versions'][-1]
+    build = fetch_json(f"{PAPER_API}/versions/{version}/builds")['builds'][-1]
+    download = build['downloads']['application']
+    return (f"{PAPER_API}/versions/{version}/builds/{build['build']}/downloads/{download['name']}",
+            ('sha256', download['sha256']), version)
+
+
+def resolve_vanilla(version):
+    manifest = fetch_json(MOJANG_MANIFEST)
+    if version == 'latest':
+        version = manifest['latest']['release']
+    entry = next((v for v in manifest['versions'] if v['id'] == version), None)
+    if entry is None:
+        raise ProvisionError(f"unknown Minecraft version: {version}")
+    server = fetch_json(entry['url'])['downloads']['server']
+    return server['url'], ('sha1', server['sha1']), version
+
+
+def resolve_fabric_installer():
+    installer = fetch_json(FABRIC_INSTALLERS)[0]
+    return installer['url'], fetch_digest(installer['url'] + '.sha1', 'sha1')
+
+
+def resolve_forge_installer(version):
+    promos = fetch_json(FORGE_PROMOTIONS)['promos']
+    if version == 'latest':
+        # Forge lags behind Mojang, so the newest release it has a build for
+        version = max({key.rsplit('-', 1)[0] for key in promos},
+                      key=lambda v: [int(part) if part.isdigit() else -1 for part in v.split('.')])
+    forge = promos.get(f"{version}-recommended") or promos.get(f"{version}-latest")
+    if forge is None:
+        raise ProvisionError(f"no Forge build for Minecraft {version}")
+    url = f"{FORGE_MAVEN}/{version}-{forge}/forge-{version}-{forge}-installer.jar"
+    return url, fetch_digest(url + '.sha1', 'sha1'), version
+
+
+class Step:
+    """One part of a provisioned VM: whether it is in place, and how to put it there."""
+
+    name = None
+    artifacts = ()
+
+    def satisfied(self):
+        return False
+
+    def apply(self, files):
+        """Put the step in place; `files` maps artifact keys to paths in the cache.
+
+        Returns False if it turned out nothing needed changing.
+        """
+        raise NotImplementedError
+
+
+class Packages(Step):
+    def __init__(self, packages):
+        self.packages = list(packages)
+        self.name = f"packages ({', '.join(self.packages)})"
+        self.manager = next((m for m in ('apt-get', 'dnf', 'yum') if shutil.which(m)), None)
+
+    def installed(self, package):
+        if self.manager == 'apt-get':
+            status = output('dpkg-query', '-W', '-f=${Status}', package)
+            return status is not None and status.endswith('installed')
+        return output('rpm', '-q', package) is not None
+
+    def missing(self):
+        return [package for package in self.packages if not self.installed(package)]
+
+    def satisfied(self):
+        return not self.missing()
+
+    def apply(self, files):
+        missing = self.missing()
+        if self.manager is None:
+            raise ProvisionError(f"no apt-get or yum to install {', '.join(missing)}")
+        if self.manager == 'apt-get':
+            environment = {**os.environ, 'DEBIAN_FRONTEND': 'noninteractive'}
+            # One index refresh for every package
+            run('apt-get', 'update', '-q', env=environment)
+            run('apt-get', 'install', '-y', '-q', *missing, env=environment)
+        else:
+            run(self.manager, 'install', '-y', *missing)
+
+
+class User(Step):
+    def __init__(self, user):
+        self.user = user
+        self.name = f"user {user}"
+
+    def satisfied(self):
+        try:
+            pwd.getpwnam(self.user)
+            return True
+        except KeyError:
+            return False
+
+    def apply(self, files):
+        run('useradd', '-m', self.user)
+        with open(f"/etc/sudoers.d/{self.user}", 'w') as f:
+            f.write(f"{self.user} ALL=(ALL) NOPASSWD:ALL\n")
+        # Not every distribution has a wheel group
+        run('usermod', '-aG', 'wheel', self.user, check=False, stderr=subprocess.DEVNULL)
+
+
+class Firewall(Step):
+    def __init__(self, ports):
+        self.ports = [f"{port}/tcp" for port in ports]
+        self.name = f"firewall ({', '.join(self.ports)})"
+
+    def satisfied(self):
+        opened = output('firewall-cmd', '--zone=public', '--permanent', '--list-ports')
+        return opened is not None and set(self.ports) <= set(opened.split())
+
+    def apply(self, files):
+        for port in self.ports:
+            run('firewall-cmd', '--zone=public', f"--add-port={port}", '--permanent')
+        run('firewall-cmd', '--reload')
+
+
+class Directories(Step):
+    def __init__(self, paths, user):
+        self.paths = paths
+        self.user = user
+        self.name = f"directories ({', '.join(paths)})"
+
+    def satisfied(self):
+        return all(os.path.isdir(path) for path in self.paths)
+
+    def apply(self, files):
+        entry = pwd.getpwnam(self.user)
+        for path in self.paths:
+            os.makedirs(path, exist_ok=True)
+            os.chown(path, entry.pw_uid, entry.pw_gid)
+
+
+class Rcon(Step):
+    name = f"rcon-cli {RCON_VERSION}"
+    artifacts = (Artifact('rcon-cli', RCON_URL, immutable=True),)
+
+    def __init__(self, path='/usr/local/bin/rcon'):
+        self.path = path
+
+    def satisfied(self):
+        return shutil.which('rcon') is not None
+
+    def apply(self, files):
+        member = f"rcon-{RCON_VERSION}-amd64_linux/rcon"
+        with tarfile.open(files['rcon-cli']) as tar, tar.extractfile(member) as source, \
+                open(self.path + '.tmp', 'wb') as f:
+            shutil.copyfileobj(source, f)
+        os.chmod(self.path + '.tmp', 0o755)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class Corretto(Step):
+    name = 'Amazon Corretto 22'
+    artifacts = (Artifact('corretto-22', CORRETTO_URL,
+                          resolve=lambda: (CORRETTO_URL, fetch_digest(CORRETTO_SHA256_URL, 'sha256'))),)
+
+    def __init__(self, dest='/opt/java'):
+        self.dest = dest
+
+    def satisfied(self):
+        return shutil.which('java') is not None
+
+    def apply(self, files):
+        os.makedirs(self.dest, exist_ok=True)
+        with tarfile.open(files['corretto-22']) as tar:
+            top = tar.getmembers()[0].name.split('/')[0]
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(self.dest, filter='data')
+            else:
+                tar.extractall(self.dest)
+        home = os.path.join(self.dest, top)
+        for tool in ('java', 'javac'):
+            run('update-alternatives', '--install', f"/usr/bin/{tool}", tool, f"{home}/bin/{tool}", '1')
+            run('update-alternatives', '--set', tool, f"{home}/bin/{tool}")
+
+
+def _versioned(key, resolver, version):
+    """An artifact looked up by Minecraft version, remembering the version it resolved to."""
+    def resolve():
+        url, digest, artifact.info['version'] = resolver(version)
+        return url, digest
+
+    artifact = Artifact(key, resolve=resolve)
+    return artifact
+
+
+class ServerJar(Step):
+    """The server for a flavour and Minecraft version, recorded in .flavour and .version.
+
+    .version gets the version actually installed, also when 'latest' was
+    asked for. An installed server of the same flavour satisfies 'latest';
+    a newer release is only installed when its version is given.
+    """
+
+    def __init__(self, flavour, version, server_dir, user):
+        self.flavour = flavour
+        self.version = version
+        self.server_dir = server_dir
+        self.user = user
+        self.name = f"{flavour} {version} server"
+        vanilla = _versioned(f"vanilla-{version}", resolve_vanilla, version)
+        if flavour == 'paper':
+            self.artifacts = (_versioned(f"paper-{version}", resolve_paper, version),)
+        elif flavour == 'vanilla':
+            self.artifacts = (vanilla,)
+        elif flavour == 'fabric':
+            # The installer only writes the launcher; it runs the vanilla server.jar next to it
+            self.artifacts = (vanilla, Artifact('fabric-installer', resolve=resolve_fabric_installer))
+        else:
+            self.artifacts = (_versioned(f"forge-installer-{version}", resolve_forge_installer, version),)
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.server_dir, name)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def satisfied(self):
+        installed = self._read('.version')
+        return (self._read('.flavour') == self.flavour
+                and installed is not None and self.version in ('latest', installed))
+
+    def resolved_version(self):
+        """The Minecraft version the server artifact resolved to (the vanilla jar's, for Fabric)."""
+        version = self.artifacts[0].info.get('version', self.version)
+        if version == 'latest':
+            raise ProvisionError(f"the cache does not record which version {self.artifacts[0].key} is; "
+                                 f"run once without --offline or give --version")
+        return version
+
+    def apply(self, files):
+        version = self.resolved_version()
+        server_jar = os.path.join(self.server_dir, 'server.jar')
+        if self.flavour in ('paper', 'vanilla'):
+            shutil.copyfile(files[self.artifacts[0].key], server_jar)
+        elif self.flavour == 'fabric':
+            shutil.copyfile(files[self.artifacts[0].key], server_jar)
+            run('java', '-jar', files['fabric-installer'], 'server', '-mcversion', version, '-dir', self.server_dir)
+        else:
+            installer = os.path.join(self.server_dir, 'forge-installer.jar')
+            shutil.copyfile(files[self.artifacts[0].key], installer)
+            run('java', '-jar', installer, '--installServer', cwd=self.server_dir)
+            os.unlink(installer)
+        # Tells mctools.jvm_launcher how to size and start the server
+        for name, value in (('.flavour', self.flavour), ('.version', version)):
+            with open(os.path.join(self.server_dir, name), 'w') as f:
+                f.write(value + '\n')
+        chown_tree(self.server_dir, self.user)
+
+
+class DefaultFiles(Step):
+    """eula.txt and server.properties from server/.defaults, unless the server already has them."""
+
+    def __init__(self, server_dir, user, repo_url=REPO_URL):
+        self.server_dir = server_dir
+        self.user = user
+        self.name = 'eula.txt and server.properties'
+        self.artifacts = tuple(Artifact(f"defaults/{name}", f"{repo_url}/server/.defaults/{name}")
+                               for name in ('eula.txt', 'server.properties'))
+
+    def satisfied(self):
+        return all(os.path.exists(os.path.join(self.server_dir, a.key.split('/')[1])) for a in self.artifacts)
+
+    def apply(self, files):
+        entry = pwd.getpwnam(self.user)
+        for artifact in self.artifacts:
+            path = os.path.join(self.server_dir, artifact.key.split('/')[1])
+            if not os.path.exists(path):
+                shutil.copyfile(files[artifact.key], path)
+                os.chown(path, entry.pw_uid, entry.pw_gid)
+
+
+class Restore(Step):
+    """Server files streamed in from a zip by mctools.migrate, recorded in .restored-from."""
+
+    def __init__(self, source, server_dir, user):
+        self.source = source
+        self.server_dir = server_dir
+        self.user = user
+        self.name = f"server files from {source}"
+        self.marker = os.path.join(server_dir, '.restored-from')
+
+    def satisfied(self):
+        if os.path.exists(self.marker):
+            with open(self.marker) as f:
+                return f.read().strip() == self.source
+        # Set up before the provisioner kept track
+        return os.path.exists(os.path.join(self.server_dir, 'server.jar'))
+
+    def apply(self, files):
+        try:
+            migrate(self.source, self.server_dir)
+        except MigrationError as e:
+            raise ProvisionError(f"restoring the server files failed: {e}")
+        with open(self.marker, 'w') as f:
+            f.write(self.source + '\n')
+        chown_tree(self.server_dir, self.user)
+
+
+class UnitFiles(Step):
+    """The systemd units and drop-ins. They follow the repository, so they are fetched and compared on every run."""
+
+    def __init__(self, repo_url=REPO_URL, overrides=None, systemd_dir=SYSTEMD_DIR, backup_dir=None):
+        self.systemd_dir = systemd_dir
+        self.backup_dir = backup_dir
+        self.name = 'systemd units'
+        overrides = overrides or {}
+        self.targets = {}
+        artifacts = []
+        for source, target in UNIT_FILES.items():
+            artifact = Artifact(source, overrides.get(target, f"{repo_url}/{source}"))
+            artifacts.append(artifact)
+            self.targets[source] = target
+        self.artifacts = tuple(artifacts)
+
+    def apply(self, files):
+        changed = []
+        for key, target in self.targets.items():
+            path = os.path.join(self.systemd_dir, target)
+            with open(files[key], 'rb') as f:
+                content = f.read()
+            if self.backup_dir:
+                with open(os.path.join(self.backup_dir, os.path.basename(key)), 'wb') as f:
+                    f.write(content)
+            try:
+                with open(path, 'rb') as f:
+                    if f.read() == content:
+                        continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+            changed.append(target)
+        for unit in RETIRED_UNITS:
+            path = os.path.join(self.systemd_dir, unit)
+            if os.path.exists(path):
+                run('systemctl', 'disable', '--now', unit, check=False, stderr=subprocess.DEVNULL)
+                os.unlink(path)
+                changed.append(f"-{unit}")
+        if not changed:
+            return False
+        run('systemctl', 'daemon-reload')
+        logging.info(f"updated {', '.join(changed)}")
+
+
+class Services(Step):
+    def __init__(self, services):
+        self.services = services
+        self.name = f"services ({', '.join(services)})"
+
+    def pending(self):
+        return [service for service in self.services
+                if output('systemctl', 'is-enabled', service) is None or output('systemctl', 'is-active', service) is None]
+
+    def satisfied(self):
+        return not self.pending()
+
+    def apply(self, files):
+        for service in self.pending():
+            run('systemctl', 'enable', '--now', service)
+
+
+def build_plan(args):
+    server_dir = os.path.join(args.home, 'server')
+    packages = list(PACKAGES)
+    steps = []
+    if args.java_package:
+        packages.append(args.java_package)
+    steps += [Packages(packages), User('minecraft'), Firewall(PORTS),
+              Directories([server_dir, os.path.join(args.home, 'mctools'), os.path.join(args.home, 'services-backup')],
+                          'minecraft'),
+              Rcon()]
+    if not args.java_package:
+        steps.append(Corretto())
+    if args.restore:
+        steps.append(Restore(args.restore, server_dir, 'minecraft'))
+    elif args.flavour:
+        steps += [ServerJar(args.flavour, args.version, server_dir, 'minecraft'),
+                  DefaultFiles(server_dir, 'minecraft', args.repo_url)]
+    overrides = {'minecraft.service': args.minecraft_unit} if args.minecraft_unit else None
+    steps += [UnitFiles(args.repo_url, overrides, backup_dir=os.path.join(args.home, 'services-backup')),
+              Services(SERVICES)]
+    return steps
+
+
+def unique_artifacts(steps):
+    artifacts = {}
+    for step in steps:
+        for artifact in step.artifacts:
+            artifacts.setdefault(artifact.key, artifact)
+    return list(artifacts.values())
+
+
+def dry_run(steps, cache):
+    for step in steps:
+        satisfied = step.satisfied()
+        print(f"{'ok  ' if satisfied else 'todo'}  {step.name}")
+        if satisfied:
+            continue
+        for artifact in step.artifacts:
+            entry = cache.cached(artifact.key)
+            if entry and (cache.offline or (artifact.immutable and entry['url'] == artifact.url)):
+                source = f"cached ({os.path.basename(entry['url'])})"
+            elif cache.offline:
+                source = 'MISSING from the cache'
+            elif entry:
+                source = f"cached if still current ({os.path.basename(entry['url'])})"
+            else:
+                source = f"download {artifact.url or '(resolved at run time)'}"
+            print(f"        {artifact.key}: {source}")
+
+
+def provision(steps, cache, workers=8):
+    """Run the steps that are not yet satisfied; returns the names of the steps applied."""
+    started = time.monotonic()
+    pending = [step for step in steps if not step.satisfied()]
+    for step in steps:
+        if step not in pending:
+            logging.info(f"ok: {step.name}")
+    applied = []
+    with ThreadPoolExecutor(workers) as pool:
+        # Every download starts now; each step only waits for its own
+        downloads = {artifact.key: pool.submit(cache.fetch, artifact) for artifact in unique_artifacts(pending)}
+        for step in pending:
+            step_started = time.monotonic()
+            files = {artifact.key: downloads[artifact.key].result() for artifact in step.artifacts}
+            if step.apply(files) is False:
+                logging.info(f"ok: {step.name}")
+                continue
+            applied.append(step.name)
+            logging.info(f"done: {step.name} ({time.monotonic() - step_started:.1f}s)")
+    logging.info(f"provisioned in {time.monotonic() - started:.1f}s, {len(applied)} of {len(steps)} steps run")
+    return applied
+
+
+def prefetch(steps, cache, workers=8):
+    """Download every artifact of every step into the cache, e.g. while baking a VM image."""
+    with ThreadPoolExecutor(workers) as pool:
+        for path in pool.map(cache.fetch, unique_artifacts(steps)):
+            logging.info(f"cached {path}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Provision the Minecraft server VM.')
+    server = parser.add_mutually_exclusive_group()
+    server.add_argument('--flavour', choices=FLAVOURS, help='install a new server of this flavour')
+    server.add_argument('--restore', metavar='ARCHIVE', help='restore the server from a zip (URL, Dropbox link or path)')
+    parser.add_argument('--version', default='latest', help="Minecraft version for --flavour (default latest)")
+    parser.add_argument('--home', default=HOME, help='home of the minecraft user')
+    parser.add_argument('--java-package', help='install Java from this distribution package instead of Corretto')
+    parser.add_argument('--minecraft-unit', metavar='URL', help='install minecraft.service from this URL')
+    parser.add_argument('--repo-url', default=REPO_URL, help='where service files and defaults are fetched from')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE)
+    parser.add_argument('--offline', action='store_true', help='only use artifacts already in the cache')
+    parser.add_argument('--dry-run', action='store_true', help='show what would be done without changing anything')
+    parser.add_argument('--prefetch', action='store_true', help='only download every artifact into the cache')
+    parser.add_argument('--workers', type=int, default=8, help='parallel downloads')
+    parser.add_argument('--reboot', action='store_true', help='reboot once done if any step was run')
+    return parser.parse_args(argv)
+
+
+def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    cache = ArtifactCache(args.cache_dir, offline=args.offline)
+    steps = build_plan(args)
+    if args.dry_run:
+        dry_run(steps, cache)
+        return
+    if args.prefetch:
+        prefetch(steps, cache, args.workers)
+        return
+    if os.geteuid() != 0:
+        raise SystemExit('Please run as root')
+    try:
+        applied = provision(steps, cache, args.workers)
+    except (ProvisionError, subprocess.CalledProcessError, OSError) as e:
+        raise SystemExit(f"Error: {e}")
+    if applied and args.reboot:
+        logging.info('rebooting')
+        run('systemctl', 'reboot')
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,203 @@
+"""Long-lived async RCON client for the Minecraft server.
+
+One authenticated connection is kept open and shared. Commands are
+pipelined on it: each gets its own request ID, and responses are matched
+back to their caller by ID. This lets `list`, `save-all`, `say` and
+`stop` all be in flight at once.
+
+Minecraft splits long responses over several packets without an end
+marker. So every command is followed by a sentinel packet of an unknown
+type. The server answers requests in order, so the reply to the sentinel
+marks the end of the command's response.
+"""
+
+import time
+import struct
+import asyncio
+import logging
+import itertools
+
+from mctools.metrics import Counter, Histogram
+
+SERVERDATA_RESPONSE_VALUE = 0
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_AUTH = 3
+
+_HEADER = struct.Struct('<iii')
+
+RCON_SECONDS = Histogram('mc_rcon_command_seconds', 'RCON command round-trip time.', ['command'])
+RCON_ERRORS = Counter('mc_rcon_errors_total', 'RCON commands that failed or timed out.', ['command'])
+
+
+class RconError(Exception):
+    pass
+
+
+class RconAuthError(RconError):
+    pass
+
+
+class RconDisconnected(RconError):
+    """The connection closed while a command was waiting for its response."""
+
+
+def encode_packet(request_id, packet_type, body):
+    payload = body.encode('utf-8') + b'\x00\x00'
+    return _HEADER.pack(len(payload) + 8, request_id, packet_type) + payload
+
+
+async def read_packet(reader):
+    length, request_id, packet_type = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    body = await reader.readexactly(length - 8)
+    return request_id, packet_type, body[:-2].decode('utf-8', errors='replace')
+
+
+class RconClient:
+    def __init__(self, host, port, password, timeout=5, reconnect_delay=1, max_reconnect_delay=30):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._ids = itertools.count(1)
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._connect_lock = asyncio.Lock()
+        self._delay = reconnect_delay
+        # request id -> (future, response chunks)
+        self._pending = {}
+        # sentinel id -> request id it terminates
+        self._sentinels = {}
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _next_id(self):
+        request_id = next(self._ids)
+        if request_id >= 2 ** 31 - 1:
+            self._ids = itertools.count(1)
+            request_id = next(self._ids)
+        return request_id
+
+    async def connect(self, timeout=None):
+        """Connect and authenticate, retrying with exponential backoff until `timeout`."""
+        timeout = self.timeout if timeout is None else timeout
+        async with self._connect_lock:
+            if self.connected:
+                return
+            loop = asyncio.get_running_loop()
+            give_up_at = loop.time() + timeout
+            while True:
+                try:
+                    await asyncio.wait_for(self._open(), max(give_up_at - loop.time(), 0.1))
+                    self._delay = self.reconnect_delay
+                    return
+                except RconAuthError:
+                    raise
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    remaining = give_up_at - loop.time()
+                    if remaining <= 0:
+                        raise ConnectionError(f"Could not connect to RCON at {self.host}:{self.port}: {e}") from e
+                    logging.info(f"RCON connection failed ({e}), retrying in {self._delay}s")
+                    await asyncio.sleep(min(self._delay, remaining))
+                    self._delay = min(self._delay * 2, self.max_reconnect_delay)
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            auth_id = self._next_id()
+            writer.write(encode_packet(auth_id, SERVERDATA_AUTH, self.password))
+            await writer.drain()
+            while True:
+                request_id, packet_type, _ = await read_packet(reader)
+                if packet_type == SERVERDATA_AUTH_RESPONSE:
+                    break
+            if request_id == -1:
+                raise RconAuthError('RCON authentication failed')
+        except BaseException:
+            writer.close()
+            raise
+        self._reader, self._writer = reader, writer
+        self._read_task = asyncio.ensure_future(self._read_loop(reader, writer))
+
+    async def _read_loop(self, reader, writer):
+        try:
+            while True:
+                request_id, _, body = await read_packet(reader)
+                if request_id in self._sentinels:
+                    entry = self._pending.pop(self._sentinels.pop(request_id), None)
+                    if entry is not None and not entry[0].done():
+                        entry[0].set_result(''.join(entry[1]))
+                elif request_id in self._pending:
+                    self._pending[request_id][1].append(body)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            logging.info(f"RCON connection closed: {e}")
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._reader = self._writer = None
+            self._fail_pending(RconDisconnected('RCON connection closed'))
+
+    def _fail_pending(self, error):
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._sentinels.clear()
+
+    async def run(self, command, timeout=None):
+        """Send `command` and return its full response text."""
+        timeout = self.timeout if timeout is None else timeout
+        # Only the command name, so arguments such as chat text do not explode label cardinality
+        name = command.split(' ', 1)[0]
+        started = time.monotonic()
+        try:
+            if not self.connected:
+                await self.connect(timeout)
+            response = await self._send(command, timeout)
+        except Exception:
+            RCON_ERRORS.inc(command=name)
+            raise
+        RCON_SECONDS.observe(time.monotonic() - started, command=name)
+        return response
+
+    async def _send(self, command, timeout):
+        request_id = self._next_id()
+        sentinel_id = self._next_id()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (future, [])
+        self._sentinels[sentinel_id] = request_id
+        # Both packets go out in one write so pipelined commands never interleave
+        self._writer.write(encode_packet(request_id, SERVERDATA_EXECCOMMAND, command)
+                           + encode_packet(sentinel_id, SERVERDATA_RESPONSE_VALUE, ''))
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+            self._sentinels.pop(sentinel_id, None)
+
+    async def run_many(self, *commands, timeout=None):
+        """Pipeline several commands on the connection and return their responses in order."""
+        return await asyncio.gather(*(self.run(command, timeout) for command in commands))
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._read_task is not None:
+            try:
+                await self._read_task
+            except Exception:
+                pass
+        self._reader = self._writer = self._read_task = None
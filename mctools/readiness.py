@@ -0,0 +1,102 @@
+"""Readiness polling for a freshly started Minecraft server.
+
+Instead of sleeping for a fixed time and probing once, `wait_until_ready`
+walks through three stages and polls each one with exponential backoff
+until an overall deadline expires:
+
+    power  the cloud VM reports 'running'
+    tcp    the Minecraft port accepts connections
+    slp    a Server List Ping status request succeeds
+"""
+
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from mcstatus import JavaServer
+
+STAGES = ('power', 'tcp', 'slp')
+
+
+@dataclass
+class ReadinessReport:
+    ready: bool = False
+    # Last stage that completed, or None if the VM never reported running
+    stage: str = None
+    # Seconds spent in each completed stage
+    latencies: dict = field(default_factory=dict)
+    version: str = None
+
+    @property
+    def total(self):
+        return sum(self.latencies.values())
+
+
+async def _check_power(vm, host, port, timeout):
+    return await vm.power_state() == 'running'
+
+
+async def _check_tcp(vm, host, port, timeout):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def _check_slp(vm, host, port, timeout):
+    try:
+        status = await JavaServer(host, port, timeout=timeout).async_status()
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return False
+    return status
+
+
+_CHECKS = {'power': _check_power, 'tcp': _check_tcp, 'slp': _check_slp}
+
+
+async def wait_until_ready(vm, host, port, deadline=300, initial_delay=1, max_delay=15, probe_timeout=3, on_stage=None):
+    """Poll `vm` and the server at host:port until it answers status pings.
+
+    `on_stage(stage, seconds)` is awaited each time a stage completes. The
+    returned report holds per-stage latencies even when the deadline is hit.
+    """
+    report = ReadinessReport()
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+
+    for stage in STAGES:
+        check = _CHECKS[stage]
+        stage_started = time.monotonic()
+        delay = initial_delay
+        while True:
+            try:
+                result = await check(vm, host, port, probe_timeout)
+            except Exception as e:
+                logging.error(f"Readiness check '{stage}' failed: {e}")
+                result = False
+            if result:
+                break
+            remaining = give_up_at - loop.time()
+            if remaining <= 0:
+                return report
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+        elapsed = time.monotonic() - stage_started
+        report.latencies[stage] = elapsed
+        report.stage = stage
+        if stage == 'slp':
+            report.version = result.version.name
+        logging.info(f"Readiness stage '{stage}' reached after {elapsed:.1f}s")
+        if on_stage is not None:
+            await on_stage(stage, elapsed)
+
+    report.ready = True
+    return report
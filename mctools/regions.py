@@ -0,0 +1,450 @@
+"""Region-file analyzer and offline world optimizer.
+
+Worlds only grow: every chunk a player flies past is saved for good, and
+region files keep the sectors of chunks that were rewritten elsewhere.
+This tool memory-maps the Anvil region files (`region`, `entities` and
+`poi`) and reads their location and timestamp tables as NumPy arrays. It
+also gathers the length and compression byte of every chunk with one
+fancy-indexing pass over the map. That is enough to report sizes, free
+sectors and compression without decompressing anything.
+
+The one number that needs the chunk data is InhabitedTime, the ticks
+players have spent near a chunk. Chunks are inflated incrementally and
+only until the `InhabitedTime` tag turns up, several region files at
+once (zlib releases the GIL). Results are cached by chunk timestamp in
+an .npz file, so a later run only reads the chunks saved since.
+
+`optimize` rewrites region files, most wasted space first, within a time
+budget:
+- defragment: pack the chunks contiguously, dropping free sectors
+- `--recompress deflate|none|server`: re-encode chunks, e.g. to match
+  `region-file-compression` in server.properties (lz4 chunks are kept as they are)
+- `--prune-below TICKS`: drop chunks with InhabitedTime at or below TICKS
+  (0 = never visited), with their entities and POI, outside `--keep-radius`
+  blocks of `--keep-x`/`--keep-z`. This also undoes chunk pre-generation,
+  so keep the pre-generated radius.
+
+It refuses to touch a world whose session.lock is held, i.e. while the
+server runs. The idle daemon can run it between stopping the server and
+powering off (`--optimize-world`).
+
+Run with `python3 -m mctools.regions report` or `optimize`.
+"""
+
+import os
+import re
+import json
+import mmap
+import time
+import zlib
+import fcntl
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from mctools.backup import world_paths
+from mctools.properties import read_properties
+
+SECTOR = 4096
+HEADER_SIZE = 2 * SECTOR
+REGION_RE = re.compile(r'^r\.(-?\d+)\.(-?\d+)\.mca$')
+DEFAULT_CACHE_PATH = '/home/minecraft/region-cache.npz'
+
+COMPRESSION_NAMES = {1: 'gzip', 2: 'deflate', 3: 'none', 4: 'lz4', 127: 'custom'}
+# Types this tool can decode and write; lz4 chunks are left alone
+COMPRESSION_IDS = {'deflate': 2, 'none': 3}
+# Flag in the compression byte for chunks stored in a separate c.<x>.<z>.mcc file
+EXTERNAL = 0x80
+
+INHABITED_TAG = b'\x04\x00\x0dInhabitedTime'
+# Upper bounds in ticks (20 per second) for the InhabitedTime report
+INHABITED_BUCKETS = [(0, 'never visited'), (1200, 'under 1 min'), (12000, 'under 10 min'),
+                     (72000, 'under 1 h'), (None, '1 h or more')]
+
+
+class WorldInUse(Exception):
+    pass
+
+
+def region_files(server_dir):
+    """Paths of the world's region files, relative to `server_dir`."""
+    return [path for path in world_paths(server_dir) if path.endswith('.mca')
+            and REGION_RE.match(os.path.basename(path)) and os.path.basename(os.path.dirname(path)) in ('region', 'entities', 'poi')]
+
+
+def server_running(server_dir):
+    """True while some world's session.lock is held, which the server does for as long as it runs."""
+    for root in {path.split(os.sep)[0] for path in region_files(server_dir)}:
+        lock_path = os.path.join(server_dir, root, 'session.lock')
+        if not os.path.exists(lock_path):
+            continue
+        fd = os.open(lock_path, os.O_RDWR)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+    return False
+
+
+class Region:
+    """The chunk tables of one region file, as arrays indexed by chunk slot (x + z * 32)."""
+
+    def __init__(self, server_dir, relpath):
+        self.relpath = relpath
+        self.path = os.path.join(server_dir, relpath)
+        self.kind = os.path.basename(os.path.dirname(relpath))
+        match = REGION_RE.match(os.path.basename(relpath))
+        self.rx, self.rz = int(match.group(1)), int(match.group(2))
+        self.size = os.path.getsize(self.path)
+        self.offsets = np.zeros(1024, dtype=np.int64)
+        self.sectors = np.zeros(1024, dtype=np.int64)
+        self.timestamps = np.zeros(1024, dtype=np.uint32)
+        self.lengths = np.zeros(1024, dtype=np.int64)
+        self.compression = np.zeros(1024, dtype=np.int16)
+        # -1 where unknown
+        self.inhabited = np.full(1024, -1, dtype=np.int64)
+        self.present = np.zeros(1024, dtype=bool)
+        if self.size >= HEADER_SIZE:
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self._read_tables(mm)
+
+    def _read_tables(self, mm):
+        table = np.frombuffer(mm, dtype='>u4', count=2048).astype(np.int64)
+        self.offsets = table[:1024] >> 8
+        self.sectors = table[:1024] & 0xFF
+        self.timestamps = table[1024:].astype(np.uint32)
+        self.present = (self.offsets >= 2) & (self.sectors > 0) & ((self.offsets + self.sectors) * SECTOR <= self.size)
+
+        # Length (4 bytes) and compression type (1 byte) at the start of every chunk, in one gather
+        starts = self.offsets[self.present] * SECTOR
+        data = np.frombuffer(mm, dtype=np.uint8)
+        record = data[starts[:, None] + np.arange(5)].astype(np.int64)
+        lengths = (record[:, 0] << 24) | (record[:, 1] << 16) | (record[:, 2] << 8) | record[:, 3]
+        self.lengths[self.present] = lengths
+        self.compression[self.present] = record[:, 4]
+        # A length past its sectors means a corrupt slot; leave it out of everything
+        self.present[self.present] = (lengths >= 1) & (lengths + 4 <= self.sectors[self.present] * SECTOR)
+
+    @property
+    def used_bytes(self):
+        return int(self.sectors[self.present].sum()) * SECTOR
+
+    @property
+    def wasted_bytes(self):
+        """Free sectors that a defragmented file would not have."""
+        return max(self.size - HEADER_SIZE - self.used_bytes, 0)
+
+    def chunk_coords(self, indexes):
+        indexes = np.asarray(indexes)
+        return self.rx * 32 + indexes % 32, self.rz * 32 + indexes // 32
+
+    def sibling(self, server_dir, kind):
+        """The path of the same region in the `entities` or `poi` folder next to this one."""
+        return os.path.join(server_dir, os.path.dirname(os.path.dirname(self.relpath)), kind, os.path.basename(self.relpath))
+
+
+def find_inhabited(payload, compression):
+    """InhabitedTime from a chunk's compressed NBT, inflating only until the tag turns up; None if unreadable."""
+    need = len(INHABITED_TAG) + 8
+    if compression == 3:
+        found = payload.find(INHABITED_TAG)
+        return int.from_bytes(payload[found + len(INHABITED_TAG):found + need], 'big', signed=True) if found >= 0 else None
+    if compression not in (1, 2):
+        return None
+    inflater = zlib.decompressobj(31 if compression == 1 else 15)
+    buffer = b''
+    for start in range(0, len(payload), 16384):
+        try:
+            buffer += inflater.decompress(payload[start:start + 16384])
+        except zlib.error:
+            return None
+        found = buffer.find(INHABITED_TAG)
+        if found >= 0 and len(buffer) >= found + need:
+            return int.from_bytes(buffer[found + len(INHABITED_TAG):found + need], 'big', signed=True)
+        if found < 0:
+            # Keep enough for a tag split across two pieces
+            buffer = buffer[-need:]
+    return None
+
+
+def read_inhabited(region, cached=None):
+    """Fill in `region.inhabited`, reusing cached values for chunks whose timestamp has not changed."""
+    todo = region.present.copy()
+    if region.kind != 'region':
+        return region
+    if cached is not None:
+        timestamps, inhabited = cached
+        same = region.present & (timestamps == region.timestamps) & (inhabited >= 0)
+        region.inhabited[same] = inhabited[same]
+        todo &= ~same
+    # External chunks are rare and large; they are left as unknown
+    todo &= (region.compression & EXTERNAL) == 0
+    if not todo.any():
+        return region
+    with open(region.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for index in np.flatnonzero(todo):
+            start = int(region.offsets[index]) * SECTOR + 5
+            value = find_inhabited(mm[start:start + int(region.lengths[index]) - 1], int(region.compression[index]))
+            if value is not None:
+                region.inhabited[index] = value
+    return region
+
+
+def load_cache(path):
+    try:
+        with np.load(path) as saved:
+            return {name: (timestamps, inhabited) for name, timestamps, inhabited
+                    in zip(saved['names'], saved['timestamps'], saved['inhabited'])}
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return {}
+
+
+def save_cache(path, regions):
+    regions = [region for region in regions if region.kind == 'region']
+    temp = path + '.tmp.npz'
+    np.savez(temp, names=np.array([region.relpath for region in regions], dtype=str),
+             timestamps=np.array([region.timestamps for region in regions], dtype=np.uint32).reshape(-1, 1024),
+             inhabited=np.array([region.inhabited for region in regions], dtype=np.int64).reshape(-1, 1024))
+    os.replace(temp, path)
+
+
+def scan(server_dir, cache_path=DEFAULT_CACHE_PATH, inhabited=True, workers=None):
+    """Read every region file's tables, and InhabitedTime unless `inhabited` is False."""
+    regions = [Region(server_dir, relpath) for relpath in region_files(server_dir)]
+    if inhabited:
+        cache = load_cache(cache_path) if cache_path else {}
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            list(pool.map(lambda region: read_inhabited(region, cache.get(region.relpath)), regions))
+        if cache_path:
+            try:
+                save_cache(cache_path, regions)
+            except OSError as e:
+                logging.warning(f"could not save the InhabitedTime cache: {e}")
+    return regions
+
+
+def report(regions):
+    """Totals per kind of region file, compression types, and chunk counts and sizes by InhabitedTime."""
+    summary = {'kinds': {}, 'compression': {}, 'inhabited': [], 'top_regions': []}
+    for kind in ('region', 'entities', 'poi'):
+        selected = [region for region in regions if region.kind == kind]
+        summary['kinds'][kind] = {
+            'files': len(selected),
+            'chunks': int(sum(region.present.sum() for region in selected)),
+            'bytes': sum(region.size for region in selected),
+            'wasted_bytes': sum(region.wasted_bytes for region in selected),
+        }
+
+    terrain = [region for region in regions if region.kind == 'region']
+    if not terrain:
+        return summary
+    present = np.concatenate([region.present for region in terrain])
+    compression = np.concatenate([region.compression for region in terrain])[present]
+    types, counts = np.unique(compression & ~EXTERNAL, return_counts=True)
+    summary['compression'] = {COMPRESSION_NAMES.get(int(t), str(t)): int(c) for t, c in zip(types, counts)}
+
+    inhabited = np.concatenate([region.inhabited for region in terrain])[present]
+    sizes = np.concatenate([region.sectors for region in terrain])[present] * SECTOR
+    lower = 0
+    for upper, label in INHABITED_BUCKETS:
+        selected = (inhabited >= lower) & ((inhabited <= upper) if upper is not None else True)
+        summary['inhabited'].append({'label': label, 'chunks': int(selected.sum()), 'bytes': int(sizes[selected].sum())})
+        lower = (upper or 0) + 1
+    summary['inhabited'].append({'label': 'unknown', 'chunks': int((inhabited < 0).sum()),
+                                 'bytes': int(sizes[inhabited < 0].sum())})
+
+    totals = sorted(((int(region.inhabited[region.inhabited > 0].sum()), region.relpath) for region in terrain), reverse=True)
+    summary['top_regions'] = [{'region': relpath, 'inhabited_ticks': ticks} for ticks, relpath in totals[:5] if ticks]
+    return summary
+
+
+def _mb(size):
+    return f"{size / (1 << 20):,.1f} MB"
+
+
+def format_report(summary):
+    lines = []
+    for kind, stats in summary['kinds'].items():
+        if stats['files']:
+            lines.append(f"{kind}: {stats['files']} files, {stats['chunks']:,} chunks, {_mb(stats['bytes'])} "
+                         f"({_mb(stats['wasted_bytes'])} free sectors)")
+    if summary['compression']:
+        lines.append('compression: ' + ', '.join(f"{name} {count:,}" for name, count in summary['compression'].items()))
+    for bucket in summary['inhabited']:
+        if bucket['chunks']:
+            lines.append(f"  {bucket['label']}: {bucket['chunks']:,} chunks, {_mb(bucket['bytes'])}")
+    for top in summary['top_regions']:
+        lines.append(f"  most visited: {top['region']} ({top['inhabited_ticks'] / 72000:.1f} player-hours)")
+    return '\n'.join(lines)
+
+
+def recompress(record, target, level):
+    """Re-encode one chunk record (length, type, payload) with compression `target`; None to keep it."""
+    compression = record[4]
+    if compression & EXTERNAL or compression == target or compression not in (1, 2, 3):
+        return None
+    payload = record[5:]
+    if compression != 3:
+        try:
+            payload = zlib.decompress(payload, 31 if compression == 1 else 15)
+        except zlib.error:
+            return None
+    if target == 2:
+        payload = zlib.compress(payload, level)
+    new = (len(payload) + 1).to_bytes(4, 'big') + bytes([target]) + payload
+    # Chunks over 255 sectors would have to move to an external file
+    return new if len(new) <= 255 * SECTOR else None
+
+
+def rewrite_region(region, keep, compression=None, level=6, dry_run=False):
+    """Rewrite the region file with the chunks in `keep` packed contiguously; returns the bytes saved."""
+    keep = keep & region.present
+    if not dry_run:
+        for index in np.flatnonzero(region.present & ~keep & (region.compression >= EXTERNAL)):
+            x, z = region.chunk_coords(index)
+            try:
+                os.remove(os.path.join(os.path.dirname(region.path), f"c.{x}.{z}.mcc"))
+            except FileNotFoundError:
+                pass
+    if not keep.any():
+        if not dry_run:
+            os.remove(region.path)
+        return region.size
+
+    locations = np.zeros(1024, dtype='>u4')
+    timestamps = np.where(keep, region.timestamps, 0).astype('>u4')
+    temp = region.path + '.tmp'
+    sector = 2
+    with open(region.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        output = open(os.devnull if dry_run else temp, 'wb')
+        with output:
+            output.seek(HEADER_SIZE)
+            # In file order, so reads stay sequential
+            for index in sorted(np.flatnonzero(keep), key=lambda i: region.offsets[i]):
+                start = int(region.offsets[index]) * SECTOR
+                record = mm[start:start + 4 + int(region.lengths[index])]
+                if compression is not None:
+                    record = recompress(record, compression, level) or record
+                sectors = -(-len(record) // SECTOR)
+                output.write(record + b'\0' * (sectors * SECTOR - len(record)))
+                locations[index] = (sector << 8) | sectors
+                sector += sectors
+            output.seek(0)
+            output.write(locations.tobytes() + timestamps.tobytes())
+            if not dry_run:
+                output.flush()
+                os.fsync(output.fileno())
+    if not dry_run:
+        # The idle daemon runs this as root; the server must still own its files
+        stat = os.stat(region.path)
+        os.chown(temp, stat.st_uid, stat.st_gid)
+        os.chmod(temp, stat.st_mode)
+        os.replace(temp, region.path)
+    return region.size - sector * SECTOR
+
+
+def prune_mask(region, below, keep_center=(0, 0), keep_radius=0):
+    """Chunks to keep: visited for more than `below` ticks (or unknown), or within the kept radius."""
+    x, z = region.chunk_coords(np.arange(1024))
+    near = (np.abs(x - keep_center[0] // 16) <= keep_radius // 16) & (np.abs(z - keep_center[1] // 16) <= keep_radius // 16)
+    return (region.inhabited > below) | (region.inhabited < 0) | near
+
+
+def optimize(server_dir, regions, compression=None, level=6, prune_below=None, keep_center=(0, 0), keep_radius=0,
+             min_waste=0.1, budget=None, dry_run=False):
+    """Rewrite the region files that gain the most, until `budget` seconds are used; returns a summary."""
+    if server_running(server_dir):
+        raise WorldInUse('the server is running (session.lock is held)')
+    deadline = time.monotonic() + budget if budget else None
+    by_path = {region.path: region for region in regions}
+
+    # What to keep in every file: pruning decides on terrain and applies to the entities and POI alongside it
+    plans = {region.path: region.present.copy() for region in regions}
+    if prune_below is not None:
+        for region in regions:
+            if region.kind == 'region':
+                keep = prune_mask(region, prune_below, keep_center, keep_radius)
+                for path in (region.path, region.sibling(server_dir, 'entities'), region.sibling(server_dir, 'poi')):
+                    if path in plans:
+                        plans[path] &= keep
+
+    def worth(region):
+        dropped = int(region.sectors[region.present & ~plans[region.path]].sum()) * SECTOR
+        recompressing = compression is not None and bool(
+            (region.present & (region.compression != compression) & (region.compression < EXTERNAL)).any())
+        return region.wasted_bytes + dropped, recompressing
+
+    candidates = []
+    for path, region in by_path.items():
+        gain, recompressing = worth(region)
+        if recompressing or gain >= max(min_waste * region.size, SECTOR):
+            candidates.append((gain, region))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    result = {'files': 0, 'saved_bytes': 0, 'pruned_chunks': 0, 'skipped_files': 0}
+    for gain, region in candidates:
+        if deadline is not None and time.monotonic() > deadline:
+            result['skipped_files'] = len(candidates) - result['files']
+            break
+        keep = plans[region.path]
+        result['pruned_chunks'] += int((region.present & ~keep).sum()) if region.kind == 'region' else 0
+        result['saved_bytes'] += rewrite_region(region, keep, compression, level, dry_run)
+        result['files'] += 1
+    return result
+
+
+def main(args):
+    regions = scan(args.server_dir, None if args.no_cache else args.cache,
+                   inhabited=args.command == 'report' or args.prune_below is not None)
+    if args.command == 'report':
+        summary = report(regions)
+        print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+        return
+
+    compression = args.recompress
+    if compression == 'server':
+        properties = read_properties(os.path.join(args.server_dir, 'server.properties'))
+        compression = properties.get('region-file-compression', 'deflate') or 'deflate'
+    if compression is not None and compression not in COMPRESSION_IDS:
+        raise SystemExit(f"cannot recompress to {compression}; supported: {', '.join(COMPRESSION_IDS)}")
+    result = optimize(args.server_dir, regions, compression=COMPRESSION_IDS.get(compression), level=args.level,
+                      prune_below=args.prune_below, keep_center=(args.keep_x, args.keep_z), keep_radius=args.keep_radius,
+                      min_waste=args.min_waste, budget=args.budget, dry_run=args.dry_run)
+    logging.info(f"{'would rewrite' if args.dry_run else 'rewrote'} {result['files']} region files, "
+                 f"saving {_mb(result['saved_bytes'])} and pruning {result['pruned_chunks']:,} chunks"
+                 + (f"; {result['skipped_files']} files left for next time" if result['skipped_files'] else ''))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze and optimize the region files of a Minecraft world.')
+    parser.add_argument('--server-dir', default='/home/minecraft/server')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='InhabitedTime cache')
+    parser.add_argument('--no-cache', action='store_true')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    report_parser = subparsers.add_parser('report', help='sizes, free space, compression and chunks by InhabitedTime')
+    report_parser.add_argument('--json', action='store_true')
+
+    optimize_parser = subparsers.add_parser('optimize', help='defragment, recompress and prune region files (server stopped)')
+    optimize_parser.add_argument('--recompress', choices=('deflate', 'none', 'server'),
+                                 help="'server' uses region-file-compression from server.properties")
+    optimize_parser.add_argument('--level', type=int, default=6, help='zlib level for deflate')
+    optimize_parser.add_argument('--prune-below', type=int, help='drop chunks with InhabitedTime at or below this many ticks')
+    optimize_parser.add_argument('--keep-radius', type=int, default=0, help='blocks around the keep center never pruned')
+    optimize_parser.add_argument('--keep-x', type=int, default=0)
+    optimize_parser.add_argument('--keep-z', type=int, default=0)
+    optimize_parser.add_argument('--min-waste', type=float, default=0.1,
+                                 help='share of a file that must be reclaimable before it is rewritten')
+    optimize_parser.add_argument('--budget', type=float, help='stop starting new files after this many seconds')
+    optimize_parser.add_argument('--dry-run', action='store_true')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    main(parse_args())
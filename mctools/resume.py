@@ -0,0 +1,88 @@
+"""Stop-to-ready history per stop mode.
+
+Every time a server is taken down, the stop mode and time are recorded.
+On the next start, the time from the start call until the server answers
+status pings is recorded against that mode, together with how long it
+was down. `summary` turns this into resume latency and stopped-time cost
+per mode, so the mode with the best latency per dollar can be picked for
+each server.
+"""
+
+import os
+import json
+import time
+
+from mctools.telemetry import percentile
+
+
+class ResumeHistory:
+    def __init__(self, path=None, limit=200):
+        self.path = path
+        self.limit = limit
+        # {'mode', 'at'} for the stop the next start resumes from
+        self.last_stop = None
+        self.resumes = []
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self.last_stop = saved.get('last_stop')
+            self.resumes = saved.get('resumes', [])
+
+    def save(self):
+        if not self.path:
+            return
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'last_stop': self.last_stop, 'resumes': self.resumes}, f)
+        os.replace(temp, self.path)
+
+    def record_stop(self, mode, when=None):
+        self.last_stop = {'mode': mode, 'at': time.time() if when is None else when}
+        self.save()
+
+    def record_resume(self, seconds, when=None):
+        """Record a start that took `seconds` until ready; returns the stop mode it resumed from."""
+        when = time.time() if when is None else when
+        stop = self.last_stop or {'mode': 'unknown', 'at': None}
+        self.resumes.append({
+            'mode': stop['mode'],
+            'seconds': seconds,
+            'stopped_hours': (when - seconds - stop['at']) / 3600 if stop['at'] else None,
+            'at': when,
+        })
+        del self.resumes[:-self.limit]
+        self.last_stop = None
+        self.save()
+        return stop['mode']
+
+    def summary(self, hourly_costs=None):
+        """Per mode: resume count and percentiles, mean hours stopped and the cost of that downtime."""
+        hourly_costs = hourly_costs or {}
+        modes = {}
+        for mode in sorted({resume['mode'] for resume in self.resumes}):
+            resumes = [resume for resume in self.resumes if resume['mode'] == mode]
+            hours = [resume['stopped_hours'] for resume in resumes if resume['stopped_hours'] is not None]
+            mean_hours = sum(hours) / len(hours) if hours else None
+            rate = hourly_costs.get(mode)
+            modes[mode] = {
+                'resumes': len(resumes),
+                'p50_seconds': percentile([resume['seconds'] for resume in resumes], 50),
+                'p90_seconds': percentile([resume['seconds'] for resume in resumes], 90),
+                'mean_stopped_hours': mean_hours,
+                'hourly_cost': rate,
+                'cost_per_stop': rate * mean_hours if rate is not None and mean_hours is not None else None,
+            }
+        return modes
+
+
+def format_summary(modes, current_mode=None):
+    if not modes:
+        return 'No resume times recorded yet.'
+    lines = ['**Resume times by stop mode**']
+    for mode, stats in modes.items():
+        line = (f"{mode}{' (current)' if mode == current_mode else ''}: {stats['resumes']} resumes, "
+                f"p50 {stats['p50_seconds']:.0f}s, p90 {stats['p90_seconds']:.0f}s")
+        if stats['cost_per_stop'] is not None:
+            line += f", ${stats['hourly_cost']:.3f}/h while down (${stats['cost_per_stop']:.2f} per stop)"
+        lines.append(line)
+    return '\n'.join(lines)
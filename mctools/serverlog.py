@@ -0,0 +1,232 @@
+"""Streaming, incremental parser for minecraft-server.log.
+
+`LogFollower` turns the log into typed events (player joins and leaves,
+startup time, "Can't keep up" lag warnings and crashes). It resumes from a
+persisted byte offset and copes with the log being rotated or truncated.
+Backfilling over an existing log scans an mmap of the file with a single
+regex, so even multi-GB logs are read without loading them into memory
+or calling readline on every line. The idle daemon, telemetry collector
+and pre-generator run as separate services, each following the log with
+its own `LogFollower`.
+
+Run `python3 -m mctools.serverlog [--follow]` to print events as JSON lines.
+"""
+
+import os
+import re
+import json
+import mmap
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, asdict
+
+# Matches every line worth parsing; used to skip the rest cheaply
+INTERESTING = r"joined the game|left the game|Done \(|Can't keep up|Crash Report|unexpected exception|crash report has been saved"
+INTERESTING_RE = re.compile(INTERESTING.encode())
+INTERESTING_TEXT_RE = re.compile(INTERESTING)
+TIME_RE = re.compile(r'^\[(?:[^\]]*?)(\d{2}:\d{2}:\d{2})')
+JOIN_RE = re.compile(r': (?P<player>\w+) joined the game')
+LEAVE_RE = re.compile(r': (?P<player>\w+) left the game')
+DONE_RE = re.compile(r'Done \((?P<seconds>\d+(?:\.\d+)?)s\)!')
+LAG_RE = re.compile(r"Can't keep up!.*?Running (?P<ms>\d+)ms or (?P<ticks>\d+) ticks behind")
+CRASH_RE = re.compile(r'Minecraft Crash Report|Encountered an unexpected exception|crash report has been saved to: (?P<report>\S+)')
+
+
+@dataclass(frozen=True)
+class LogEvent:
+    # Time of day as printed in the log (HH:MM:SS), if present
+    time: str
+    line: str
+
+    kind = 'event'
+
+    def to_dict(self):
+        return {'kind': self.kind, **asdict(self)}
+
+
+@dataclass(frozen=True)
+class PlayerJoined(LogEvent):
+    player: str = None
+    kind = 'join'
+
+
+@dataclass(frozen=True)
+class PlayerLeft(LogEvent):
+    player: str = None
+    kind = 'leave'
+
+
+@dataclass(frozen=True)
+class ServerStarted(LogEvent):
+    # Startup time reported by the server in its "Done (x.xxxs)!" line
+    seconds: float = 0.0
+    kind = 'started'
+
+
+@dataclass(frozen=True)
+class LagWarning(LogEvent):
+    ms: int = 0
+    ticks: int = 0
+    kind = 'lag'
+
+
+@dataclass(frozen=True)
+class ServerCrashed(LogEvent):
+    report: str = None
+    kind = 'crash'
+
+
+def parse_line(line):
+    """Return the event for a single log line, or None if it is not interesting."""
+    if not INTERESTING_TEXT_RE.search(line):
+        return None
+    match = TIME_RE.match(line)
+    timestamp = match.group(1) if match else None
+
+    match = JOIN_RE.search(line)
+    if match:
+        return PlayerJoined(timestamp, line, match.group('player'))
+    match = LEAVE_RE.search(line)
+    if match:
+        return PlayerLeft(timestamp, line, match.group('player'))
+    match = DONE_RE.search(line)
+    if match:
+        return ServerStarted(timestamp, line, float(match.group('seconds')))
+    match = LAG_RE.search(line)
+    if match:
+        return LagWarning(timestamp, line, int(match.group('ms')), int(match.group('ticks')))
+    match = CRASH_RE.search(line)
+    if match:
+        return ServerCrashed(timestamp, line, match.group('report'))
+    return None
+
+
+class LogFollower:
+    def __init__(self, path, offset_path=None, poll_interval=0.5, from_end=False, save_interval=5):
+        self.path = path
+        self.offset_path = offset_path
+        self.poll_interval = poll_interval
+        self.save_interval = save_interval
+        self.inode = None
+        self.offset = 0
+        self._saved_at = 0.0
+
+        if offset_path and os.path.exists(offset_path):
+            with open(offset_path) as f:
+                state = json.load(f)
+            self.inode, self.offset = state.get('inode'), state.get('offset', 0)
+        elif from_end and os.path.exists(path):
+            stat = os.stat(path)
+            self.inode, self.offset = stat.st_ino, stat.st_size
+
+    def _reconcile(self, stat):
+        # A different inode means the log was rotated, a smaller size that it was truncated
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode, self.offset = stat.st_ino, 0
+
+    def save_offset(self, force=False):
+        if not self.offset_path:
+            return
+        now = time.monotonic()
+        if not force and now - self._saved_at < self.save_interval:
+            return
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'inode': self.inode, 'offset': self.offset}, f)
+        os.replace(tmp_path, self.offset_path)
+        self._saved_at = now
+
+    def backfill(self):
+        """Yield events between the saved offset and the current end of the log."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        self._reconcile(stat)
+        if stat.st_size <= self.offset:
+            return
+
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Stop at the last complete line; a partial one is picked up by `follow`
+            end = mm.rfind(b'\n', self.offset) + 1
+            if end <= 0:
+                return
+            last_line_end = -1
+            for match in INTERESTING_RE.finditer(mm, self.offset, end):
+                if match.start() < last_line_end:
+                    continue
+                line_start = mm.rfind(b'\n', 0, match.start()) + 1
+                last_line_end = mm.find(b'\n', match.start(), end)
+                event = parse_line(mm[line_start:last_line_end].decode('utf-8', errors='replace').rstrip('\r'))
+                if event is not None:
+                    yield event
+            self.offset = end
+        self.save_offset(force=True)
+
+    async def follow(self):
+        """Yield events as lines are appended to the log, forever."""
+        handle = None
+        try:
+            while True:
+                if handle is None:
+                    try:
+                        stat = os.stat(self.path)
+                    except FileNotFoundError:
+                        await asyncio.sleep(self.poll_interval)
+                        continue
+                    self._reconcile(stat)
+                    handle = open(self.path, 'rb')
+                    handle.seek(self.offset)
+
+                line = handle.readline()
+                if line.endswith(b'\n'):
+                    self.offset += len(line)
+                    event = parse_line(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+                    if event is not None:
+                        yield event
+                    self.save_offset()
+                    continue
+
+                # Partial or no line: rewind, wait for more output, then check for rotation
+                handle.seek(self.offset)
+                self.save_offset()
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    stat = os.stat(self.path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_ino != self.inode or stat.st_size < self.offset:
+                    handle.close()
+                    handle = None
+        finally:
+            if handle is not None:
+                handle.close()
+            self.save_offset(force=True)
+
+    async def events(self, backfill=True):
+        if backfill:
+            for count, event in enumerate(self.backfill()):
+                yield event
+                if count % 1000 == 0:
+                    await asyncio.sleep(0)
+        async for event in self.follow():
+            yield event
+
+
+async def _print_events(args):
+    follower = LogFollower(args.log, offset_path=args.offset_file)
+    if args.follow:
+        async for event in follower.events():
+            print(json.dumps(event.to_dict()), flush=True)
+    else:
+        for event in follower.backfill():
+            print(json.dumps(event.to_dict()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print events from the Minecraft server log as JSON lines.')
+    parser.add_argument('--log', default='/home/minecraft/server/minecraft-server.log')
+    parser.add_argument('--offset-file', default=None, help='persist the read position here to resume later')
+    parser.add_argument('--follow', action='store_true', help='keep following the log after reading it')
+    asyncio.run(_print_events(parser.parse_args()))
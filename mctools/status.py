@@ -0,0 +1,147 @@
+"""Cached, coalesced status snapshots of a Minecraft server.
+
+One probe serves every consumer: the presence updater, `!status`,
+`!startmc` and any other command read the same snapshot until it is older
+than the configured TTL. Concurrent readers of a stale snapshot wait on a
+single shared refresh.
+
+A probe reads the VM power state, then runs the SLP status ping, the query
+protocol (full player list, needs `enable-query=true`) and the telemetry
+collector's TPS concurrently. Only the ping decides whether the server is
+online. The other two are best effort, with a timeout scaled to the last
+measured round trip, so a closed query port costs a few hundred
+milliseconds rather than the full ping timeout.
+"""
+
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from mcstatus import JavaServer
+
+from mctools.metrics import Counter
+from mctools.telemetry import fetch_perf
+
+STATUS_CACHE_REQUESTS = Counter('mc_status_cache_requests_total', 'Status snapshot reads by cache result.', ['result'])
+
+
+@dataclass(frozen=True)
+class ServerSnapshot:
+    power_state: str
+    online: bool
+    players: int = 0
+    max_players: int = 0
+    version: str = None
+    # Round-trip time of the status ping in milliseconds
+    latency: float = None
+    motd: str = None
+    # Names of online players: the full list over query, else the ping's sample
+    player_names: tuple = ()
+    # Median TPS over the last minute, from the telemetry collector
+    tps: float = None
+    taken_at: float = 0.0
+
+    @property
+    def age(self):
+        return time.monotonic() - self.taken_at
+
+
+class StatusCache:
+    def __init__(self, host, port, vm=None, ttl=30, timeout=3, query_port=None, telemetry_port=None):
+        self.host = host
+        self.port = port
+        self.vm = vm
+        self.ttl = ttl
+        self.timeout = timeout
+        self.query_port = query_port or port
+        self.telemetry_port = telemetry_port
+        self._server = JavaServer(host, port, timeout=timeout)
+        # Round trip of the last successful ping, in seconds
+        self._rtt = None
+        self._snapshot = None
+        self._refresh = None
+
+    async def get(self, max_age=None):
+        """Return a snapshot no older than `max_age` (defaults to the TTL)."""
+        max_age = self.ttl if max_age is None else max_age
+        if self._snapshot is not None and self._snapshot.age <= max_age:
+            STATUS_CACHE_REQUESTS.inc(result='hit')
+            return self._snapshot
+
+        STATUS_CACHE_REQUESTS.inc(result='miss')
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._probe())
+            self._refresh.add_done_callback(self._refreshed)
+        return await asyncio.shield(self._refresh)
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _refreshed(self, task):
+        self._refresh = None
+        if not task.cancelled() and task.exception() is None:
+            self._snapshot = task.result()
+
+    async def _probe(self):
+        power_state = 'unknown'
+        if self.vm is not None:
+            try:
+                power_state = await self.vm.power_state()
+            except Exception as e:
+                logging.error(f"Error getting VM power state: {e}")
+            # No point pinging a server whose VM is not running
+            if power_state not in ('running', 'unknown'):
+                return ServerSnapshot(power_state, False, taken_at=time.monotonic())
+
+        extras = [asyncio.ensure_future(self._query_names()), asyncio.ensure_future(self._tps())]
+        try:
+            status = await self._server.async_status()
+        except Exception as e:
+            # Offline; do not wait for the other probes to time out
+            for task in extras:
+                task.cancel()
+            logging.info(f"Status ping to {self.host}:{self.port} failed: {e}")
+            return ServerSnapshot(power_state, False, taken_at=time.monotonic())
+        self._rtt = status.latency / 1000
+        names, tps = await asyncio.gather(*extras)
+
+        if names is None:
+            names = [player.name for player in status.players.sample or []]
+        return ServerSnapshot(
+            power_state,
+            True,
+            players=status.players.online,
+            max_players=status.players.max,
+            version=status.version.name,
+            latency=status.latency,
+            motd=' '.join(status.motd.to_plain().split()),
+            player_names=tuple(names),
+            tps=tps,
+            taken_at=time.monotonic(),
+        )
+
+    def _side_timeout(self):
+        """Timeout for the best-effort probes: a few round trips, within the ping's own timeout."""
+        if self._rtt is None:
+            return min(self.timeout, 1.0)
+        return min(self.timeout, max(0.3, 4 * self._rtt))
+
+    async def _query_names(self):
+        server = JavaServer(self.host, self.port, timeout=self._side_timeout(), query_port=self.query_port)
+        try:
+            query = await server.async_query(tries=1)
+        except Exception as e:
+            logging.debug(f"Query to {self.host}:{self.query_port} failed: {e}")
+            return None
+        return query.players.list
+
+    async def _tps(self):
+        if self.telemetry_port is None:
+            return None
+        try:
+            summary = await fetch_perf(self.host, self.telemetry_port, window=60, timeout=self._side_timeout())
+        except Exception as e:
+            logging.debug(f"Telemetry from {self.host}:{self.telemetry_port} unavailable: {e}")
+            return None
+        return summary['tps']['p50']
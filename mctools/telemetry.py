@@ -0,0 +1,345 @@
+"""Tick-lag and TPS telemetry for the Minecraft server VM.
+
+A resident collector samples, on a fixed interval:
+- TPS and MSPT over RCON, using Paper's `tps` and `mspt` commands
+- the player count
+- "Can't keep up" warnings counted from the server log
+- JVM heap and GC time from `jstat`, sampled less often because each call starts a JVM
+- host CPU and the server process RSS from /proc
+
+Samples go into a fixed-size ring buffer. They are rolled up into
+per-minute aggregates, which are kept for a day. The summary is served as
+JSON at /perf on a small HTTP port, where the Discord bots read it for
+`!perf` and threshold alerts. The latest sample is also exported for
+Prometheus at /metrics, /pregen serves the chunk pre-generation
+status written by mctools.pregen, /boot the boot history kept by
+mctools.bootprof, and /backup the status of the last mctools.backup run.
+
+Run with `python3 -m mctools.telemetry` (see services/minecraft-telemetry.service).
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+import argparse
+from collections import deque
+from dataclasses import dataclass, asdict
+
+from mctools import webserver
+from mctools.metrics import REGISTRY, Registry, Counter, Gauge
+from mctools.rcon import RconClient
+from mctools.properties import read_properties
+from mctools.serverlog import LogFollower, LagWarning
+from mctools.bootprof import boot_route
+
+# Minecraft formatting codes such as '§a'
+FORMATTING_RE = re.compile('§.')
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+PLAYER_COUNT_RE = re.compile(r'There are (\d+)')
+
+
+@dataclass
+class Sample:
+    time: float
+    tps: float = None
+    mspt: float = None
+    players: int = None
+    lag_warnings: int = 0
+    heap_used_mb: float = None
+    heap_capacity_mb: float = None
+    gc_seconds: float = None
+    cpu_percent: float = None
+    rss_mb: float = None
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile (q in 0-100) of `values`, or None if empty."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def parse_tps(response):
+    """First (1 minute) value from Paper's 'TPS from last 1m, 5m, 15m: ...'."""
+    text = FORMATTING_RE.sub('', response)
+    if ':' not in text:
+        return None
+    numbers = NUMBER_RE.findall(text.split(':', 1)[1])
+    return float(numbers[0]) if numbers else None
+
+
+def parse_mspt(response):
+    """Average of the shortest window from Paper's 'Server tick times (avg/min/max) ...'."""
+    text = FORMATTING_RE.sub('', response)
+    # Skip the '(avg/min/max) from last 5s, 10s, 1m:' header
+    for line in text.splitlines()[1:]:
+        if '/' in line:
+            numbers = NUMBER_RE.findall(line)
+            if numbers:
+                return float(numbers[0])
+    return None
+
+
+def parse_jstat_gc(output):
+    """Heap used/capacity in MB and total GC seconds from `jstat -gc` output."""
+    lines = output.strip().splitlines()
+    if len(lines) < 2:
+        return None
+    stats = dict(zip(lines[0].split(), (float(v) for v in lines[-1].split())))
+    used = sum(stats.get(k, 0) for k in ('S0U', 'S1U', 'EU', 'OU'))
+    capacity = sum(stats.get(k, 0) for k in ('S0C', 'S1C', 'EC', 'OC'))
+    return used / 1024, capacity / 1024, stats.get('GCT')
+
+
+class TelemetryCollector:
+    def __init__(self, rcon, interval=5, jvm_interval=60, samples=720, minutes=1440, service='minecraft.service'):
+        self.rcon = rcon
+        self.interval = interval
+        self.jvm_interval = jvm_interval
+        self.service = service
+        self.samples = deque(maxlen=samples)
+        self.minutes = deque(maxlen=minutes)
+        self._lag_warnings = 0
+        self._jvm = (None, None, None)
+        self._jvm_sampled_at = 0.0
+        self._cpu_times = None
+        self._minute = None
+
+        # Exported at /metrics; kept out of the shared REGISTRY so the bots do not expose empty VM gauges
+        self.registry = Registry()
+        self._gauges = {
+            'players': Gauge('mc_players_online', 'Players online.', registry=self.registry),
+            'tps': Gauge('mc_tps', 'Ticks per second over the last minute.', registry=self.registry),
+            'mspt': Gauge('mc_mspt_milliseconds', 'Average milliseconds per tick over the last 5 seconds.', registry=self.registry),
+            'heap_used_mb': Gauge('mc_jvm_heap_used_bytes', 'JVM heap in use.', registry=self.registry),
+            'heap_capacity_mb': Gauge('mc_jvm_heap_capacity_bytes', 'JVM heap capacity.', registry=self.registry),
+            'gc_seconds': Gauge('mc_jvm_gc_seconds', 'Total JVM garbage collection time.', registry=self.registry),
+            'cpu_percent': Gauge('mc_host_cpu_percent', 'Host CPU utilisation.', registry=self.registry),
+            'rss_mb': Gauge('mc_server_rss_bytes', 'Resident memory of the server process.', registry=self.registry),
+        }
+        self._lag_counter = Counter('mc_lag_warnings_total', "\"Can't keep up\" warnings in the server log.", registry=self.registry)
+
+    def on_log_event(self, event):
+        if isinstance(event, LagWarning):
+            self._lag_warnings += 1
+
+    async def watch_log(self, path):
+        async for event in LogFollower(path, from_end=True).events(backfill=False):
+            self.on_log_event(event)
+
+    async def _server_pid(self):
+        process = await asyncio.create_subprocess_exec(
+            'systemctl', 'show', '-p', 'MainPID', '--value', self.service,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        stdout, _ = await process.communicate()
+        pid = stdout.decode().strip()
+        return int(pid) if pid.isdigit() and pid != '0' else None
+
+    async def _sample_jvm(self, pid):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'jstat', '-gc', str(pid), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+            stdout, _ = await asyncio.wait_for(process.communicate(), 10)
+        except (OSError, asyncio.TimeoutError) as e:
+            logging.warning(f"jstat failed: {e}")
+            return None, None, None
+        return parse_jstat_gc(stdout.decode()) or (None, None, None)
+
+    def _sample_cpu(self):
+        with open('/proc/stat') as f:
+            fields = [int(v) for v in f.readline().split()[1:]]
+        # idle + iowait
+        idle, total = fields[3] + fields[4], sum(fields)
+        previous, self._cpu_times = self._cpu_times, (idle, total)
+        if previous is None or total == previous[1]:
+            return None
+        return 100 * (1 - (idle - previous[0]) / (total - previous[1]))
+
+    @staticmethod
+    def _sample_rss(pid):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    async def sample(self):
+        sample = Sample(time=time.time(), lag_warnings=self._lag_warnings)
+        self._lag_warnings = 0
+
+        try:
+            tps, mspt, players = await self.rcon.run_many('tps', 'mspt', 'list')
+            sample.tps = parse_tps(tps)
+            sample.mspt = parse_mspt(mspt)
+            match = PLAYER_COUNT_RE.search(players)
+            sample.players = int(match.group(1)) if match else None
+        except Exception as e:
+            logging.warning(f"RCON sample failed: {e}")
+
+        try:
+            sample.cpu_percent = self._sample_cpu()
+        except OSError:
+            pass
+
+        pid = await self._server_pid()
+        if pid is not None:
+            sample.rss_mb = self._sample_rss(pid)
+            if time.monotonic() - self._jvm_sampled_at >= self.jvm_interval:
+                self._jvm = await self._sample_jvm(pid)
+                self._jvm_sampled_at = time.monotonic()
+            sample.heap_used_mb, sample.heap_capacity_mb, sample.gc_seconds = self._jvm
+
+        self.add(sample)
+        return sample
+
+    def _export(self, sample):
+        for field, gauge in self._gauges.items():
+            value = getattr(sample, field)
+            if value is not None and field.endswith('_mb'):
+                value *= 1024 * 1024
+            gauge.set(value)
+        self._lag_counter.inc(sample.lag_warnings)
+
+    def add(self, sample):
+        self._export(sample)
+        minute = int(sample.time // 60)
+        if self._minute is not None and minute != self._minute:
+            self._roll_up(self._minute)
+        self._minute = minute
+        self.samples.append(sample)
+
+    def _roll_up(self, minute):
+        samples = [s for s in self.samples if int(s.time // 60) == minute]
+        if not samples:
+            return
+        tps = [s.tps for s in samples if s.tps is not None]
+        self.minutes.append({
+            'minute': minute * 60,
+            'tps_mean': sum(tps) / len(tps) if tps else None,
+            'tps_min': min(tps) if tps else None,
+            'mspt_p50': percentile([s.mspt for s in samples], 50),
+            'mspt_p95': percentile([s.mspt for s in samples], 95),
+            'mspt_max': percentile([s.mspt for s in samples], 100),
+            'lag_warnings': sum(s.lag_warnings for s in samples),
+            'players_max': max((s.players for s in samples if s.players is not None), default=None),
+            'heap_used_mb_max': percentile([s.heap_used_mb for s in samples], 100),
+            'cpu_percent_mean': percentile([s.cpu_percent for s in samples], 50),
+            'rss_mb_max': percentile([s.rss_mb for s in samples], 100),
+        })
+
+    def summary(self, window=600):
+        """Percentiles over the last `window` seconds plus the last hour of minute aggregates."""
+        cutoff = time.time() - window
+        recent = [s for s in self.samples if s.time >= cutoff]
+        return {
+            'window': window,
+            'samples': len(recent),
+            'latest': asdict(self.samples[-1]) if self.samples else None,
+            'tps': {'p50': percentile([s.tps for s in recent], 50), 'min': percentile([s.tps for s in recent], 0)},
+            'mspt': {q: percentile([s.mspt for s in recent], int(q[1:])) for q in ('p50', 'p95', 'p99')},
+            'lag_warnings': sum(s.lag_warnings for s in recent),
+            'heap_used_mb': percentile([s.heap_used_mb for s in recent], 100),
+            'heap_capacity_mb': percentile([s.heap_capacity_mb for s in recent], 100),
+            'cpu_percent': {'p50': percentile([s.cpu_percent for s in recent], 50),
+                            'p95': percentile([s.cpu_percent for s in recent], 95)},
+            'rss_mb': percentile([s.rss_mb for s in recent], 100),
+            'minutes': list(self.minutes)[-60:],
+        }
+
+    def metrics_route(self, query):
+        return 200, 'text/plain; version=0.0.4', self.registry.render() + REGISTRY.render()
+
+    def perf_route(self, query):
+        window = int(query.get('window', ['600'])[0])
+        return webserver.json_response(self.summary(window))
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            await self.sample()
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+
+# Helpers used by the Discord bots to read and present the VM's summary
+
+async def fetch_perf(host, port=25580, window=600, timeout=5):
+    import aiohttp
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async with session.get(f"http://{host}:{port}/perf", params={'window': window}) as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+def _fmt(value, spec='.1f'):
+    return '–' if value is None else format(value, spec)
+
+
+def format_perf(summary):
+    mspt, tps, cpu = summary['mspt'], summary['tps'], summary['cpu_percent']
+    return '\n'.join([
+        f"**Server performance (last {summary['window'] // 60} min, {summary['samples']} samples)**",
+        f"TPS: median {_fmt(tps['p50'])}, min {_fmt(tps['min'])}",
+        f"MSPT: p50 {_fmt(mspt['p50'])} ms, p95 {_fmt(mspt['p95'])} ms, p99 {_fmt(mspt['p99'])} ms",
+        f"Lag warnings: {summary['lag_warnings']}",
+        f"Heap: {_fmt(summary['heap_used_mb'], '.0f')} / {_fmt(summary['heap_capacity_mb'], '.0f')} MB, "
+        f"RSS {_fmt(summary['rss_mb'], '.0f')} MB",
+        f"CPU: p50 {_fmt(cpu['p50'])}%, p95 {_fmt(cpu['p95'])}%",
+    ])
+
+
+def perf_alerts(summary, min_tps=18.0, max_mspt=50.0, max_lag_warnings=3):
+    """Return {kind: message} for each threshold the summary's window crosses."""
+    alerts = {}
+    if summary['tps']['p50'] is not None and summary['tps']['p50'] < min_tps:
+        alerts['tps'] = f"TPS is down to {summary['tps']['p50']:.1f} (threshold {min_tps})."
+    if summary['mspt']['p95'] is not None and summary['mspt']['p95'] > max_mspt:
+        alerts['mspt'] = f"p95 MSPT is {summary['mspt']['p95']:.1f} ms (threshold {max_mspt} ms)."
+    if summary['lag_warnings'] > max_lag_warnings:
+        alerts['lag'] = f"{summary['lag_warnings']} \"Can't keep up\" warnings recently."
+    return alerts
+
+
+async def main(args):
+    properties = read_properties(os.path.join(args.server_dir, 'server.properties'))
+    rcon = RconClient('127.0.0.1', int(properties.get('rcon.port', 25575)), properties.get('rcon.password', ''), timeout=10)
+    collector = TelemetryCollector(rcon, interval=args.interval, jvm_interval=args.jvm_interval)
+    # Imported here because mctools.pregen builds on this module
+    from mctools.pregen import pregen_route
+    from mctools.backup import backup_route
+
+    routes = {'/perf': collector.perf_route, '/metrics': collector.metrics_route, '/pregen': pregen_route(args.pregen_state),
+              '/boot': boot_route(args.boot_history), '/backup': backup_route(args.backup_status)}
+    await webserver.serve(routes, args.host, args.port)
+    log_task = asyncio.ensure_future(collector.watch_log(os.path.join(args.server_dir, 'minecraft-server.log')))
+    try:
+        await collector.run()
+    finally:
+        log_task.cancel()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Collect Minecraft server performance telemetry.')
+    parser.add_argument('--server-dir', default='/home/minecraft/server')
+    parser.add_argument('--host', default='0.0.0.0', help='address for the HTTP endpoint')
+    parser.add_argument('--port', type=int, default=25580, help='port for the HTTP endpoint')
+    parser.add_argument('--interval', type=float, default=5, help='seconds between samples')
+    parser.add_argument('--jvm-interval', type=float, default=60, help='seconds between jstat samples')
+    parser.add_argument('--pregen-state', default='/home/minecraft/pregen.json', help='status file served at /pregen')
+    parser.add_argument('--boot-history', default='/home/minecraft/boot-history.json', help='boot history served at /boot')
+    parser.add_argument('--backup-status', default='/home/minecraft/backup-status.json', help='backup status file served at /backup')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,61 @@
+"""Minimal asyncio HTTP server for the small JSON/text endpoints on the VM.
+
+Routes map a path to a callable returning `(status, content_type, body)`;
+the callable may be a coroutine function. Only GET is supported.
+"""
+
+import json
+import asyncio
+import logging
+from urllib.parse import urlsplit, parse_qs
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def json_response(data, status=200):
+    return status, 'application/json', json.dumps(data)
+
+
+async def _handle(routes, reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 10)
+        # Skip headers; nothing here needs them
+        while (await asyncio.wait_for(reader.readline(), 10)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2:
+            status, content_type, body = 400, 'text/plain', 'bad request'
+        elif parts[0] != 'GET':
+            status, content_type, body = 405, 'text/plain', 'method not allowed'
+        else:
+            url = urlsplit(parts[1])
+            handler = routes.get(url.path)
+            if handler is None:
+                status, content_type, body = 404, 'text/plain', 'not found'
+            else:
+                try:
+                    result = handler(parse_qs(url.query))
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                    status, content_type, body = result
+                except Exception as e:
+                    logging.error(f"Error handling {url.path}: {e}")
+                    status, content_type, body = 500, 'text/plain', 'internal error'
+
+        payload = body.encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode('latin-1') + payload
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(routes, host='0.0.0.0', port=25580):
+    """Start serving `routes` and return the asyncio server."""
+    return await asyncio.start_server(lambda r, w: _handle(routes, r, w), host, port)
@@ -0,0 +1,189 @@
+import os
+import json
+import asyncio
+import threading
+
+import pytest
+
+from discord_bots.server import ManagedServer
+from mctools import backup
+from mctools.compute import FakeBackend
+
+
+def read_route(route):
+    status, content_type, body = route({})
+    assert (status, content_type) == (200, 'application/json')
+    return json.loads(body)
+
+
+def test_create_records_its_status(tmp_path):
+    server_dir = tmp_path / 'server'
+    (server_dir / 'world').mkdir(parents=True)
+    (server_dir / 'world' / 'level.dat').write_bytes(b'level')
+    status_path = str(tmp_path / 'backup-status.json')
+    route = backup.backup_route(status_path)
+    assert read_route(route) == {'state': 'idle'}
+
+    backup.main(backup.parse_args(['--target', str(tmp_path / 'backups'), 'create', '--offline',
+                                   '--server-dir', str(server_dir), '--status', status_path]))
+    status = read_route(route)
+    assert status['state'] == 'done'
+    assert status['offline'] is True
+    assert status['snapshot'] in backup.list_snapshots(backup.LocalTarget(str(tmp_path / 'backups')))
+    assert status['finished_at'] >= status['started_at']
+
+
+def test_create_records_a_failure(tmp_path, monkeypatch):
+    def broken(server_dir, target, hot=False):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(backup, 'create_snapshot', broken)
+    status_path = str(tmp_path / 'backup-status.json')
+    with pytest.raises(OSError):
+        backup.main(backup.parse_args(['--target', str(tmp_path), 'create', '--offline', '--status', status_path]))
+    status = read_route(backup.backup_route(status_path))
+    assert (status['state'], status['error']) == ('failed', 'disk full')
+
+
+def wait_for_statuses(statuses, before, **kwargs):
+    """Run wait_for_backup against a VM that reports `statuses` one poll after another."""
+    async def main():
+        server = ManagedServer('test', FakeBackend('running'), '127.0.0.1', backup_deadline=kwargs.pop('deadline', 900))
+        polls = iter(statuses)
+
+        async def backup_status():
+            return next(polls, statuses[-1])
+
+        server.backup_status = backup_status
+        result = await server.wait_for_backup(before, interval=0.01, **kwargs)
+        await server.close()
+        return result
+
+    return asyncio.run(main())
+
+
+BEFORE = {'state': 'done', 'offline': False, 'started_at': 100.0}
+
+
+def test_waits_for_the_stop_time_backup():
+    ours = {'offline': True, 'started_at': 200.0}
+    result = wait_for_statuses([BEFORE, dict(ours, state='running'), dict(ours, state='running'),
+                                dict(ours, state='done', snapshot='20260101T000000Z')], BEFORE)
+    assert (result['state'], result['snapshot']) == ('done', '20260101T000000Z')
+
+
+def test_ignores_a_hot_backup_finishing_during_the_stop():
+    hot = {'state': 'done', 'offline': False, 'started_at': 150.0}
+    ours = {'state': 'failed', 'offline': True, 'started_at': 200.0, 'error': 'disk full'}
+    assert wait_for_statuses([hot, hot, ours], BEFORE)['state'] == 'failed'
+
+
+def test_reports_a_backup_that_cannot_be_followed():
+    assert wait_for_statuses([BEFORE], None)['state'] == 'unknown'
+    # The VM serves the status, but no backup is taken on stop
+    assert wait_for_statuses([BEFORE], BEFORE, start_grace=0.05)['state'] == 'unknown'
+
+
+def test_times_out_on_a_backup_still_running():
+    running = {'state': 'running', 'offline': True, 'started_at': 200.0}
+    assert wait_for_statuses([running], BEFORE, deadline=0.05)['state'] == 'timeout'
+
+
+def test_times_out_while_the_status_is_unreachable():
+    # The telemetry service stopped answering; the deadline comes before the start grace
+    assert wait_for_statuses([None], BEFORE, deadline=0.05)['state'] == 'timeout'
+
+
+def test_keep_policy():
+    hourly = [f'202610{day:02d}T{hour:02d}0000Z' for day in range(1, 29) for hour in (0, 12)]
+    keep = backup.select_snapshots(hourly, keep_last=3, keep_daily=2, keep_weekly=2)
+    assert keep == {
+        # The latest three
+        '20261028T120000Z', '20261028T000000Z', '20261027T120000Z',
+        # The newest of the last two weeks (2026-10-26 is a Monday), already covering the two days
+        '20261025T120000Z',
+    }
+    assert backup.select_snapshots(hourly[:2], keep_last=0, keep_daily=0, keep_weekly=0) == set()
+
+
+class World:
+    """A server directory with one world file per name, snapshotted under chosen names."""
+
+    def __init__(self, tmp_path):
+        self.server_dir = tmp_path / 'server'
+        (self.server_dir / 'world').mkdir(parents=True)
+        self.target = backup.LocalTarget(str(tmp_path / 'backups'))
+
+    def write(self, name, data):
+        (self.server_dir / 'world' / name).write_bytes(data)
+
+    def snapshot(self, name):
+        manifest = backup.create_snapshot(str(self.server_dir), self.target)
+        os.rename(self.target._path(f"snapshots/{manifest['name']}.json"), self.target._path(f'snapshots/{name}.json'))
+
+    def packs(self):
+        return self.target.list('packs')
+
+    def restored(self, name, dest):
+        backup.restore_snapshot(self.target, backup.load_snapshot(self.target, name), str(dest))
+        return {path.name: path.read_bytes() for path in (dest / 'world').iterdir()}
+
+
+def test_prune_deletes_unreferenced_packs(tmp_path):
+    world = World(tmp_path)
+    world.write('level.dat', os.urandom(1000))
+    world.snapshot('20261001T000000Z')
+    world.write('level.dat', os.urandom(2000))
+    world.snapshot('20261002T000000Z')
+    assert len(world.packs()) == 4
+    result = backup.prune(world.target, keep_last=1, keep_daily=0, keep_weekly=0)
+    assert result == {'snapshots': 1, 'deleted_packs': 1, 'rewritten_packs': 0}
+    assert backup.list_snapshots(world.target) == ['20261002T000000Z']
+    assert len(world.packs()) == 2
+    assert len(world.restored('20261002T000000Z', tmp_path / 'restore')['level.dat']) == 2000
+
+
+def test_prune_rewrites_mostly_dead_packs(tmp_path):
+    world = World(tmp_path)
+    small, large = os.urandom(100), os.urandom(100_000)
+    world.write('small.dat', small)
+    world.write('large.dat', large)
+    world.snapshot('20261001T000000Z')
+    world.write('large.dat', os.urandom(50_000))
+    world.snapshot('20261002T000000Z')
+    result = backup.prune(world.target, keep_last=1, keep_daily=0, keep_weekly=0)
+    assert result == {'snapshots': 1, 'deleted_packs': 0, 'rewritten_packs': 1}
+    # The second snapshot's pack, plus the rewritten one holding just small.dat
+    sizes = sorted(os.path.getsize(world.target._path(name)) for name in world.packs() if name.endswith('.pack'))
+    assert sizes == [100, 50_000]
+    restored = world.restored('20261002T000000Z', tmp_path / 'restore')
+    assert restored['small.dat'] == small
+    assert len(restored['large.dat']) == 50_000
+
+
+def test_create_waits_for_the_store_lock(tmp_path):
+    location = str(tmp_path / 'backups')
+    acquired = threading.Event()
+
+    def writer():
+        with backup.locked(location):
+            acquired.set()
+
+    with backup.locked(location):
+        thread = threading.Thread(target=writer)
+        thread.start()
+        assert not acquired.wait(0.1)
+    assert acquired.wait(5)
+    thread.join()
+
+
+@pytest.mark.parametrize('service_result, backed_up', [('success', True), ('exit-code', False), ('signal', False)])
+def test_stop_time_backup_is_skipped_after_a_crash(tmp_path, monkeypatch, service_result, backed_up):
+    (tmp_path / 'server' / 'world').mkdir(parents=True)
+    (tmp_path / 'server' / 'world' / 'level.dat').write_bytes(b'level')
+    monkeypatch.setenv('SERVICE_RESULT', service_result)
+    status_path = tmp_path / 'backup-status.json'
+    backup.main(backup.parse_args(['--target', str(tmp_path / 'backups'), 'create', '--offline', '--skip-after-crash',
+                                   '--server-dir', str(tmp_path / 'server'), '--status', str(status_path)]))
+    assert status_path.exists() == backed_up
+    assert len(backup.list_snapshots(backup.LocalTarget(str(tmp_path / 'backups')))) == int(backed_up)
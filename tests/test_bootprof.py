@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from mctools.bootprof import BootHistory, BootRecorder, PHASES, log_time
+
+# 23:59:50 local time; the boot runs past midnight
+EXEC_AT = datetime(2026, 10, 18, 23, 59, 50).timestamp()
+MARKER = {'launched_at': EXEC_AT - 0.5, 'exec_at': EXEC_AT, 'flavour': 'paper', 'fast_boot': False}
+
+
+def test_log_time_wraps_at_midnight():
+    assert log_time('[23:59:52] [main/INFO]: Loading libraries', EXEC_AT) == EXEC_AT + 2
+    assert log_time('[00:00:05 INFO]: Preparing level "world"', EXEC_AT) == datetime(2026, 10, 19, 0, 0, 5).timestamp()
+    assert log_time('Starting org.bukkit.craftbukkit.Main', EXEC_AT) is None
+
+
+def test_recorder_splits_a_boot_into_phases():
+    recorder = BootRecorder(MARKER)
+    # Backfilled lines, read long after they were written, are placed by their stamps
+    arrival = EXEC_AT + 100
+    lines = [
+        'mctools.jvm_launcher: 3584 MB RAM, 2 CPUs, JDK 21, THP madvise, paper server',
+        '[23:59:52] [main/INFO]: Loading libraries',
+        '[23:59:58] [Server thread/INFO]: Starting minecraft server version 1.21.1',
+        '[00:00:03] [Server thread/INFO]: Preparing level "world"',
+    ]
+    assert not any(recorder.feed(line, arrival) for line in lines)
+    assert recorder.feed('[00:00:20] [Server thread/INFO]: Done (17.512s)! For help, type "help"', arrival)
+    boot = recorder.record()
+    assert boot['phases'] == {'launcher': 0.5, 'jvm': 3, 'libraries': 6, 'server_init': 5, 'world': 17}
+    assert (boot['outcome'], boot['total'], boot['reported_seconds']) == ('done', 31.5, 17.512)
+
+
+def test_recorder_merges_unseen_phases_and_reports_crashes():
+    recorder = BootRecorder(MARKER)
+    # Lines without a stamp are timed by their arrival
+    recorder.feed('Starting net.minecraft.server.Main', EXEC_AT + 1)
+    assert recorder.feed('---- Minecraft Crash Report ----', EXEC_AT + 4)
+    boot = recorder.record()
+    assert boot['outcome'] == 'crashed'
+    assert boot['phases'] == {'launcher': 0.5, 'jvm': 1, 'libraries': None, 'server_init': None, 'world': None}
+
+    recorder = BootRecorder(MARKER)
+    recorder.feed('[23:59:52] [main/INFO]: Loading libraries', EXEC_AT + 100)
+    recorder.feed('[23:59:58] [Server thread/INFO]: Done (6.0s)!', EXEC_AT + 100)
+    phases = recorder.record()['phases']
+    assert (phases['libraries'], phases['server_init'], phases['world']) == (None, None, 6)
+
+
+def boot(world, flavour='paper', outcome='done'):
+    phases = dict.fromkeys(PHASES, 2.0)
+    phases['world'] = world
+    return {'launched_at': 0, 'outcome': outcome, 'total': sum(phases.values()), 'phases': phases,
+            'flavour': flavour, 'fast_boot': False}
+
+
+def test_history_flags_regressions(tmp_path):
+    path = str(tmp_path / 'boot-history.json')
+    history = BootHistory(path)
+    assert history.add(boot(10))['baseline'] is None
+    history.add(boot(12))
+    history.add(boot(60, outcome='crashed'))
+    # Median of 10 and 12; crashed boots are not comparable
+    within = history.add(boot(13))
+    assert (within['baseline']['phases']['world'], within['regressions']) == (11, {})
+
+    slower = history.add(boot(20))
+    assert slower['regressions'] == {'world': {'seconds': 20, 'baseline': 12}, 'total': {'seconds': 28, 'baseline': 20}}
+    # Another flavour has its own baseline
+    assert history.add(boot(40, flavour='fabric'))['baseline'] is None
+    assert len(BootHistory(path).boots) == 6
+
+
+def test_small_slowdowns_are_not_regressions(tmp_path):
+    history = BootHistory(str(tmp_path / 'boot-history.json'), limit=3)
+    for _ in range(3):
+        history.add(boot(2))
+    # Twice as slow, but only by 2 seconds
+    assert history.add(boot(4))['regressions'] == {}
+    assert len(history.boots) == 3
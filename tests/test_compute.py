@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from mctools.compute import CloudClients, Ec2Backend, FakeBackend
+from mctools.coordinator import PowerCoordinator, TransitionConflict
+
+
+class StubEc2:
+    """Answers describe_instance_status for the instances it knows about."""
+
+    def __init__(self, states):
+        self.states = states
+        self.calls = 0
+
+    def describe_instance_status(self, IncludeAllInstances, InstanceIds):
+        self.calls += 1
+        return {'InstanceStatuses': [{'InstanceId': instance_id, 'InstanceState': {'Name': self.states[instance_id]}}
+                                     for instance_id in InstanceIds if instance_id in self.states]}
+
+
+def test_ec2_states_and_missing_instances():
+    async def main():
+        clients = CloudClients()
+        stub = StubEc2({'i-running': 'running', 'i-pending': 'pending', 'i-stopped': 'stopped'})
+        clients._clients[('ec2', 'key', 'region')] = stub
+        backends = [Ec2Backend('key', 'secret', 'region', instance_id, clients)
+                    for instance_id in ('i-running', 'i-pending', 'i-stopped', 'i-gone')]
+        states = await Ec2Backend.power_states(backends)
+        await clients.close()
+        assert [states[backend] for backend in backends] == ['running', 'starting', 'stopped', 'unknown']
+        assert stub.calls == 1
+
+    asyncio.run(main())
+
+
+def test_fake_backend_transitions():
+    async def main():
+        backend = FakeBackend('deallocated', start_delay=0.05)
+        start = asyncio.ensure_future(backend.start())
+        await asyncio.sleep(0.01)
+        assert await backend.power_state() == 'starting'
+        await start
+        assert await backend.power_state() == 'running'
+        await backend.hibernate()
+        assert await backend.power_state() == 'hibernated'
+
+    asyncio.run(main())
+
+
+def test_coordinator_joins_the_same_operation():
+    async def main():
+        backend = FakeBackend('stopped', start_delay=0.05)
+        coordinator = PowerCoordinator()
+
+        async def start():
+            await backend.start()
+            return 'started'
+
+        results = await asyncio.gather(*(coordinator.run('start', start) for _ in range(5)))
+        assert [result for result, _ in results] == ['started'] * 5
+        assert [joined for _, joined in results] == [False, True, True, True, True]
+        # One cloud call for all five requesters
+        assert backend.calls.count('start') == 1
+        assert not coordinator.busy
+
+    asyncio.run(main())
+
+
+def test_coordinator_rejects_a_conflicting_operation():
+    async def main():
+        backend = FakeBackend('stopped', start_delay=0.05)
+        coordinator = PowerCoordinator()
+        start = asyncio.ensure_future(coordinator.run('start', backend.start))
+        await asyncio.sleep(0)
+        assert coordinator.operation == 'start'
+        with pytest.raises(TransitionConflict) as conflict:
+            await coordinator.run('stop', backend.stop)
+        assert (conflict.value.current, conflict.value.requested) == ('start', 'stop')
+        await start
+        # Once the start is done, a stop goes through
+        await coordinator.run('stop', backend.stop)
+        assert backend.calls.count('stop') == 1
+        assert backend.state == 'stopped'
+
+    asyncio.run(main())
+
+
+def test_coordinator_shares_a_failure():
+    async def main():
+        coordinator = PowerCoordinator()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('cloud error')
+
+        results = await asyncio.gather(coordinator.run('start', fail), coordinator.run('start', fail),
+                                       return_exceptions=True)
+        assert [str(result) for result in results] == ['cloud error', 'cloud error']
+        assert not coordinator.busy
+
+    asyncio.run(main())
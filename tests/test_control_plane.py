@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+from benchmarks.lifecycle import FakeMinecraft, RCON_PASSWORD
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'functions'))
+
+import control_plane
+
+
+@pytest.fixture
+def settings(monkeypatch, tmp_path):
+    """App settings for one server on the in-memory `fake` provider."""
+    values = {
+        'MC_CLOUD_PROVIDER': 'fake',
+        'MC_FAKE_START_DELAY': '0.2',
+        'MC_MINECRAFT_SERVER_HOST': '127.0.0.1',
+        'MC_MINECRAFT_RCON_PASSWORD': RCON_PASSWORD,
+        'MC_READINESS_DEADLINE': '10',
+        'MC_RESUME_HISTORY_PATH': str(tmp_path / 'resume.json'),
+    }
+    for key, value in values.items():
+        monkeypatch.setenv(key, value)
+    yield values
+    control_plane._operations.clear()
+    control_plane._in_flight.clear()
+    control_plane._fleet = control_plane._fleet_loop = control_plane._tracker_task = None
+
+
+async def request(method, path, query=b''):
+    """One HTTP request through the ASGI app; returns (status, headers, JSON body)."""
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await control_plane.app({'type': 'http', 'method': method, 'path': path, 'query_string': query}, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), json.loads(sent[1]['body'])
+
+
+async def shut_down():
+    messages = iter([{'type': 'lifespan.shutdown'}])
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        pass
+
+    await control_plane.app({'type': 'lifespan'}, receive, send)
+
+
+async def poll(operation_id, timeout=5):
+    for _ in range(int(timeout / 0.05)):
+        status, _, body = await request('GET', f'/operations/{operation_id}')
+        assert status == 200
+        if body['state'] != 'running':
+            return body
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"operation {operation_id} still running")
+
+
+async def fake_minecraft(monkeypatch):
+    """A status-ping and RCON server for the VM, up until it is sent `stop`."""
+    minecraft = FakeMinecraft(None, boot_delay=0)
+    await minecraft.reserve_ports()
+    monkeypatch.setenv('MC_MINECRAFT_SERVER_PORT', str(minecraft.slp_port))
+    monkeypatch.setenv('MC_MINECRAFT_RCON_PORT', str(minecraft.rcon_port))
+    minecraft.power_changed('running')
+    return minecraft
+
+
+def test_start_returns_202_and_the_operation_completes(settings, monkeypatch):
+    async def main():
+        minecraft = await fake_minecraft(monkeypatch)
+        status, headers, body = await request('POST', '/api/servers/default/start')
+        assert status == 202
+        assert (body['state'], body['joined']) == ('running', False)
+        assert headers[b'location'] == body['status_url'].encode()
+
+        operation = await poll(body['id'])
+        assert operation['state'] == 'succeeded'
+        assert operation['result']['ready'] is True
+        status, _, server = await request('GET', '/servers/default/status', b'fresh=1')
+        assert (server['power_state'], server['online'], server['operation']) == ('running', True, None)
+
+        status, _, body = await request('POST', '/servers/default/stop')
+        operation = await poll(body['id'])
+        assert operation['state'] == 'succeeded'
+        # The VM does not report backup status, so the stop goes ahead and says so
+        assert operation['result']['backup']['state'] == 'unknown'
+        assert not minecraft.up
+        status, _, server = await request('GET', '/servers/default/status', b'fresh=1')
+        assert server['power_state'] == 'deallocated'
+        await shut_down()
+
+    asyncio.run(main())
+
+
+def test_second_start_joins_the_operation_in_flight(settings, monkeypatch):
+    async def main():
+        await fake_minecraft(monkeypatch)
+        _, _, first = await request('POST', '/servers/default/start')
+        status, _, second = await request('POST', '/servers/default/wake')
+        assert status == 202
+        assert (second['id'], second['joined']) == (first['id'], True)
+        assert (await poll(first['id']))['state'] == 'succeeded'
+        backend = control_plane._fleet.servers['default'].backend
+        assert backend.calls.count('start') == 1
+        # Once the server is up (and the power state polled), a wake just returns its status
+        await request('GET', '/servers/default/status', b'fresh=1')
+        status, _, body = await request('POST', '/servers/default/wake')
+        assert (status, body['online']) == (200, True)
+        await shut_down()
+
+    asyncio.run(main())
+
+
+def test_conflicting_operation_gets_409(settings, monkeypatch):
+    async def main():
+        await fake_minecraft(monkeypatch)
+        _, _, start = await request('POST', '/servers/default/start')
+        status, _, body = await request('POST', '/servers/default/stop')
+        assert status == 409
+        assert body['operation']['id'] == start['id']
+        await poll(start['id'])
+        await shut_down()
+
+    asyncio.run(main())
+
+
+def test_failed_operation_is_reported(settings, monkeypatch):
+    monkeypatch.setenv('MC_READINESS_DEADLINE', '0.5')
+    # Nothing listens on the server's ports, so it never becomes ready
+    monkeypatch.setenv('MC_MINECRAFT_SERVER_PORT', '1')
+
+    async def main():
+        _, _, body = await request('POST', '/servers/default/start')
+        operation = await poll(body['id'])
+        assert (operation['state'], operation['stage']) == ('failed', 'failed')
+        assert 'did not answer' in operation['error']
+        # A failed operation does not block the next one
+        _, _, retry = await request('POST', '/servers/default/start')
+        assert (retry['id'] != body['id'], retry['joined']) == (True, False)
+        await shut_down()
+
+    asyncio.run(main())
+
+
+def test_unknown_routes(settings):
+    async def main():
+        assert (await request('GET', '/servers/nope/status'))[0] == 404
+        assert (await request('GET', '/operations/abc123'))[0] == 404
+        assert (await request('DELETE', '/servers'))[0] == 405
+        await shut_down()
+
+    asyncio.run(main())
+
+
+def test_fleet_is_rebuilt_on_a_new_event_loop(settings):
+    old_loop = asyncio.new_event_loop()
+    _, _, abandoned = old_loop.run_until_complete(request('POST', '/servers/default/start'))
+    old_fleet, old_tracker = control_plane._fleet, control_plane._tracker_task
+
+    async def main():
+        # The abandoned start no longer blocks a new one
+        _, _, start = await request('POST', '/servers/default/start')
+        assert (start['id'] != abandoned['id'], start['joined']) == (True, False)
+        assert control_plane._fleet is not old_fleet
+        _, _, body = await request('GET', '/operations/' + abandoned['id'])
+        assert body['state'] == 'failed'
+        await shut_down()
+
+    asyncio.run(main())
+    # Let the old loop process the cancellations
+    old_loop.run_until_complete(asyncio.sleep(0))
+    assert old_tracker.cancelled()
+    assert old_fleet.clients._executor is None
+    # The coordinator shields the abandoned start itself from cancellation
+    for task in asyncio.all_tasks(old_loop):
+        task.cancel()
+    old_loop.run_until_complete(asyncio.sleep(0))
+    old_loop.close()
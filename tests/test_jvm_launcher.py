@@ -0,0 +1,53 @@
+import gzip
+
+from mctools import jvm_launcher, nbt
+
+
+def level_dat(rules):
+    """A cut-down level.dat with the given game rules, and a few other tag types to carry through."""
+    return {'Data': (nbt.COMPOUND, {
+        'LevelName': (nbt.STRING, 'world'),
+        'DataVersion': (nbt.INT, 3955),
+        'RandomSeed': (nbt.LONG, -4172144997902289642),
+        'BorderSize': (nbt.DOUBLE, 59999968.0),
+        'ServerBrands': (nbt.LIST, (nbt.STRING, ['Paper'])),
+        'ScheduledEvents': (nbt.LIST, (nbt.END, [])),
+        'DataPacks': (nbt.COMPOUND, {'Enabled': (nbt.LIST, (nbt.STRING, ['vanilla', 'file/é.zip']))}),
+        'UUID': (nbt.INT_ARRAY, bytes(range(16))),
+        'GameRules': (nbt.COMPOUND, {name: (nbt.STRING, value) for name, value in rules.items()}),
+    })}
+
+
+def write_world(tmp_path, rules, level_name='world'):
+    server_dir = tmp_path / 'server'
+    (server_dir / level_name).mkdir(parents=True)
+    (server_dir / 'server.properties').write_text(f'level-name={level_name}\n')
+    path = str(server_dir / level_name / 'level.dat')
+    nbt.write_file(path, '', (nbt.COMPOUND, level_dat(rules)))
+    return str(server_dir), path
+
+
+def test_nbt_round_trip(tmp_path):
+    _, path = write_world(tmp_path, {'keepInventory': 'false'})
+    with gzip.open(path) as f:
+        data = f.read()
+    assert nbt.dumps(*nbt.loads(data)) == data
+    assert nbt.read_file(path) == ('', (nbt.COMPOUND, level_dat({'keepInventory': 'false'})))
+
+
+def test_trim_spawn_chunks_sets_the_game_rule(tmp_path):
+    server_dir, path = write_world(tmp_path, {'keepInventory': 'false', 'spawnChunkRadius': '2'}, level_name='survival')
+    assert jvm_launcher.trim_spawn_chunks(server_dir)
+    assert nbt.read_file(path) == ('', (nbt.COMPOUND, level_dat({'keepInventory': 'false', 'spawnChunkRadius': '0'})))
+    # Already trimmed
+    assert not jvm_launcher.trim_spawn_chunks(server_dir)
+
+
+def test_trim_spawn_chunks_leaves_other_worlds_alone(tmp_path):
+    # Before 1.20.5 there is no such game rule
+    server_dir, path = write_world(tmp_path, {'keepInventory': 'false'})
+    assert not jvm_launcher.trim_spawn_chunks(server_dir)
+    assert nbt.read_file(path) == ('', (nbt.COMPOUND, level_dat({'keepInventory': 'false'})))
+    # A new world has no level.dat before its first boot
+    (tmp_path / 'new').mkdir()
+    assert not jvm_launcher.trim_spawn_chunks(str(tmp_path / 'new'))
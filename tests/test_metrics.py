@@ -0,0 +1,72 @@
+import asyncio
+import urllib.request
+import urllib.error
+
+import pytest
+
+from mctools import webserver
+from mctools.metrics import Registry, Counter, Gauge, Histogram, metrics_route
+
+
+def make_registry():
+    registry = Registry()
+    requests = Counter('mc_requests_total', 'Requests handled.', ['command'], registry=registry)
+    players = Gauge('mc_players', 'Players online.', registry=registry)
+    latency = Histogram('mc_latency_seconds', 'Command latency.', ['command'], buckets=(0.1, 1), registry=registry)
+    requests.inc(command='startmc')
+    requests.inc(2, command='stopmc')
+    players.set(3)
+    latency.observe(0.05, command='startmc')
+    latency.observe(0.5, command='startmc')
+    latency.observe(5, command='startmc')
+    return registry
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.status, response.headers['Content-Type'], response.read().decode()
+
+
+def test_metrics_endpoint_serves_the_exposition_format():
+    async def main():
+        server = await webserver.serve({'/metrics': metrics_route(make_registry())}, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, get, f'http://127.0.0.1:{port}/metrics')
+            with pytest.raises(urllib.error.HTTPError) as missing:
+                await loop.run_in_executor(None, get, f'http://127.0.0.1:{port}/nope')
+        finally:
+            server.close()
+            await server.wait_closed()
+        return result, missing.value.code
+
+    (status, content_type, body), missing = asyncio.run(main())
+    assert (status, missing) == (200, 404)
+    assert content_type.startswith('text/plain; version=0.0.4')
+    lines = body.splitlines()
+    for line in ['# HELP mc_requests_total Requests handled.',
+                 '# TYPE mc_requests_total counter',
+                 'mc_requests_total{command="startmc"} 1.0',
+                 'mc_requests_total{command="stopmc"} 2.0',
+                 '# TYPE mc_players gauge',
+                 'mc_players 3.0',
+                 '# TYPE mc_latency_seconds histogram',
+                 'mc_latency_seconds_bucket{command="startmc",le="0.1"} 1',
+                 'mc_latency_seconds_bucket{command="startmc",le="1.0"} 2',
+                 'mc_latency_seconds_bucket{command="startmc",le="+Inf"} 3',
+                 'mc_latency_seconds_sum{command="startmc"} 5.55',
+                 'mc_latency_seconds_count{command="startmc"} 3']:
+        assert line in lines
+    assert body.endswith('\n')
+
+
+def test_label_values_are_escaped_and_checked():
+    registry = Registry()
+    counter = Counter('mc_errors_total', 'Errors.', ['message'], registry=registry)
+    counter.inc(message='bad "quote"\\\n')
+    assert 'mc_errors_total{message="bad \\"quote\\"\\\\\\n"} 1.0' in registry.render()
+    with pytest.raises(ValueError):
+        counter.inc(other='x')
+    with pytest.raises(ValueError):
+        Counter('mc_errors_total', 'Again.', registry=registry)
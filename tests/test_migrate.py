@@ -0,0 +1,110 @@
+import os
+import zlib
+import struct
+import zipfile
+
+import pytest
+
+from mctools import migrate
+from mctools.migrate import FileSource, MigrationError
+
+
+def build_zip(path, files, zip64=False):
+    """Write a deflated archive by hand; with `zip64`, sizes and offsets go in ZIP64 extra fields."""
+    out = bytearray()
+    central = bytearray()
+    for name, data in files:
+        raw_name = name.encode()
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15)
+        payload = deflater.compress(data) + deflater.flush()
+        crc = zlib.crc32(data)
+        offset = len(out)
+        out += struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, 0x800, 8, 0, 0, crc, len(payload), len(data),
+                           len(raw_name), 0) + raw_name + payload
+        sizes = (len(payload), len(data), offset)
+        extra = b''
+        if zip64:
+            extra = struct.pack('<2H3Q', 1, 24, len(data), len(payload), offset)
+            sizes = (0xFFFFFFFF,) * 3
+        central += struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 45, 45, 0x800, 8, 0, 0, crc, sizes[0], sizes[1],
+                               len(raw_name), len(extra), 0, 0, 0, 0, sizes[2]) + raw_name + extra
+    cd_offset = len(out)
+    out += central
+    if zip64:
+        record = len(out)
+        out += struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0, len(files), len(files), len(central), cd_offset)
+        out += struct.pack('<4sLQL', b'PK\x06\x07', 0, record, 1)
+        out += struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+    else:
+        out += struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(files), len(files), len(central), cd_offset, 0)
+    path.write_bytes(bytes(out))
+    return str(path)
+
+
+FILES = [
+    ('backup/server/paper-1.21.1.jar', b'jar' * 1000),
+    ('backup/server/server.properties', b'motd=hello\n'),
+    ('backup/server/world/level.dat', os.urandom(5000)),
+]
+
+
+def test_zip64_entries_parse(tmp_path):
+    archive = build_zip(tmp_path / 'server.zip', FILES, zip64=True)
+    # The stdlib agrees the archive is well formed
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+    entries = migrate.read_central_directory(FileSource(archive))
+    assert [(entry.name, entry.size) for entry in entries] == [(name, len(data)) for name, data in FILES]
+    assert entries[0].offset == 0
+    assert all(entry.end == following.offset for entry, following in zip(entries, entries[1:]))
+
+    migrate.migrate(archive, str(tmp_path / 'dest'))
+    assert (tmp_path / 'dest' / 'server.jar').read_bytes() == FILES[0][1]
+    assert (tmp_path / 'dest' / 'world' / 'level.dat').read_bytes() == FILES[2][1]
+
+
+@pytest.mark.parametrize('name', ['server/../../evil.sh', 'server/world/../../../evil.sh'])
+def test_entries_outside_the_destination_are_refused(tmp_path, name):
+    archive = build_zip(tmp_path / 'server.zip', [('server/server.jar', b'jar'), (name, b'rm -rf ~')])
+    entries = migrate.read_central_directory(FileSource(archive))
+    with pytest.raises(MigrationError, match='refusing to extract'):
+        migrate.plan(entries, str(tmp_path / 'dest'))
+    with pytest.raises(MigrationError):
+        migrate.migrate(archive, str(tmp_path / 'dest'))
+    assert not (tmp_path / 'evil.sh').exists()
+
+
+class DroppingSource(FileSource):
+    """A FileSource that records the ranges read, and whose first read at `drop_at` ends early."""
+
+    drop_at = None
+    opened = []
+
+    def open(self, start, end):
+        DroppingSource.opened.append(start)
+        if start == DroppingSource.drop_at:
+            DroppingSource.drop_at = None
+            return super().open(start, start + 100)
+        return super().open(start, end)
+
+
+def test_interrupted_transfer_resumes(tmp_path, monkeypatch):
+    archive = build_zip(tmp_path / 'server.zip', FILES)
+    entries = migrate.read_central_directory(FileSource(archive))
+    # One request per file, so the connection drops partway through level.dat only
+    monkeypatch.setattr(migrate, 'SPAN_SIZE', 1)
+    monkeypatch.setattr(migrate, 'FileSource', DroppingSource)
+    DroppingSource.drop_at, DroppingSource.opened = entries[2].offset, []
+    dest = tmp_path / 'dest'
+    with pytest.raises(MigrationError, match='ended unexpectedly'):
+        migrate.migrate(archive, str(dest), workers=1)
+    assert (dest / 'server.jar').exists()
+    assert not (dest / 'world' / 'level.dat').exists()
+    assert (dest / 'world' / 'level.dat.part').exists()
+
+    # The second run reads the central directory, then fetches only what is missing
+    DroppingSource.opened = []
+    migrate.migrate(archive, str(dest), workers=1)
+    assert DroppingSource.opened[1:] == [entries[2].offset]
+    assert (dest / 'world' / 'level.dat').read_bytes() == FILES[2][1]
+    assert not (dest / 'world' / 'level.dat.part').exists()
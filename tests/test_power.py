@@ -0,0 +1,138 @@
+import asyncio
+
+from mctools.compute import FakeBackend
+from mctools.power import PowerStateTracker
+
+
+class CountingBackend(FakeBackend):
+    """A FakeBackend that counts batched lookups per class, standing in for one cloud provider."""
+
+    batches = 0
+
+    @classmethod
+    async def power_states(cls, backends):
+        cls.batches += 1
+        return await super().power_states(backends)
+
+
+class FirstCloud(CountingBackend):
+    provider = 'first'
+
+
+class SecondCloud(CountingBackend):
+    provider = 'second'
+
+
+def test_one_batched_call_per_provider():
+    async def main():
+        FirstCloud.batches = SecondCloud.batches = 0
+        tracker = PowerStateTracker()
+        first = [FirstCloud('running') for _ in range(10)]
+        second = [SecondCloud('stopped') for _ in range(5)]
+        views = [tracker.add(backend) for backend in first + second]
+        await tracker.refresh()
+        assert (FirstCloud.batches, SecondCloud.batches) == (1, 1)
+        assert [await view.power_state() for view in views] == ['running'] * 10 + ['stopped'] * 5
+        # Reads came from the cache, not from per-VM lookups
+        assert all(backend.calls == ['power_states'] for backend in first + second)
+
+    asyncio.run(main())
+
+
+def test_change_callbacks():
+    async def main():
+        tracker = PowerStateTracker()
+        backend = FakeBackend('stopped')
+        tracker.add(backend)
+        changes = []
+        tracker.on_change(lambda backend, old, new: changes.append((old, new)))
+
+        async def async_listener(backend, old, new):
+            changes.append(('async', new))
+
+        tracker.on_change(async_listener)
+
+        def broken(backend, old, new):
+            raise RuntimeError('listener bug')
+
+        async def async_broken(backend, old, new):
+            raise RuntimeError('listener bug')
+
+        # A failing listener does not stop the others
+        tracker.on_change(broken)
+        tracker.on_change(async_broken)
+        await tracker.refresh()
+        await tracker.refresh()
+        # Coroutine listeners run in tasks of their own
+        await asyncio.sleep(0)
+        backend.state = 'running'
+        await tracker.refresh()
+        await asyncio.sleep(0.01)
+        assert changes == [(None, 'stopped'), ('async', 'stopped'), ('stopped', 'running'), ('async', 'running')]
+        assert not tracker._listener_tasks
+
+    asyncio.run(main())
+
+
+def test_slow_listener_does_not_hold_up_polling():
+    async def main():
+        tracker = PowerStateTracker()
+        backend = FakeBackend('stopped')
+        tracker.add(backend)
+        release = asyncio.Event()
+        seen = []
+
+        async def deallocating(backend, old, new):
+            seen.append(new)
+            await release.wait()
+
+        tracker.on_change(deallocating)
+        await asyncio.wait_for(tracker.refresh(), 1)
+        backend.state = 'running'
+        await asyncio.wait_for(tracker.refresh(), 1)
+        await asyncio.sleep(0)
+        assert seen == ['stopped', 'running']
+        release.set()
+        await asyncio.sleep(0.01)
+        assert not tracker._listener_tasks
+
+    asyncio.run(main())
+
+
+def test_polls_fast_during_a_transition():
+    async def main():
+        tracker = PowerStateTracker(interval=60, fast_interval=5)
+        backend = FakeBackend('stopped')
+        tracker.add(backend)
+        await tracker.refresh()
+        assert tracker.next_interval() == 60
+        tracker.expect_transition(backend)
+        assert tracker.next_interval() == 5
+        backend.state = 'starting'
+        await tracker.refresh()
+        assert tracker.next_interval() == 5
+        backend.state = 'running'
+        await tracker.refresh()
+        assert tracker.next_interval() == 60
+
+    asyncio.run(main())
+
+
+def test_run_wakes_on_expected_transition():
+    async def main():
+        tracker = PowerStateTracker(interval=60, fast_interval=0.01)
+        backend = FakeBackend('stopped')
+        tracker.add(backend)
+        seen = []
+        tracker.on_change(lambda backend, old, new: seen.append(new))
+        task = asyncio.ensure_future(tracker.run())
+        await asyncio.sleep(0.01)
+        assert seen == ['stopped']
+        asyncio.ensure_future(backend.start())
+        # Without this the next poll would be a minute away
+        tracker.expect_transition(backend)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        assert seen[-1] == 'running'
+
+    asyncio.run(main())
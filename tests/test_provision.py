@@ -0,0 +1,130 @@
+import os
+import getpass
+import hashlib
+
+import pytest
+
+from mctools import provision
+from mctools.provision import Artifact, ArtifactCache, ProvisionError, ServerJar, Step
+
+
+def serve_file(tmp_path, name, data):
+    """A file:// URL for `data`, which urllib downloads like an HTTP one."""
+    path = tmp_path / 'remote' / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(data)
+    return path.as_uri()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class RecordingStep(Step):
+    def __init__(self, name, satisfied, artifacts=()):
+        self.name = name
+        self._satisfied = satisfied
+        self.artifacts = artifacts
+        self.files = None
+
+    def satisfied(self):
+        return self._satisfied
+
+    def apply(self, files):
+        self.files = files
+
+
+def test_satisfied_steps_are_skipped(tmp_path):
+    url = serve_file(tmp_path, 'tool', b'tool')
+    done = RecordingStep('done', True, (Artifact('unused', url='file:///nonexistent'),))
+    todo = RecordingStep('todo', False, (Artifact('tool', url=url, digest=('sha256', sha256(b'tool'))),))
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    assert provision.provision([done, todo], cache) == ['todo']
+    assert done.files is None
+    # Only the pending step's artifact was fetched
+    assert list(cache.index) == ['tool']
+    with open(todo.files['tool'], 'rb') as f:
+        assert f.read() == b'tool'
+
+
+def test_satisfied_plan_does_nothing(tmp_path, monkeypatch):
+    args = provision.parse_args(['--home', str(tmp_path / 'home'), '--cache-dir', str(tmp_path / 'cache'),
+                                 '--flavour', 'paper', '--version', '1.21.1', '--offline'])
+    steps = provision.build_plan(args)
+    for step in steps:
+        monkeypatch.setattr(step, 'satisfied', lambda: True)
+    # Offline with an empty cache: any fetch would fail
+    assert provision.provision(steps, ArtifactCache(args.cache_dir, offline=args.offline)) == []
+
+
+def test_fetch_rejects_a_digest_mismatch(tmp_path):
+    url = serve_file(tmp_path, 'server.jar', b'tampered')
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    with pytest.raises(ProvisionError, match='does not match'):
+        cache.fetch(Artifact('server', url=url, digest=('sha1', hashlib.sha1(b'original').hexdigest())))
+    assert cache.cached('server') is None
+    assert not os.path.exists(cache.blob_path(sha256(b'tampered')))
+    assert os.listdir(tmp_path / 'cache' / 'tmp') == []
+
+
+def test_blob_in_the_store_is_not_downloaded_again(tmp_path):
+    data = b'corretto'
+    url = serve_file(tmp_path, 'jdk.tar.gz', data)
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    path = cache.fetch(Artifact('jdk', url=url, digest=('sha256', sha256(data))))
+    os.unlink(tmp_path / 'remote' / 'jdk.tar.gz')
+    # Same artifact from a fresh cache, and another artifact with the same content: both come from the store
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    assert cache.fetch(Artifact('jdk', url=url, digest=('sha256', sha256(data)))) == path
+    assert cache.fetch(Artifact('jdk-mirror', url=url + '?mirror', digest=('sha256', sha256(data)))) == path
+    assert cache.fetch(Artifact('jdk', url=url, immutable=True)) == path
+
+
+def test_offline_fetch_of_a_missing_artifact(tmp_path):
+    args = provision.parse_args(['--home', str(tmp_path / 'home'), '--cache-dir', str(tmp_path / 'cache'),
+                                 '--flavour', 'vanilla', '--offline'])
+    cache = ArtifactCache(args.cache_dir, offline=args.offline)
+    jar = next(step for step in provision.build_plan(args) if isinstance(step, ServerJar))
+    with pytest.raises(ProvisionError, match='not in the cache'):
+        provision.provision([jar], cache)
+
+
+@pytest.fixture
+def mojang(tmp_path, monkeypatch):
+    """Stand-in for the Mojang version manifest, with 1.21.1 as the latest release."""
+    jars = {version: f'server {version}'.encode() for version in ('1.21', '1.21.1')}
+    documents = {provision.MOJANG_MANIFEST: {
+        'latest': {'release': '1.21.1'},
+        'versions': [{'id': version, 'url': f'https://example.invalid/{version}.json'} for version in jars],
+    }}
+    for version, data in jars.items():
+        documents[f'https://example.invalid/{version}.json'] = {'downloads': {'server': {
+            'url': serve_file(tmp_path, f'{version}.jar', data), 'sha1': hashlib.sha1(data).hexdigest()}}}
+    monkeypatch.setattr(provision, 'fetch_json', lambda url, timeout=30: documents[url])
+    return jars
+
+
+def read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def test_latest_records_the_resolved_version(tmp_path, mojang):
+    server_dir = tmp_path / 'server'
+    server_dir.mkdir()
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    jar = ServerJar('vanilla', 'latest', str(server_dir), getpass.getuser())
+    assert provision.provision([jar], cache) == ['vanilla latest server']
+    assert read(server_dir / '.version') == '1.21.1'
+    assert (server_dir / 'server.jar').read_bytes() == mojang['1.21.1']
+    # An installed server satisfies 'latest'; another explicit version does not
+    assert ServerJar('vanilla', 'latest', str(server_dir), getpass.getuser()).satisfied()
+    assert ServerJar('vanilla', '1.21.1', str(server_dir), getpass.getuser()).satisfied()
+    assert not ServerJar('vanilla', '1.21', str(server_dir), getpass.getuser()).satisfied()
+
+    # Offline, the version comes from the cache index
+    other_dir = tmp_path / 'other'
+    other_dir.mkdir()
+    offline = ArtifactCache(str(tmp_path / 'cache'), offline=True)
+    provision.provision([ServerJar('vanilla', 'latest', str(other_dir), getpass.getuser())], offline)
+    assert read(other_dir / '.version') == '1.21.1'
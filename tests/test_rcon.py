@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from mctools.rcon import (RconClient, RconAuthError, RconDisconnected, encode_packet, read_packet,
+                          SERVERDATA_AUTH, SERVERDATA_AUTH_RESPONSE, SERVERDATA_EXECCOMMAND,
+                          SERVERDATA_RESPONSE_VALUE)
+
+PASSWORD = 'secret'
+
+
+class FakeRconServer:
+    """A local RCON server. Commands are answered concurrently, so a slow one can finish after a later one.
+
+    - `slow <text>` answers `<text>` after 0.2 seconds
+    - `split <a> <b> ...` answers each word in its own packet
+    - `hang` never answers
+    - `drop` closes the connection
+    - anything else is echoed back
+    """
+
+    def __init__(self):
+        self.port = None
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        tasks = []
+        try:
+            request_id, packet_type, body = await read_packet(reader)
+            assert packet_type == SERVERDATA_AUTH
+            writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, ''))
+            writer.write(encode_packet(request_id if body == PASSWORD else -1, SERVERDATA_AUTH_RESPONSE, ''))
+            await writer.drain()
+            while True:
+                request_id, packet_type, body = await read_packet(reader)
+                if packet_type != SERVERDATA_EXECCOMMAND:
+                    continue
+                # The command's sentinel always follows it in the same write
+                sentinel_id, _, _ = await read_packet(reader)
+                if body == 'drop':
+                    break
+                tasks.append(asyncio.ensure_future(self._answer(writer, request_id, sentinel_id, body)))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, writer, request_id, sentinel_id, command):
+        name, _, argument = command.partition(' ')
+        if name == 'hang':
+            return
+        if name == 'slow':
+            await asyncio.sleep(0.2)
+        parts = argument.split() if name == 'split' else [argument if name == 'slow' else command]
+        for part in parts:
+            writer.write(encode_packet(request_id, SERVERDATA_RESPONSE_VALUE, part))
+        writer.write(encode_packet(sentinel_id, SERVERDATA_RESPONSE_VALUE, 'Unknown request 0'))
+        await writer.drain()
+
+
+def run_with_server(test):
+    async def main():
+        server = FakeRconServer()
+        await server.start()
+        try:
+            await test(server)
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_auth_failure():
+    async def test(server):
+        client = RconClient('127.0.0.1', server.port, 'wrong')
+        with pytest.raises(RconAuthError):
+            await client.run('list')
+        await client.close()
+
+    run_with_server(test)
+
+
+def test_pipelined_commands_answered_out_of_order():
+    async def test(server):
+        async with RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            slow = asyncio.ensure_future(client.run('slow first'))
+            await asyncio.sleep(0.05)
+            assert await client.run('second') == 'second'
+            assert not slow.done()
+            assert await slow == 'first'
+            assert await client.run_many('a', 'slow b', 'c') == ['a', 'b', 'c']
+        assert server.connections == 1
+
+    run_with_server(test)
+
+
+def test_multi_packet_response_ends_at_sentinel():
+    async def test(server):
+        async with RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            assert await client.run('split one two three') == 'onetwothree'
+            assert await client.run('after') == 'after'
+
+    run_with_server(test)
+
+
+def test_command_timeout():
+    async def test(server):
+        async with RconClient('127.0.0.1', server.port, PASSWORD) as client:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.run('hang', timeout=0.1)
+            # The connection is still usable afterwards
+            assert await client.run('still here') == 'still here'
+
+    run_with_server(test)
+
+
+def test_reconnect_after_server_drops_connection():
+    async def test(server):
+        async with RconClient('127.0.0.1', server.port, PASSWORD, reconnect_delay=0.01) as client:
+            with pytest.raises(RconDisconnected):
+                await client.run('drop')
+            assert await client.run('back') == 'back'
+        assert server.connections == 2
+
+    run_with_server(test)
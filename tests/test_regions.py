@@ -0,0 +1,100 @@
+import os
+import zlib
+import struct
+
+import numpy as np
+
+from mctools import regions
+from mctools.regions import HEADER_SIZE, INHABITED_TAG, SECTOR, Region
+
+RELPATH = os.path.join('world', 'region', 'r.1.0.mca')
+
+
+def chunk_nbt(inhabited, padding=b''):
+    """Enough of a chunk's NBT for the tools here: some leading tags, then InhabitedTime."""
+    return b'\x0a\x00\x00' + padding + INHABITED_TAG + struct.pack('>q', inhabited) + b'\x00'
+
+
+def record(payload, compression):
+    return struct.pack('>IB', len(payload) + 1, compression) + payload
+
+
+def write_region(path, sectors, chunks):
+    """A region file of `sectors` sectors, with chunks as {slot: (first sector, record, timestamp)}."""
+    data = bytearray(sectors * SECTOR)
+    for index, (sector, body, timestamp) in chunks.items():
+        count = -(-len(body) // SECTOR)
+        struct.pack_into('>I', data, index * 4, (sector << 8) | count)
+        struct.pack_into('>I', data, SECTOR + index * 4, timestamp)
+        data[sector * SECTOR:sector * SECTOR + len(body)] = body
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_world(tmp_path):
+    """Slot 0 (deflate, never visited), a free sector, slot 33 (uncompressed, two sectors) and a corrupt slot."""
+    server_dir = tmp_path / 'server'
+    large = chunk_nbt(6000, padding=os.urandom(6000))
+    corrupt = struct.pack('>IB', 9000, 2) + b'\x00' * 100
+    write_region(str(server_dir / RELPATH), 7, {
+        0: (2, record(zlib.compress(chunk_nbt(0)), 2), 1000),
+        33: (4, record(large, 3), 2000),
+        1023: (6, corrupt, 3000),
+    })
+    return str(server_dir), large
+
+
+def test_reads_the_header_tables(tmp_path):
+    server_dir, large = build_world(tmp_path)
+    assert regions.region_files(server_dir) == [RELPATH]
+    region = Region(server_dir, RELPATH)
+    assert (region.kind, region.rx, region.rz) == ('region', 1, 0)
+    assert list(np.flatnonzero(region.present)) == [0, 33]
+    assert (region.offsets[33], region.sectors[33], region.timestamps[33]) == (4, 2, 2000)
+    assert (region.lengths[33], region.compression[33]) == (len(large) + 1, 3)
+    assert region.compression[0] == 2
+    assert region.used_bytes == 3 * SECTOR
+    # The free sector and the corrupt slot's sector
+    assert region.wasted_bytes == 2 * SECTOR
+    assert [int(v) for v in region.chunk_coords([0, 33])[0]] == [32, 33]
+
+    regions.read_inhabited(region)
+    assert (region.inhabited[0], region.inhabited[33], region.inhabited[1]) == (0, 6000, -1)
+
+
+def test_rewrite_packs_and_recompresses(tmp_path):
+    server_dir, large = build_world(tmp_path)
+    region = Region(server_dir, RELPATH)
+    saved = regions.rewrite_region(region, region.present.copy(), compression=2)
+
+    rewritten = Region(server_dir, RELPATH)
+    assert list(np.flatnonzero(rewritten.present)) == [0, 33]
+    # Packed from the first sector after the header, in file order
+    assert (rewritten.offsets[0], rewritten.offsets[33]) == (2, 3)
+    assert list(rewritten.timestamps[[0, 33, 1023]]) == [1000, 2000, 0]
+    assert rewritten.wasted_bytes == 0
+    assert rewritten.size == HEADER_SIZE + rewritten.used_bytes
+    assert saved == region.size - rewritten.size
+    assert list(rewritten.compression[[0, 33]]) == [2, 2]
+    with open(rewritten.path, 'rb') as f:
+        f.seek(int(rewritten.offsets[33]) * SECTOR + 5)
+        assert zlib.decompress(f.read(int(rewritten.lengths[33]) - 1)) == large
+
+
+def test_prune_drops_unvisited_chunks(tmp_path):
+    server_dir, large = build_world(tmp_path)
+    region = regions.read_inhabited(Region(server_dir, RELPATH))
+    # Slot 0 is block (512, 0): inside a 600-block radius of spawn, outside a 100-block one
+    assert regions.prune_mask(region, 0, keep_radius=600)[0]
+    keep = regions.prune_mask(region, 0, keep_radius=100)
+    assert not keep[0] and keep[33]
+    regions.rewrite_region(region, keep)
+
+    pruned = Region(server_dir, RELPATH)
+    assert list(np.flatnonzero(pruned.present)) == [33]
+    assert (pruned.offsets[33], pruned.compression[33], pruned.timestamps[0]) == (2, 3, 0)
+    assert pruned.size == HEADER_SIZE + 2 * SECTOR
+
+    regions.rewrite_region(pruned, np.zeros(1024, dtype=bool))
+    assert not os.path.exists(pruned.path)
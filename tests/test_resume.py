@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from discord_bots.server import ManagedServer
+from mctools.compute import FakeBackend
+from mctools.coordinator import TransitionConflict
+from mctools.resume import ResumeHistory, format_summary
+
+HOUR = 3600
+
+
+def test_resumes_are_accounted_per_stop_mode():
+    history = ResumeHistory()
+    # Each stop is resumed an hour later, taking the given number of seconds
+    runs = [('stop', 60), ('hibernate', 20), ('deallocate', 120), ('stop', 80), ('deallocate', 100)]
+    now = 0
+    for mode, seconds in runs:
+        history.record_stop(mode, when=now)
+        now += HOUR + seconds
+        assert history.record_resume(seconds, when=now) == mode
+        assert history.last_stop is None
+    summary = history.summary({'stop': 0.01, 'hibernate': 0.02, 'deallocate': 0.0})
+    assert list(summary) == ['deallocate', 'hibernate', 'stop']
+    assert summary['stop']['resumes'] == 2
+    assert summary['stop']['p50_seconds'] == pytest.approx(70)
+    assert summary['hibernate']['p90_seconds'] == pytest.approx(20)
+    # Downtime is measured to the start call, not to ready
+    assert summary['deallocate']['mean_stopped_hours'] == pytest.approx(1)
+    assert summary['hibernate']['cost_per_stop'] == pytest.approx(0.02)
+    assert summary['deallocate']['cost_per_stop'] == 0
+    assert 'hibernate: 1 resumes, p50 20s, p90 20s' in format_summary(summary, current_mode='stop')
+
+
+def test_resume_without_a_recorded_stop():
+    history = ResumeHistory()
+    assert history.record_resume(30, when=1000) == 'unknown'
+    summary = history.summary()
+    assert summary['unknown']['mean_stopped_hours'] is None
+    assert summary['unknown']['cost_per_stop'] is None
+
+
+def test_history_is_saved_and_trimmed(tmp_path):
+    path = str(tmp_path / 'resume.json')
+    history = ResumeHistory(path, limit=3)
+    for i in range(5):
+        history.record_stop('stop', when=i * HOUR)
+        history.record_resume(i, when=i * HOUR + 10)
+    history.record_stop('hibernate', when=10 * HOUR)
+    reloaded = ResumeHistory(path)
+    assert [resume['seconds'] for resume in reloaded.resumes] == [2, 3, 4]
+    assert reloaded.last_stop == {'mode': 'hibernate', 'at': 10 * HOUR}
+
+
+@pytest.mark.parametrize('stop_mode, state', [('stop', 'stopped'), ('deallocate', 'deallocated'),
+                                              ('hibernate', 'hibernated')])
+def test_power_off_records_the_stop_mode(stop_mode, state):
+    async def main():
+        backend = FakeBackend('running')
+        server = ManagedServer('test', backend, '127.0.0.1', stop_mode=stop_mode)
+        await server.power_off()
+        await server.close()
+        assert backend.state == state
+        assert server.resume.last_stop['mode'] == stop_mode
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('provider, state, mode', [('fake', 'stopped', 'deallocate'), ('ec2', 'stopped', 'stop'),
+                                                   ('fake', 'hibernated', 'hibernate')])
+def test_reconcile_stop_made_outside_the_bot(provider, state, mode):
+    async def main():
+        backend = FakeBackend(state)
+        backend.provider = provider
+        server = ManagedServer('test', backend, '127.0.0.1', stop_mode='deallocate')
+        await server.reconcile_stop(state)
+        assert server.resume.last_stop['mode'] == mode
+        # Already accounted for; a second poll changes nothing
+        calls = list(backend.calls)
+        await server.reconcile_stop(state)
+        assert backend.calls == calls
+        await server.close()
+
+    asyncio.run(main())
+
+
+def test_no_start_during_a_reconciling_deallocation():
+    async def main():
+        backend = FakeBackend('stopped', stop_delay=0.1)
+        server = ManagedServer('test', backend, '127.0.0.1', stop_mode='deallocate')
+        reconcile = asyncio.ensure_future(server.reconcile_stop('stopped'))
+        await asyncio.sleep(0.01)
+        assert (server.coordinator.operation, backend.state) == ('stop', 'deallocating')
+        with pytest.raises(TransitionConflict):
+            await server.coordinator.run('start', server.start)
+        await reconcile
+        assert (server.coordinator.busy, backend.state) == (False, 'deallocated')
+        assert server.resume.last_stop['mode'] == 'deallocate'
+
+        # And a start already under way wins over a late reconcile
+        server.resume.last_stop = None
+        backend.state = 'stopped'
+        starting = asyncio.ensure_future(server.coordinator.run('start', lambda: asyncio.sleep(0.1)))
+        await asyncio.sleep(0.01)
+        with pytest.raises(TransitionConflict):
+            await server.reconcile_stop('stopped')
+        await starting
+        assert backend.calls.count('deallocate') == 1
+        await server.close()
+
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import os
+import asyncio
+
+from mctools.serverlog import (LogFollower, PlayerJoined, PlayerLeft, ServerStarted, LagWarning, ServerCrashed,
+                               parse_line)
+
+JOIN = '[12:00:01] [Server thread/INFO]: Steve joined the game\n'
+LEAVE = '[12:00:02] [Server thread/INFO]: Steve left the game\n'
+NOISE = '[12:00:03] [Server thread/INFO]: Saving chunks for level\n'
+
+
+def players(events):
+    return [(event.kind, event.player) for event in events]
+
+
+def test_parse_line():
+    assert parse_line(JOIN.strip()) == PlayerJoined('12:00:01', JOIN.strip(), 'Steve')
+    assert parse_line('[08:15:00] [Server thread/INFO]: Done (12.345s)! For help, type "help"').seconds == 12.345
+    lag = parse_line("[08:15:00] [Server thread/WARN]: Can't keep up! Is the server overloaded? "
+                     "Running 2500ms or 50 ticks behind")
+    assert (lag.ms, lag.ticks) == (2500, 50)
+    crash = parse_line('[08:15:00] [Server thread/ERROR]: This crash report has been saved to: ./crash-reports/a.txt')
+    assert isinstance(crash, ServerCrashed) and crash.report == './crash-reports/a.txt'
+    assert parse_line(NOISE.strip()) is None
+
+
+def test_backfill_stops_at_the_last_complete_line(tmp_path):
+    log = tmp_path / 'minecraft-server.log'
+    log.write_text(NOISE * 100 + JOIN + NOISE + LEAVE + '[12:00:04] [Server thread/INFO]: Alex joined')
+    follower = LogFollower(str(log))
+    assert players(follower.backfill()) == [('join', 'Steve'), ('leave', 'Steve')]
+    assert follower.offset == log.stat().st_size - len('[12:00:04] [Server thread/INFO]: Alex joined')
+    with open(log, 'a') as f:
+        f.write(' the game\n')
+    assert players(follower.backfill()) == [('join', 'Alex')]
+
+
+def test_resumes_from_the_saved_offset(tmp_path):
+    log = tmp_path / 'minecraft-server.log'
+    offsets = str(tmp_path / 'offset.json')
+    log.write_text(JOIN)
+    assert players(LogFollower(str(log), offset_path=offsets).backfill()) == [('join', 'Steve')]
+    with open(log, 'a') as f:
+        f.write(LEAVE)
+    # A new follower (e.g. after a restart) only sees what was appended since
+    assert players(LogFollower(str(log), offset_path=offsets).backfill()) == [('leave', 'Steve')]
+    assert list(LogFollower(str(log), offset_path=offsets).backfill()) == []
+
+
+def test_rotation_and_truncation_restart_from_the_top(tmp_path):
+    log = tmp_path / 'minecraft-server.log'
+    offsets = str(tmp_path / 'offset.json')
+    log.write_text(NOISE * 10 + JOIN)
+    assert players(LogFollower(str(log), offset_path=offsets).backfill()) == [('join', 'Steve')]
+
+    # Rotated: a new file (new inode) under the same name, even if it is longer
+    os.rename(log, tmp_path / 'minecraft-server.log.1')
+    log.write_text(LEAVE + NOISE * 20)
+    assert players(LogFollower(str(log), offset_path=offsets).backfill()) == [('leave', 'Steve')]
+
+    # Truncated in place: same inode, smaller than the saved offset
+    with open(log, 'w') as f:
+        f.write(JOIN)
+    assert players(LogFollower(str(log), offset_path=offsets).backfill()) == [('join', 'Steve')]
+
+
+def test_follow_picks_up_appends_and_rotation(tmp_path):
+    log = tmp_path / 'minecraft-server.log'
+    log.write_text(JOIN)
+
+    async def main():
+        follower = LogFollower(str(log), poll_interval=0.01, from_end=True)
+        events = []
+
+        async def collect():
+            async for event in follower.events(backfill=False):
+                events.append(event)
+
+        task = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.05)
+        with open(log, 'a') as f:
+            # Written in two parts; the event only comes once the line is complete
+            f.write(LEAVE[:10])
+            f.flush()
+            await asyncio.sleep(0.05)
+            assert events == []
+            f.write(LEAVE[10:])
+        await asyncio.sleep(0.05)
+        os.rename(log, tmp_path / 'minecraft-server.log.1')
+        log.write_text('[12:01:00] [Server thread/INFO]: Done (3.0s)! For help, type "help"\n')
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return events
+
+    events = asyncio.run(main())
+    assert [type(event) for event in events] == [PlayerLeft, ServerStarted]
+    # The line already in the log when following started is not replayed
+    assert not any(isinstance(event, (PlayerJoined, LagWarning)) for event in events)
@@ -0,0 +1,131 @@
+import json
+import asyncio
+
+from benchmarks import protocol
+from benchmarks.lifecycle import FakeMinecraft, ReplayBackend
+from discord_bots.server import ManagedServer
+from discord_bots.wake_proxy import WakeProxy
+
+PROTOCOL = 767
+
+
+async def proxied_server(state, boot_delay=0.05):
+    """A wake proxy on 127.0.0.1 for a FakeBackend VM in `state`, with a fake Minecraft server that follows it."""
+    backend = ReplayBackend(state, start_delay=0.05)
+    minecraft = backend.minecraft = FakeMinecraft(backend, boot_delay=boot_delay)
+    await minecraft.reserve_ports()
+    server = ManagedServer('test', backend, '127.0.0.1', port=minecraft.slp_port, rcon_port=minecraft.rcon_port,
+                           readiness_deadline=5)
+    proxy = WakeProxy(server, 0, host='127.0.0.1')
+    await proxy.start()
+    return proxy, minecraft
+
+
+async def connect(proxy, next_state):
+    """A client connection to the proxy, past the handshake."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', proxy.port)
+    connection = protocol.Connection(reader, writer)
+    connection.send(0x00, protocol.varint(PROTOCOL) + protocol.string('mc.example.com')
+                    + protocol.ushort(25565) + protocol.varint(next_state))
+    return connection
+
+
+async def ping(proxy):
+    """The status JSON and the echoed ping payload."""
+    connection = await connect(proxy, 1)
+    connection.send(0x00)
+    _, payload = await asyncio.wait_for(connection.read(), 5)
+    connection.send(0x01, protocol.long(42))
+    _, pong = await asyncio.wait_for(connection.read(), 5)
+    connection.close()
+    return json.loads(protocol.read_string(payload)[0]), pong
+
+
+async def login(proxy, player='Steve'):
+    """The message a login is disconnected with."""
+    connection = await connect(proxy, 2)
+    connection.send(0x00, protocol.string(player) + bytes(16))
+    packet_id, payload = await asyncio.wait_for(connection.read(), 5)
+    connection.close()
+    assert packet_id == 0x00
+    return json.loads(protocol.read_string(payload)[0])['text']
+
+
+async def until(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('timed out')
+
+
+async def shut_down(proxy, minecraft):
+    await proxy.close()
+    minecraft.shut_down()
+    await proxy.server.close()
+
+
+def test_status_ping_while_the_vm_sleeps():
+    async def main():
+        proxy, minecraft = await proxied_server('deallocated')
+        status, pong = await ping(proxy)
+        assert status['description']['text'] == 'Sleeping - join to wake it up'
+        assert status['version']['protocol'] == PROTOCOL
+        assert pong == protocol.long(42)
+        # A ping does not wake the server, and is answered from the cached snapshot
+        await ping(proxy)
+        assert proxy.server.backend.calls == ['power_state']
+        await shut_down(proxy, minecraft)
+
+    asyncio.run(main())
+
+
+def test_login_wakes_the_server_and_is_relayed_once_it_is_up():
+    async def main():
+        proxy, minecraft = await proxied_server('deallocated')
+        assert (await login(proxy)).startswith('The server is starting up')
+        # A second login joins the start in flight
+        assert (await login(proxy, 'Alex')).startswith('The server is starting up')
+        status, _ = await ping(proxy)
+        assert status['description']['text'].startswith('Starting up - ready in about')
+        await until(lambda: proxy._waking is None)
+        assert proxy.server.backend.calls.count('start') == 1
+        assert minecraft.up
+
+        # Now relayed to the server itself
+        status, pong = await ping(proxy)
+        assert status['description']['text'] == 'Benchmark server'
+        assert pong == protocol.long(42)
+        await shut_down(proxy, minecraft)
+
+    asyncio.run(main())
+
+
+def test_login_wakes_a_server_whose_snapshot_is_stale():
+    async def main():
+        proxy, minecraft = await proxied_server('running', boot_delay=0)
+        minecraft.power_changed('running')
+        await until(lambda: minecraft.up)
+        assert (await ping(proxy))[0]['description']['text'] == 'Benchmark server'
+        # The VM goes down behind the status cache, e.g. through the idle daemon
+        minecraft.shut_down()
+        proxy.server.backend.state = 'stopped'
+        assert (await login(proxy)).startswith('The server is starting up')
+        await until(lambda: proxy._waking is None)
+        assert proxy.server.backend.calls.count('start') == 1
+        assert minecraft.up
+        await shut_down(proxy, minecraft)
+
+    asyncio.run(main())
+
+
+def test_login_wakes_a_vm_that_runs_without_its_server():
+    async def main():
+        # Minecraft crashed, or never came up, on a VM that still runs
+        proxy, minecraft = await proxied_server('running', boot_delay=0)
+        assert (await login(proxy)).startswith('The server is starting up')
+        await until(lambda: proxy._waking is None)
+        assert proxy.server.backend.calls.count('start') == 1
+        await shut_down(proxy, minecraft)
+
+    asyncio.run(main())